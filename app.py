@@ -5,6 +5,13 @@ from dotenv import load_dotenv
 from koi.controller import Platform
 from koi.models import KoiState
 from koi.utils import save_strategy_config
+from koi.market_data.helpers.feed_health import FEEDS
+from koi.market_data.helpers.handoff import handoff_stats
+from koi.market_data.latency import LATENCY
+from koi.scheduler import SCHEDULER
+from koi.journal import JOURNAL
+from koi.step_metrics import STEP_METRICS
+from koi.workers import WORKERS
 
 
 platform: Platform
@@ -24,6 +31,62 @@ def fetch_crypto_tick_data() -> Dict[str, dict]:
         print('fetch_crypto_tick_data error: ', e)
         return {}
 
+@eel.expose
+def fetch_feed_health() -> Dict[str, dict]:
+    """Per-feed message, gap, resync & reconnect counters"""
+    try: return { name: health.to_dict() for name, health in FEEDS.items() }
+    except Exception as e:
+        print('fetch_feed_health error:', e)
+        return {}
+
+@eel.expose
+def fetch_handoff_stats() -> Dict[str, dict]:
+    """Snapshot versions/copies and queue depth, high water & drop counts for every feed -> consumer handoff"""
+    try: return handoff_stats()
+    except Exception as e:
+        print('fetch_handoff_stats error:', e)
+        return {}
+
+@eel.expose
+def fetch_feed_latency() -> Dict[str, dict]:
+    """Rolling venue -> arrival latency (p50/p99/max seconds) per feed & symbol"""
+    try: return LATENCY.to_dict()
+    except Exception as e:
+        print('fetch_feed_latency error:', e)
+        return {}
+
+@eel.expose
+def fetch_scheduler_stats() -> Dict[str, dict]:
+    """Per-trader step schedule: fires, missed bars & start lateness vs. bar close + settle delay"""
+    try: return SCHEDULER.to_dict()
+    except Exception as e:
+        print('fetch_scheduler_stats error:', e)
+        return {}
+
+@eel.expose
+def fetch_step_stats() -> Dict[str, dict]:
+    """Per-trader step counters: overlapping fires, skipped bars, budget overruns & degraded predictions"""
+    try: return { t.strategy.name: t.step_stats() for t in platform.traders }
+    except Exception as e:
+        print('fetch_step_stats error:', e)
+        return {}
+
+@eel.expose
+def fetch_step_latency() -> Dict[str, dict]:
+    """Rolling step latency (p50/p99/max seconds) per strategy, stage & symbol"""
+    try: return STEP_METRICS.to_dict()
+    except Exception as e:
+        print('fetch_step_latency error:', e)
+        return {}
+
+@eel.expose
+def fetch_worker_stats() -> Dict[str, dict]:
+    """Strategy worker processes (process mode): pid, uptime, restarts & request errors"""
+    try: return WORKERS.to_dict()
+    except Exception as e:
+        print('fetch_worker_stats error:', e)
+        return {}
+
 @eel.expose
 def toggle_market_streaming():
     """Kicks off/pauses tick by tick streaming of available market contracts"""
@@ -157,6 +220,29 @@ def fetch_backtest_performances():
         return {}
 
 
+@eel.expose
+def fetch_transactions(strategy_name: str, symbol: str = None, start: str = None, end: str = None, backtest: bool = False, limit: int = None):
+    """Journaled transactions for a strategy, optionally for one symbol and/or a date range ('%Y-%m-%d %H:%M:%S')"""
+    try: return JOURNAL.transactions(strategy_name, symbol, start, end, backtest, limit)
+    except Exception as e:
+        print('fetch_transactions error:', e)
+        return []
+
+
+@eel.expose
+def fetch_transaction_stats(strategy_name: str, start: str = None, end: str = None, backtest: bool = False):
+    """Realized P&L, win/loss & hold length aggregates for a strategy: overall, per symbol & per day"""
+    try:
+        return {
+            'summary': JOURNAL.summary(strategy_name, start, end, backtest),
+            'symbols': JOURNAL.symbol_stats(strategy_name, start, end, backtest),
+            'daily': JOURNAL.daily_pl(strategy_name, start, end, backtest),
+        }
+    except Exception as e:
+        print('fetch_transaction_stats error:', e)
+        return {}
+
+
 @eel.expose
 def fetch_analyses():
     """Retrieves all analyzers (individual, backtest & trader) from this session"""
@@ -219,11 +305,11 @@ def set_strategy_active_state(name: str):
 def set_strategy_capital(name: str, capital: float):
     """Updates capital allocation to a strategy with a given name"""
     matching = [t for t in platform.traders if t.strategy.name == name]
-    if len(matching == 0): return
+    if len(matching) == 0: return
     
     trader = matching[0]
     trader.strategy.available_capital = capital
-    save_strategy_config(trader.strategy)
+    save_strategy_config(trader.strategy, ['available_capital'])
 
 
 
@@ -253,4 +339,5 @@ if __name__ == '__main__':
     import sys
     load_dotenv()
     platform = Platform()
-    start_eel(develop=len(sys.argv) == 2)
+    try: start_eel(develop=len(sys.argv) == 2)
+    finally: platform.shutdown()
@@ -5,7 +5,6 @@ from uuid import uuid4
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Tuple
-from multiprocessing.pool import ThreadPool
 
 from koi.market_data import IB_Client, CB_Client, Market, apply_strategies, ApplyConfig
 from koi.market_data.root import apply_labels
@@ -13,6 +12,8 @@ from koi.models import BacktestConfig, CryptoContract, Direction, Move, Transact
 from koi.trader import Trader
 from koi.portfolio import Portfolio
 from koi.utils import to_bar_size
+from koi.runtime import RUNTIME
+from koi.journal import JOURNAL
 
 
 class Backtester:
@@ -74,13 +75,9 @@ class Backtester:
         asyncio.set_event_loop(loop)
         bar_size = to_bar_size(self.trader.strategy.trade_config.trade_frequency, self.trader.strategy.crypto)
 
-        pool = ThreadPool(processes=1)
         lookbacks = self.trader.strategy.cnn_manager.lookbacks([c.symbol for c in self.trader.strategy.contracts])
-        if self.trader.strategy.cnn_config is not None:
-            async_result = pool.apply_async(self.md.get_historical_data, (self.trader.strategy.contracts, bar_size, test_size, '', True, ApplyConfig(True, True, lookbacks)))
-        else:
-            async_result = pool.apply_async(self.md.get_historical_data, (self.trader.strategy.contracts, bar_size, test_size, '', True, ApplyConfig(True, False, lookbacks)))
-        bt_data = async_result.get()
+        apply_config = ApplyConfig(True, self.trader.strategy.cnn_config is not None, lookbacks)
+        bt_data = RUNTIME.blocking(self.md.get_historical_data, self.trader.strategy.contracts, bar_size, test_size, '', True, apply_config)
 
         # Set up portfolios for tracking
         for sym, df in bt_data:
@@ -111,8 +108,7 @@ class Backtester:
         if len(self.trader.strategy.contracts) == 0: raise 'No Contracts available to test'
 
         # Clean out old reports if exist
-        if os.path.exists(f'config/transactions/{self.trader.strategy.name}_transactions_bt.csv'):
-            os.remove(f'config/transactions/{self.trader.strategy.name}_transactions_bt.csv')
+        JOURNAL.clear(self.trader.strategy.name, backtest=True)
         if os.path.exists(f'config/bt_bars/{self.trader.strategy.name}'):
             shutil.rmtree(f'config/bt_bars/{self.trader.strategy.name}')
 
@@ -1,142 +1,17 @@
-import asyncio
-import math
-from typing import Optional, Tuple
+import math, time
+from typing import Iterator, List, Optional, Tuple
 import eel
-from ib_insync import IB
-from ib_insync.order import LimitOrder, Order, MarketOrder
-from ibapi.contract import Contract
+from ib_insync.order import LimitOrder, MarketOrder, Trade
 from pandas.core.series import Series
 
-from koi.models import BuyQuantity, CB_Order, CryptoContract, Decision, Transaction, TransactionType
+from koi.models import BuyQuantity, CB_Order, CryptoContract, Decision, OrderTicket, Transaction, TransactionType
 from koi.market_data import IB_Client, CB_Client
 from koi.market_data.root import CryptoOrder
+from koi.market_data.helpers.market_models import CryptoOrderStatus
+from koi.market_data.quotes import QUOTES
 
 
 
-known_conIds = {
-    "AAPL": 265598,
-    "PLTR": 444857009,
-    "SPY": 756733,
-    "GME": 36285627,
-    "SPCE": 388824891,
-    "AMC": 1140070600,
-    "BBBY": 266630,
-    "TSLA": 76792991,
-    "GE": 7516,
-    "GM": 80986742,
-    "GOOG": 208813720,
-    "FB": 107113386,
-    'AMZN': 3691937,
-    'F': 9599491,
-    'SPOT': 312496724,
-    'EA': 268995,
-    'BA': 4762,
-    'UAL': 79498203,
-    'LYFT': 359130923,
-    'BABA': 166090175,
-    'SQ': 212671971,
-    'ABNB': 459530964,
-    'XOM': 13977,
-
-    'SRNE': 132304979,
-    'PLUG': 88385302,
-    'MARA': 360205428,
-    'GEVO': 320228879,
-    'TRXC': 393993722,
-    'WKHS': 215119556,
-    'BLNK': 287428879,
-    'PHUN': 347896223,
-    'XPEV': 441828902,
-    'VIAC': 393897513,
-    'CMCSA': 267748,
-    'BAC': 10098,
-
-    'QCOM': 273544,
-    'DD': 365921621,
-    'LLY': 9160,
-    'PFE': 11031,
-    'XSPA': 426480588,
-    'TIGR': 356857464,
-    'MVIS': 102558681,
-    'KO': 8894,
-    'RIOT': 292830677,
-    'ACB': 420446448,
-    'TLRY': 326196509,
-    'SNDL': 376499916,
-    'GILD': 269753,
-
-    'DIS': 6459,
-    'MU': 9939,
-    'NOK': 661513,
-    'PTON': 385087203,
-    'TWTR': 137780444,
-    'SBUX': 274105,
-    'UBER': 365207014,
-
-    'COF': 5941,
-    'T': 37018770,
-    'CCL': 5516,
-    'DKNG': 419221909,
-    'NIO': 332794741,
-    'SNAP': 268060148,
-    'NVDA': 4815747,
-    'NCLH': 120643512,
-    'PINS': 360975915,
-    'SBUX': 274105,
-    'PYPL': 199169591,
-    'MGM': 9560,
-    'WFC': 10375,
-    'AMD': 4391,
-    'TSM': 6223250,
-    'AMAT': 266093,
-    'ADBE': 265768,
-    'TLRY': 326196509,
-    'JD': 152486141,
-    'V': 49462172,
-    'VALE': 60581038,
-}
-
-def wait_for_ib_order_fill(ib: IB, order: Order, contract: Contract) -> Tuple[float, int, bool]:
-    fut = asyncio.Future()
-    try:
-        contract.conId = known_conIds[contract.symbol]
-        trade = ib.placeOrder(contract, order)
-        while not trade.isDone():
-            print('waiting on trade to be filled:', trade.filled())
-            ib.waitOnUpdate(1)
-            # ib.sleep(.1)
-
-        print(f'@ {trade.orderStatus.avgFillPrice} - {trade.orderStatus.filled} Shares')
-        fut.set_result((trade.orderStatus.avgFillPrice, trade.orderStatus.filled, True))
-    except Exception as e:
-        print('wait_for_ib_order_fill error:', e)
-        fut.set_result((0, 0, False))
-    return fut
-    
-
-
-def wait_for_cb_order_fill(cb: CB_Client, contract: CryptoContract, side: str, quantity: float, price: Optional[float] = None) -> Tuple[float, int, bool]:    
-    fut = asyncio.Future()
-
-    try:
-        # new version
-        status = cb.add_order(CryptoOrder(contract.symbol, side, quantity, price))
-        print('initial order status:', status.__dict__)
-        while not status.settled and not status.failed:
-            status = cb.update_order_status(status)
-            eel.sleep(.25)
-
-        if status.failed: raise Exception('Order Fill Failure: ', status.__dict__)
-        print(f'Order filled @ ${status.price} (ex. value: {status.executed_value} fees: ${status.fees}) - {status.fill_quantity} {contract.symbol}')
-        fut.set_result((status.price, status.fill_quantity, True))
-
-    except Exception as e:
-        print('wait_for_cb_order_fill error:', e)
-        fut.set_result((0, 0, False))
-
-    return fut
-
-
 class Broker:
     ib_client: IB_Client
     cb_client: CB_Client
@@ -164,40 +39,47 @@ class Broker:
                 else: return state['close']
             else: return state['close']
         else:
-            if crypto:
-                try: ask, bid = self.cb_client.latest_symbol_price(symbol)
-                except Exception as e:
-                    print(e)
-                    raise Exception(f'Latest crypto buy-side tick data for {symbol} not available: ', e)
-
-                print(f'latest_price:spread: {ask-bid:.5f} ({(ask-bid)/ask*100:.3f})')
-                if side == 'buy': return ask
-                else: return bid
-            else:
-                if side == 'buy':
-                    if symbol in self.ib_client.latest:
-                        try: return float(self.ib_client.latest[symbol].ask)
-                        except: return self.ib_client.latest[symbol].ask
-                    else:
-                        print(f'{symbol} buy-side not in {self.ib_client.latest}')
-                        raise 'Latest market buy-side tick data for {} not available'.format(symbol)
-                else:
-                    if symbol in self.ib_client.latest:
-                        try: return float(self.ib_client.latest[symbol].bid)
-                        except: return self.ib_client.latest[symbol].bid
-                    else:
-                        print(f'{symbol} sell-side not in {self.ib_client.latest}')
-                        raise 'Latest market sell-side tick data for {} not available'.format(symbol)
+            source = self.cb_client.exchange if crypto else 'ib'
+            try: quote = QUOTES.latest(symbol, source)
+            except Exception as e:
+                print(e)
+                raise Exception(f'Latest {"crypto" if crypto else "market"} tick data for {symbol} not available: ', e)
 
+            if crypto: print(f'latest_price:spread: {quote.ask-quote.bid:.5f} ({(quote.ask-quote.bid)/quote.ask*100:.3f})')
+            if side == 'buy': return quote.ask
+            else: return quote.bid
 
-    def attempt_market_buy(self, decision: Decision, available_capital: float, state: Series, is_backtest: bool = False, crypto: bool = False) -> Transaction:
+
+    def depth_adjusted_order(self, symbol: str, side: str, quantity: float, price: float) -> Tuple[float, float]:
         """
-        Sends buy order to broker for given symbol, returns success state
+        Given a top-of-book sized order, returns the (quantity, limit price) that the live L2 book can fill.
+        Buys keep the same notional and sweep the asks, sells keep the same quantity and sweep the bids.
+        Falls back to the given quantity & price if no book is being maintained for the symbol.
+        """
+        book = self.cb_client.order_book(symbol) if self.cb_client is not None else None
+        if book is None: return (quantity, price)
+
+        if side == 'buy':
+            filled, average, limit = book.quantity_for_notional('buy', quantity * price)
+            if filled <= 0: return (quantity, price)
+            print(f'depth_adjusted_order: {symbol} buy {filled:.8f} @ avg {average:.5f}, limit {limit:.5f}')
+            return (filled, limit)
+        else:
+            average, limit = book.depth_weighted_price('sell', quantity)
+            if limit <= 0: return (quantity, price)
+            print(f'depth_adjusted_order: {symbol} sell {quantity:.8f} @ avg {average:.5f}, limit {limit:.5f}')
+            return (quantity, limit)
+
+
+    # Order sizing (sequential, callers sizing several buys reserve each one's capital before sizing the next)
+    def prepare_buy(self, decision: Decision, available_capital: float, state: Series, is_backtest: bool = False, crypto: bool = False) -> OrderTicket:
+        """
+        Sizes a buy for the given symbol against available capital & the latest ask
         """
         try: latest_price = self.latest_price(decision.symbol, state, is_backtest, crypto)
         except:
             print('Error retrieving latest price')
-            return Transaction(False, TransactionType.MarketBuy, 0, 0, decision, state['date'])
+            return OrderTicket(decision, TransactionType.MarketBuy, 0, 0, state, is_backtest, crypto)
 
         # Determine how many shares we can/should purchase given a decision
         share_quantity = 0
@@ -215,95 +97,153 @@ class Broker:
 
         if not self.allow_fractional and not crypto:
             try: share_quantity = math.floor(share_quantity)
-            except: print('Error getting share quantity:', share_quantity, decision.quantity, available_capital, self.latest_price(decision.symbol, state, is_backtest, crypto))
+            except: print('Error getting share quantity:', share_quantity, decision.quantity, available_capital, latest_price)
+
+        # Size against visible depth rather than the top of book when an L2 book is available
+        if crypto and not is_backtest and share_quantity > 0:
+            (share_quantity, latest_price) = self.depth_adjusted_order(decision.symbol, 'buy', share_quantity, latest_price)
 
-        strike_price: float
-        succeeded = True
-        
         if share_quantity == 0 or (not self.allow_fractional and not crypto and share_quantity < 0):
             print('share_quantity=0 error - returning')
-            strike_price = 0
             share_quantity = 0
-            succeeded = False
-        elif is_backtest:
-            c_type = 'crypto' if crypto else 'stock'
-            # spread = .01 if c_type == 'stock' else 0
-            spread = 0
-            buy_fee = state['close'] * self.get_fee_pct(c_type)[0] + self.get_fixed_fee(c_type, state["close"], share_quantity)
-            self.total_fees += buy_fee
-            self.trade_volume_shares += share_quantity
-            print(f'unadjusted price: {state["close"]} | fee: {buy_fee} | trade volume: {self.trade_volume} | total fees: {self.total_fees}')
-            strike_price = state['close'] + buy_fee + spread
-        else:
-            try:
-                if crypto:
-                    try:
-                        print('attempting crypto market buy @ ', latest_price)
-                        res = asyncio.get_event_loop().run_until_complete(wait_for_cb_order_fill(self.cb_client, decision.contract, 'buy', share_quantity, latest_price))
-                        (strike_price, share_quantity, succeeded) = res
-                    except Exception as e:
-                        print('asnycio wait_for_cb_order_fill error:', e)
-                        strike_price = 0
-                        succeeded = False
-                else:
-                    print(f'attempting {decision.symbol} ib market buy @ {latest_price}')
-                    # buy_order = MarketOrder('BUY', share_quantity)
-                    buy_order = LimitOrder('BUY', share_quantity, latest_price)
-                    res = asyncio.get_event_loop().run_until_complete(wait_for_ib_order_fill(self.ib_client.ib, buy_order, decision.contract))
-                    
-                    print('market buy res:', res)
-                    (strike_price, share_quantity, succeeded) = res
-
-            except Exception as e: # Failed to purchase at limit price
-                print('market buy error:', e)
-                succeeded = False
-                strike_price = 0
-                share_quantity = 0
 
-        self.trade_volume += (strike_price * share_quantity)
-        return Transaction(succeeded, TransactionType.MarketBuy, strike_price, share_quantity, decision, state['date'])
+        return OrderTicket(decision, TransactionType.MarketBuy, share_quantity, latest_price, state, is_backtest, crypto)
 
 
-    def attempt_market_sell(self, decision: Decision, state: Series, is_backtest: bool = False, crypto: bool = False) -> Transaction:
+    def prepare_sell(self, decision: Decision, state: Series, is_backtest: bool = False, crypto: bool = False) -> OrderTicket:
         """
-        Sends sell order to broker for given symbol, returns success state.
+        Prices a sell of the given symbol at the latest bid
         """
         # Currently, selling will only support closing out our entire position
         # TODO: support partial sells in the future
         share_quantity = decision.quantity
         try: latest_price = self.latest_price(decision.symbol, state, is_backtest, crypto, 'sell')
-        except: return Transaction(False, TransactionType.MarketSell, 0, 0, decision, state['date'])
+        except: return OrderTicket(decision, TransactionType.MarketSell, 0, 0, state, is_backtest, crypto)
 
-        strike_price: float
-        succeeded = True
-        if is_backtest:
-            c_type = 'crypto' if crypto else 'stock'
+        if crypto and not is_backtest:
+            (_, latest_price) = self.depth_adjusted_order(decision.symbol, 'sell', share_quantity, latest_price)
+
+        return OrderTicket(decision, TransactionType.MarketSell, share_quantity, latest_price, state, is_backtest, crypto)
+
+
+
+    # Order submission
+    def fill_all(self, tickets: List[OrderTicket]) -> Iterator[Transaction]:
+        """
+        Submits every ticket at once, yielding each one's transaction as its order completes (fills or fails),
+        so independent orders wait on a single fill cycle rather than one each. Backtest fills are simulated.
+        """
+        ib_trades = [(t, self.place_ib_order(t)) for t in tickets if t.sized and not t.is_backtest and not t.crypto]
+        cb_orders = [(t, self.place_cb_order(t)) for t in tickets if t.sized and not t.is_backtest and t.crypto]
+
+        for ticket in tickets:
+            if not ticket.sized: yield self.to_transaction(ticket, False, 0, 0)
+            elif ticket.is_backtest: yield self.simulate_fill(ticket)
+
+        # Poll every open order together until the last one completes
+        while len(ib_trades) > 0 or len(cb_orders) > 0:
+            done = [(t, trade) for (t, trade) in ib_trades if trade is None or trade.isDone()]
+            ib_trades = [(t, trade) for (t, trade) in ib_trades if trade is not None and not trade.isDone()]
+            for ticket, trade in done: yield self.ib_transaction(ticket, trade)
+
+            open_orders = []
+            for ticket, status in cb_orders:
+                try:
+                    if status is not None and not status.settled and not status.failed: status = self.cb_client.update_order_status(status)
+                except Exception as e:
+                    print(f'{ticket.symbol} order status error:', e)
+                    status = None
+                if status is None or status.settled or status.failed: yield self.cb_transaction(ticket, status)
+                else: open_orders.append((ticket, status))
+            cb_orders = open_orders
+
+            if len(ib_trades) > 0:
+                print('waiting on trades to be filled:', [f'{t.symbol}: {trade.filled()}' for t, trade in ib_trades])
+                time.sleep(.25) # trades are updated by the IB loop thread
+            elif len(cb_orders) > 0: eel.sleep(.25)
+
+
+    def attempt_market_buy(self, decision: Decision, available_capital: float, state: Series, is_backtest: bool = False, crypto: bool = False) -> Transaction:
+        """
+        Sends buy order to broker for given symbol, returns success state
+        """
+        return next(self.fill_all([self.prepare_buy(decision, available_capital, state, is_backtest, crypto)]))
+
+    def attempt_market_sell(self, decision: Decision, state: Series, is_backtest: bool = False, crypto: bool = False) -> Transaction:
+        """
+        Sends sell order to broker for given symbol, returns success state.
+        """
+        return next(self.fill_all([self.prepare_sell(decision, state, is_backtest, crypto)]))
+
+
+    def place_ib_order(self, ticket: OrderTicket) -> Optional[Trade]:
+        try:
+            # Contracts are qualified when strategies load, fall back to the conId cache for any added since
+            contract = ticket.decision.contract
+            if not contract.conId and not IB_Client.contract_cache.apply(contract): raise Exception(f'No conId known for {contract.symbol}, qualify it before trading')
+
+            side = 'BUY' if ticket.transaction_type == TransactionType.MarketBuy else 'SELL'
+            print(f'attempting {ticket.symbol} ib market {side.lower()} @ {ticket.price}')
+            # order = MarketOrder(side, ticket.quantity)
+            return self.ib_client.call(self.ib_client.ib.placeOrder, contract, LimitOrder(side, ticket.quantity, ticket.price))
+        except Exception as e:
+            print('place_ib_order error:', e)
+            return None
+
+    def place_cb_order(self, ticket: OrderTicket) -> Optional[CryptoOrderStatus]:
+        try:
+            side = 'buy' if ticket.transaction_type == TransactionType.MarketBuy else 'sell'
+            print(f'attempting crypto market {side} @ ', ticket.price)
+            status = self.cb_client.add_order(CryptoOrder(ticket.symbol, side, ticket.quantity, ticket.price))
+            print('initial order status:', status.__dict__)
+            return status
+        except Exception as e:
+            print('place_cb_order error:', e)
+            return None
+
+    def ib_transaction(self, ticket: OrderTicket, trade: Optional[Trade]) -> Transaction:
+        if trade is None: return self.to_transaction(ticket, False, 0, 0)
+        print(f'{ticket.symbol} @ {trade.orderStatus.avgFillPrice} - {trade.orderStatus.filled} Shares')
+        return self.to_transaction(ticket, trade.orderStatus.filled > 0, trade.orderStatus.avgFillPrice, trade.orderStatus.filled)
+
+    def cb_transaction(self, ticket: OrderTicket, status: Optional[CryptoOrderStatus]) -> Transaction:
+        if status is None or status.failed:
+            if status is not None: print('Order Fill Failure: ', status.__dict__)
+            return self.to_transaction(ticket, False, 0, 0)
+        print(f'Order filled @ ${status.price} (ex. value: {status.executed_value} fees: ${status.fees}) - {status.fill_quantity} {ticket.symbol}')
+        return self.to_transaction(ticket, True, status.price, status.fill_quantity)
+
+    def expected_cost(self, ticket: OrderTicket) -> float:
+        """Capital a buy is expected to use, fees included the way simulated fills charge them"""
+        if not ticket.sized: return 0
+        c_type = 'crypto' if ticket.crypto else 'stock'
+        buy_fee = ticket.price * self.get_fee_pct(c_type)[0] + self.get_fixed_fee(c_type, ticket.price, ticket.quantity)
+        return ticket.quantity * (ticket.price + buy_fee)
+
+    def simulate_fill(self, ticket: OrderTicket) -> Transaction:
+        """Backtest fill at the bar's close, adjusted for fees"""
+        state, share_quantity = ticket.state, ticket.quantity
+        c_type = 'crypto' if ticket.crypto else 'stock'
+        if ticket.transaction_type == TransactionType.MarketBuy:
+            # spread = .01 if c_type == 'stock' else 0
+            spread = 0
+            buy_fee = state['close'] * self.get_fee_pct(c_type)[0] + self.get_fixed_fee(c_type, state["close"], share_quantity)
+            self.total_fees += buy_fee
+            self.trade_volume_shares += share_quantity
+            print(f'unadjusted price: {state["close"]} | fee: {buy_fee} | trade volume: {self.trade_volume} | total fees: {self.total_fees}')
+            strike_price = state['close'] + buy_fee + spread
+        else:
             spread = .01 if c_type == 'stock' else 0
             sell_fee = state['close'] * self.get_fee_pct(c_type)[1] + self.get_fixed_fee(c_type, state['close'], share_quantity)
             self.total_fees += sell_fee
             self.trade_volume_shares += share_quantity
             print(f'sell fee: {sell_fee} | trade volume: {self.trade_volume} | total fees: {self.total_fees}')
             strike_price = state['close'] - sell_fee - spread
-        else:
-            # TODO: Communicate with market here
-            try:
-                if crypto:
-                    print('attempting crypto market sell @ ', latest_price)
-                    (strike_price, share_quantity, succeeded) = asyncio.get_event_loop().run_until_complete(wait_for_cb_order_fill(self.cb_client, decision.contract, 'sell', share_quantity, latest_price))
-                else:
-                    print('attempting ib market sell @ ', latest_price)
-                    # sell_order = MarketOrder('SELL', share_quantity)
-                    sell_order = LimitOrder('SELL', share_quantity, latest_price)
-                    (strike_price, share_quantity, succeeded) = asyncio.get_event_loop().run_until_complete(wait_for_ib_order_fill(self.ib_client.ib, sell_order, decision.contract))
-
-
-            except Exception as e: # Failed to sell at limit price
-                succeeded = False
-                strike_price = 0
-                share_quantity = 0
-    
+        return self.to_transaction(ticket, True, strike_price, share_quantity)
+
+    def to_transaction(self, ticket: OrderTicket, succeeded: bool, strike_price: float, share_quantity: float) -> Transaction:
         self.trade_volume += (strike_price * share_quantity)
-        return Transaction(succeeded, TransactionType.MarketSell, strike_price, share_quantity, decision, state['date'])
+        return Transaction(succeeded, ticket.transaction_type, strike_price, share_quantity, ticket.decision, ticket.state['date'])
 
 
 
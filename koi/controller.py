@@ -11,8 +11,14 @@ from koi.models import BacktestConfig, KoiState, StrategyInfo
 from koi.strategies import get_defined_strategies
 from koi.broker import Broker
 from koi.portfolio import Portfolio
-from koi.market_data import IB_Client, CB_Client
+from koi.market_data import IB_Client, CB_Client, LATENCY
 from koi.notifier import NotificationService
+from koi.runtime import RUNTIME
+from koi.persistence import PERSISTENCE
+from koi.journal import JOURNAL
+from koi.state_store import STATE
+from koi.step_metrics import STEP_METRICS
+from koi.workers import WORKERS
 
 pd.options.mode.chained_assignment = None  # default='warn'
 env = dotenv.dotenv_values('.env')
@@ -42,6 +48,8 @@ class Platform:
             self.cb_client = CB_Client(self.state, exchange=env['CRYPTO_EXCHANGE'])
             self.broker = Broker(self.ib_client, self.cb_client)
             self.notifier = NotificationService()
+            LATENCY.start_writer('config/metrics/feed_latency.json')
+            STEP_METRICS.start_writer('config/metrics/step_latency.prom')
 
             # We create (and track) one trader for each strategy with its last state
             strategies = { s.name: s for s in AvailableStrategies }
@@ -53,13 +61,30 @@ class Platform:
             for s_name, s_class in strategies.items():
                 use_crypto = strategy_info[s_name].crypto
                 self.traders.append(Trader(s_class(strategy_info[s_name]), self.cb_client if use_crypto else self.ib_client, self.broker, self.notifier))
+                JOURNAL.import_csv(s_name, f'config/transactions/{s_name}_transactions.csv') # legacy csv history, once
+
+            # Resolve conIds for every stock contract up front (batched, cached in config/contracts.json)
+            stock_contracts = [c for t in self.traders if not t.strategy.crypto for c in t.strategy.contracts]
+            if len(stock_contracts) > 0 and self.ib_client.ib.isConnected(): self.ib_client.qualify_contracts(stock_contracts)
 
 
         except KeyboardInterrupt:
-            if self.ib_client.ib.isConnected(): self.ib_client.ib.disconnect()
+            self.shutdown()
             sys.exit(0)
 
 
+    def shutdown(self):
+        """Stops every trader, lets in-flight steps unwind & drains the shared runtime before disconnecting"""
+        for t in self.traders:
+            if t.active: t.stop()
+        WORKERS.shutdown()
+        RUNTIME.shutdown()
+        PERSISTENCE.close()
+        JOURNAL.close()
+        STATE.close()
+        self.ib_client.shutdown()
+
+
 
     def toggle_strategy(self, strategy_name: str):
         """Starts or stops a given strategy's trading activity"""
@@ -72,7 +97,7 @@ class Platform:
                     except Exception as e:
                         print('Trader Strategy ERROR', e)
                 else:
-                    t.active = False
+                    t.stop()
                 break
         
 
@@ -0,0 +1,187 @@
+import csv, math, os, sqlite3, threading
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+
+from koi.models import TransactionReport, TransactionType
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    strategy TEXT NOT NULL,
+    backtest INTEGER NOT NULL DEFAULT 0,
+    date TEXT NOT NULL,
+    unix REAL NOT NULL,
+    symbol TEXT NOT NULL,
+    type TEXT NOT NULL,
+    price REAL,
+    quantity REAL,
+    confidence REAL,
+    hold_length REAL,
+    trade_pl REAL,
+    portfolio_pl REAL,
+    total_pl REAL,
+    reason TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_strategy_date ON transactions (strategy, backtest, unix);
+CREATE INDEX IF NOT EXISTS transactions_strategy_symbol_date ON transactions (strategy, backtest, symbol, unix);
+CREATE INDEX IF NOT EXISTS transactions_date ON transactions (unix);
+"""
+
+
+def _to_unix(date: Union[datetime, str]) -> float:
+    if isinstance(date, datetime): return date.timestamp()
+    return datetime.strptime(str(date)[:19], DATE_FORMAT).timestamp()
+
+def _to_date_string(date: Union[datetime, str]) -> str:
+    return date.strftime(DATE_FORMAT) if isinstance(date, datetime) else str(date)[:19]
+
+def _value(v) -> Optional[float]:
+    """nan (e.g. a buy's trade p/l) is stored as NULL"""
+    if v is None or v == '': return None
+    v = float(v)
+    return None if math.isnan(v) else v
+
+
+class TransactionJournal(object):
+    """
+    Append-only transaction journal in SQLite (WAL mode).
+    Each trade is one small insert committed on its own, so recording is O(1) regardless of history and survives
+    crashes, while indexes on strategy, symbol & date serve range and aggregate queries (P&L, hold lengths,
+    per-symbol stats) without reading everything back.
+    """
+    path: str
+
+    def __init__(self, path: str = 'config/transactions.db'):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL') # durable at WAL checkpoints, commits don't wait on fsync
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _query(self, sql: str, params: tuple = ()) -> List[dict]:
+        with self._lock: return [dict(r) for r in self._connection().execute(sql, params).fetchall()]
+
+    def _where(self, strategy: str, backtest: bool, symbol: str = None, start: Union[datetime, str] = None, end: Union[datetime, str] = None, alias: str = ''):
+        t = f'{alias}.' if alias else ''
+        clauses, params = [f'{t}strategy = ?', f'{t}backtest = ?'], [strategy, int(backtest)]
+        if symbol is not None: clauses, params = clauses + [f'{t}symbol = ?'], params + [symbol]
+        if start is not None: clauses, params = clauses + [f'{t}unix >= ?'], params + [_to_unix(start)]
+        if end is not None: clauses, params = clauses + [f'{t}unix < ?'], params + [_to_unix(end)]
+        return ' AND '.join(clauses), tuple(params)
+
+
+    # Writes
+    def record(self, strategy: str, report: TransactionReport, backtest: bool = False):
+        row = (
+            strategy, int(backtest), _to_date_string(report.date), _to_unix(report.date), report.symbol,
+            'buy' if report.transaction_type == TransactionType.MarketBuy else 'sell',
+            _value(report.strike), _value(report.quantity), _value(report.confidence), _value(report.hold_length),
+            _value(report.tradePL), _value(report.portfolioPL), _value(report.totalPL), report.reason,
+        )
+        with self._lock:
+            conn = self._connection()
+            conn.execute('INSERT INTO transactions (strategy, backtest, date, unix, symbol, type, price, quantity, confidence, hold_length, trade_pl, portfolio_pl, total_pl, reason) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+            conn.commit()
+
+    def clear(self, strategy: str, backtest: bool = True):
+        """Removes a strategy's (by default backtest) transactions, e.g. before re-running a backtest"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute('DELETE FROM transactions WHERE strategy = ? AND backtest = ?', (strategy, int(backtest)))
+            conn.commit()
+
+    def import_csv(self, strategy: str, path: str, backtest: bool = False) -> int:
+        """One-off import of a legacy `{strategy}_transactions.csv`, skipped if the strategy already has journal rows"""
+        if not os.path.isfile(path) or self.count(strategy, backtest) > 0: return 0
+
+        with open(path, newline='') as f: rows = list(csv.DictReader(f))
+        with self._lock:
+            conn = self._connection()
+            conn.executemany('INSERT INTO transactions (strategy, backtest, date, unix, symbol, type, price, quantity, confidence, hold_length, trade_pl, portfolio_pl, total_pl) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [(
+                strategy, int(backtest), _to_date_string(r['date']), _to_unix(r['date']), r['symbol'],
+                'buy' if 'Buy' in r['type'] else 'sell',
+                _value(r['price']), _value(r['quantity']), _value(r['confidence']), _value(r['hold_length']),
+                _value(r['trade_pl']), _value(r['portfolio_pl']), _value(r['total_pl']),
+            ) for r in rows])
+            conn.commit()
+        print(f'TransactionJournal: imported {len(rows)} {strategy} transactions from {path}')
+        return len(rows)
+
+
+    # Queries
+    def count(self, strategy: str, backtest: bool = False) -> int:
+        where, params = self._where(strategy, backtest)
+        return self._query(f'SELECT COUNT(*) AS n FROM transactions WHERE {where}', params)[0]['n']
+
+    def transactions(self, strategy: str, symbol: str = None, start: Union[datetime, str] = None, end: Union[datetime, str] = None, backtest: bool = False, limit: int = None) -> List[dict]:
+        """Transactions in date order (the most recent `limit` if given)"""
+        where, params = self._where(strategy, backtest, symbol, start, end)
+        if limit is None: return self._query(f'SELECT * FROM transactions WHERE {where} ORDER BY unix, id', params)
+        return self._query(f'SELECT * FROM (SELECT * FROM transactions WHERE {where} ORDER BY unix DESC, id DESC LIMIT ?) ORDER BY unix, id', params + (limit,))
+
+    def summary(self, strategy: str, start: Union[datetime, str] = None, end: Union[datetime, str] = None, backtest: bool = False) -> dict:
+        """Realized P&L, win/loss counts & hold lengths over a range"""
+        where, params = self._where(strategy, backtest, start=start, end=end)
+        summary = self._query(f"""
+            SELECT
+                SUM(type = 'buy') AS buys, SUM(type = 'sell') AS sells,
+                COALESCE(SUM(trade_pl), 0) AS realized_pl,
+                SUM(trade_pl > 0) AS wins, SUM(trade_pl < 0) AS losses,
+                AVG(CASE WHEN type = 'sell' THEN hold_length END) AS average_hold, MAX(hold_length) AS longest_hold
+            FROM transactions WHERE {where}""", params)[0]
+        last = self._query(f'SELECT total_pl FROM transactions WHERE {where} AND type = \'sell\' ORDER BY unix DESC, id DESC LIMIT 1', params)
+        summary['total_pl'] = last[0]['total_pl'] if len(last) > 0 else 0
+        return { k: (v if v is not None else 0) for k, v in summary.items() }
+
+    def symbol_stats(self, strategy: str, start: Union[datetime, str] = None, end: Union[datetime, str] = None, backtest: bool = False) -> Dict[str, dict]:
+        where, params = self._where(strategy, backtest, start=start, end=end)
+        rows = self._query(f"""
+            SELECT symbol,
+                SUM(type = 'buy') AS buys, SUM(type = 'sell') AS sells,
+                COALESCE(SUM(trade_pl), 0) AS realized_pl,
+                SUM(trade_pl > 0) AS wins, SUM(trade_pl < 0) AS losses,
+                AVG(CASE WHEN type = 'sell' THEN hold_length END) AS average_hold,
+                MAX(trade_pl) AS best_trade, MIN(trade_pl) AS worst_trade
+            FROM transactions WHERE {where} GROUP BY symbol""", params)
+        return { r.pop('symbol'): r for r in rows }
+
+    def daily_pl(self, strategy: str, start: Union[datetime, str] = None, end: Union[datetime, str] = None, backtest: bool = False) -> List[dict]:
+        """Realized P&L per (local) day"""
+        where, params = self._where(strategy, backtest, start=start, end=end)
+        return self._query(f"""
+            SELECT date(unix, 'unixepoch', 'localtime') AS day, COALESCE(SUM(trade_pl), 0) AS realized_pl, SUM(type = 'sell') AS sells
+            FROM transactions WHERE {where} GROUP BY day ORDER BY day""", params)
+
+    def extreme_sell(self, strategy: str, largest: bool = True, backtest: bool = False) -> Optional[dict]:
+        """The most profitable (or losing) sell, with the date of the buy it closed"""
+        where, params = self._where(strategy, backtest, alias='s')
+        rows = self._query(f"""
+            SELECT s.symbol, s.date, s.trade_pl, (
+                SELECT b.date FROM transactions b
+                WHERE b.strategy = s.strategy AND b.backtest = s.backtest AND b.symbol = s.symbol AND b.type = 'buy' AND b.unix <= s.unix
+                ORDER BY b.unix DESC LIMIT 1
+            ) AS purchase_date
+            FROM transactions s WHERE {where} AND s.type = 'sell' AND s.trade_pl {'>' if largest else '<'} 0
+            ORDER BY s.trade_pl {'DESC' if largest else 'ASC'} LIMIT 1""", params)
+        return rows[0] if len(rows) > 0 else None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None: self._conn.close()
+            self._conn = None
+
+
+
+# Shared journal every trader records into
+JOURNAL = TransactionJournal()
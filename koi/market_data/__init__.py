@@ -1,3 +1,5 @@
 from koi.market_data.root import apply_strategies, Market, BarData, apply_without_strategies, ApplyConfig
+from koi.market_data.quotes import QUOTES, Quote, QuoteCache
+from koi.market_data.latency import LATENCY, LatencyHistogram, LatencyRecorder
 from koi.market_data.cb_client import CB_Client
 from koi.market_data.ib_client import IB_Client
@@ -1,7 +1,8 @@
-import asyncio, os, nest_asyncio, cbpro, pandas as pd, robin_stocks.robinhood as rh
-from threading import Thread
+import asyncio, json, os, nest_asyncio, cbpro, pandas as pd, robin_stocks.robinhood as rh
+from robin_stocks.robinhood.helper import request_get as rh_request_get
+from threading import RLock, Thread
 from datetime import datetime, timedelta
-from time import sleep
+from time import sleep, time
 from math import ceil
 from typing import List, Dict, NamedTuple, Optional, Tuple, Union
 from cbpro.authenticated_client import AuthenticatedClient
@@ -12,40 +13,147 @@ from koi.market_data import apply_strategies, apply_without_strategies, ApplyCon
 from koi.market_data.root import extract_contracts, CryptoOrder
 from koi.models import CB_Account, CB_Order, CryptoContract, KoiState
 from koi.market_data.helpers.kraken import Client as Kraken
-from koi.market_data.helpers.market_models import CryptoOrderStatus, CryptoTick
+from koi.market_data.helpers.kraken_history import KrakenHistory
+from koi.market_data.helpers.market_models import CryptoOrderStatus, CryptoTick, json_loads, json_num
+from koi.market_data.helpers.order_book import OrderBook
+from koi.market_data.helpers.feed_health import FeedHealth, feed_health
+from koi.market_data.helpers.handoff import VersionedSnapshot
+from koi.market_data.quotes import QUOTES, Quote, iso_to_epoch
+from koi.market_data.latency import LATENCY, arrival_time
 
 
 env = dotenv_values('.env')
 
+class CB_TickState(NamedTuple):
+    prev_buy: CryptoTick
+    buy: CryptoTick
+    prev_sell: CryptoTick
+    sell: CryptoTick
+
+
 class cb_socket(cbpro.WebsocketClient):
 
+    # Working state owned by the socket thread, other threads read `ticks` snapshots
     prev_buy_state: Dict[str, CryptoTick] = {}
     latest_buy_state: Dict[str, CryptoTick] = {}
     prev_sell_state: Dict[str, CryptoTick] = {}
     latest_sell_state: Dict[str, CryptoTick] = {}
+    ticks: VersionedSnapshot = VersionedSnapshot('coinbase:ticks')
+    books: Dict[str, OrderBook] = {}
+
+    # Held while a message is applied & while the FeedHealth watchdog thread resyncs or reconnects, so a resync
+    # never resets a book or trade ids halfway through the listen thread applying an update
+    lock: RLock = RLock()
     
+    # Raw message prefixes that carry nothing we consume, discarded before decoding
+    discard_prefixes = ('{"type":"subscriptions"',)
+    discarded_count: int = 0
+
+    # Gap detection: ticker trade ids are checked against the venue's last trade id from the heartbeat channel
+    health: FeedHealth = feed_health('coinbase')
+    last_trade_ids: Dict[str, int] = {}
+    heartbeat_trade_ids: Dict[str, int] = {}
+
     def on_open(self):
-        self.url = "wss://ws-feed.pro.coinbase.com/"
         self.message_count = 0
+        self.discarded_count = 0
+
+    def resync_product(self, product: str):
+        """Resubscribes a single product, which makes coinbase resend its ticker & a fresh level2 snapshot"""
+        with self.lock:
+            if product in self.books: self.books[product].reset()
+            self.last_trade_ids.pop(product, None)
+            self.heartbeat_trade_ids.pop(product, None)
+            for msg_type in ['unsubscribe', 'subscribe']:
+                self.ws.send(json.dumps({ 'type': msg_type, 'product_ids': [product], 'channels': self.channels }))
+
+    def reconnect(self):
+        """Reopens the socket from scratch, dropping state that may have gone stale while disconnected"""
+        try: self.close() # not under the lock, closing waits for the listen thread to finish its current message
+        except Exception as e: print('CB Socket: close error:', e)
+
+        with self.lock:
+            for book in self.books.values(): book.reset()
+            for state in [self.prev_buy_state, self.latest_buy_state, self.prev_sell_state, self.latest_sell_state, self.last_trade_ids, self.heartbeat_trade_ids]: state.clear()
+            self.ticks.clear()
+        self.start()
+        self.health.reconnected()
+
+    def _listen(self):
+        """Replaces cbpro's listen loop to drop heartbeat/system frames undecoded and decode the rest with the fast parser"""
+        start_t = 0
+        while not self.stop:
+            try:
+                if time() - start_t >= 30:
+                    # Set a 30 second ping to keep connection alive
+                    with self.lock: self.ws.ping("keepalive")
+                    start_t = time()
+                data = self.ws.recv()
+                if data.startswith(self.discard_prefixes):
+                    self.discarded_count += 1
+                    self.health.message()
+                    continue
+                msg = json_loads(data)
+            except ValueError as e:
+                self.on_error(e)
+            except Exception as e:
+                self.on_error(e)
+            else:
+                with self.lock: self.on_message(msg)
 
     def on_message(self, msg):
         self.message_count += 1
+        msg_type = msg.get('type')
+
+        product = msg.get('product_id')
+        self.health.message(product)
 
-        if 'type' in msg and msg['type'] == 'ticker' and 'product_id' in msg:
-            product = msg['product_id']
+        if msg_type == 'ticker' and product is not None:
             msg_data = CryptoTick.from_json(msg)
-            if msg['side'] == 'buy':
+            # Ticker sequences sample the product-wide sequence, so only ordering can be checked (stale replays are dropped)
+            if msg_data.sequence and self.health.sequence(product, msg_data.sequence, contiguous=False) < 0: return
+            if msg_data.trade_id: self.last_trade_ids[product] = msg_data.trade_id
+
+            exchange_time = iso_to_epoch(msg_data.time)
+            LATENCY.record('coinbase', product, exchange_time)
+            QUOTES.update(product, msg_data.best_bid, msg_data.best_ask, 'coinbase', exchange_time)
+            if msg_data.side == 'buy':
                 # update prev & latest buy state
                 if product in self.latest_buy_state: self.prev_buy_state[product] = self.latest_buy_state[product]
                 else: self.prev_buy_state[product] = msg_data
                 self.latest_buy_state[product] = msg_data
 
-            elif msg['side'] == 'sell':
+            elif msg_data.side == 'sell':
                 # update prev & latest sell state
                 if product in self.latest_sell_state: self.prev_sell_state[product] = self.latest_sell_state[product]
                 else: self.prev_sell_state[product] = msg_data
                 self.latest_sell_state[product] = msg_data
 
+            if product in self.latest_buy_state and product in self.latest_sell_state:
+                self.ticks.put(product, CB_TickState(self.prev_buy_state[product], self.latest_buy_state[product], self.prev_sell_state[product], self.latest_sell_state[product]))
+
+        elif msg_type == 'heartbeat' and product is not None:
+            # A trade the venue reported a heartbeat ago that our ticker never delivered means ticker messages were missed
+            missed = self.heartbeat_trade_ids.get(product, 0)
+            if product in self.last_trade_ids and self.last_trade_ids[product] < missed:
+                print(f'CB Socket: {product} missed trades up to {missed}, resyncing')
+                self.health.gap(product)
+                self.health.resynced(product)
+                self.resync_product(product)
+            else: self.heartbeat_trade_ids[product] = msg.get('last_trade_id', 0)
+
+        elif msg_type == 'snapshot':
+            if product not in self.books: self.books[product] = OrderBook(product)
+            self.books[product].apply_cb_snapshot(msg)
+
+        elif msg_type == 'l2update':
+            if product not in self.books or not self.books[product].initialized: return # updates before a snapshot can't be applied
+            if not self.books[product].apply_cb_update(msg):
+                print(f'CB Socket: {product} book crossed after update, resyncing')
+                self.health.gap(product)
+                self.health.resynced(product)
+                self.resync_product(product)
+
 
     def on_close(self):
         print('CB Socket Closed')
@@ -60,17 +168,22 @@ class CB_Client(Market):
     available_balance: Dict
     capital: float
     latest_tick: Dict[str, CryptoTick]
+    rh_poll_interval: float = 1.0
+    rh_ids: Dict[str, str] = {}
 
     # Kraken params
     kraken: Kraken = None
+    kraken_history: KrakenHistory = None
 
     # Coinbase params
     public_client: PublicClient = None
     authed_client: AuthenticatedClient = None
     socket: cb_socket = None
     accounts: List[CB_Account] = []
-    sb_api_url = 'https://api-public.sandbox.pro.coinbase.com'
-    api_url = 'https://api.pro.coinbase.com'
+    # Endpoints can be overridden (e.g. to point at koi.simulator)
+    sb_api_url = env.get('COINBASE_SANDBOX_API_URL') or 'https://api-public.sandbox.pro.coinbase.com'
+    api_url = env.get('COINBASE_API_URL') or 'https://api.pro.coinbase.com'
+    ws_url = env.get('COINBASE_WS_URL') or 'wss://ws-feed.pro.coinbase.com'
     # Sandbox credentials
     sb_key = env['COINBASE_KEY_SB']
     sb_passphrase = env['COINBASE_PASSPHRASE_SB']
@@ -87,12 +200,13 @@ class CB_Client(Market):
             nest_asyncio.apply(self.event_loop)
             self.exchange = exchange
             self.available_balance = {}
-            self.public_client = cbpro.PublicClient()
+            self.public_client = cbpro.PublicClient(api_url=self.api_url)
             SANDBOX_MODE = env['CRYPTO_SANDBOX'] == 'True'
             self.latest_tick = {}
 
             if self.exchange == 'kraken':
                 self.kraken = Kraken(SANDBOX_MODE)
+                self.kraken_history = KrakenHistory(self.kraken.rest)
 
             elif self.exchange == 'coinbase':
                 if SANDBOX_MODE: self.authed_client = cbpro.AuthenticatedClient(self.sb_key, self.sb_secret, self.sb_passphrase, self.sb_api_url) # sandbox client
@@ -116,10 +230,13 @@ class CB_Client(Market):
                 contracts = extract_contracts(state.strategies).cryptos
                 self.stream_products = [c.symbol for c in contracts]
 
+            # Stale quotes are refreshed synchronously from the active exchange
+            QUOTES.register_refresher(self.exchange, self.refresh_quote)
+
             if self.exchange == 'coinbase':
                 print('starting crypto socket: coinbase')
                 # Channel options: ['ticker', 'user', 'matches', 'level2', 'full']
-                self.socket = cb_socket(channels=['ticker'], products=self.stream_products, auth=False, api_key=self.key, api_secret=self.secret, api_passphrase=self.passphrase)
+                self.socket = cb_socket(url=self.ws_url, channels=['ticker', 'level2', 'heartbeat'], products=self.stream_products, auth=False, api_key=self.key, api_secret=self.secret, api_passphrase=self.passphrase)
 
         except Exception as e:
             print('CB_Client Error: ', e)
@@ -146,7 +263,12 @@ class CB_Client(Market):
             if self.tick_streaming_enabled:
                 try: self.socket.close()
                 except Exception as e: pass
-            else: self.socket.start()
+            else:
+                self.socket.start()
+                self.socket.health.watch(lambda: self.stream_products, self.socket.resync_product, self.socket.reconnect, lambda: self.tick_streaming_enabled)
+        elif self.exchange == 'robinhood':
+            if not self.tick_streaming_enabled:
+                Thread(target=self.poll_rh_quotes).start()
 
         self.tick_streaming_enabled = not self.tick_streaming_enabled
 
@@ -156,10 +278,11 @@ class CB_Client(Market):
         if self.exchange == 'kraken':
             for product in self.stream_products:
                 # Ensure data for product is present
-                if not self.kraken.has_symbol_tick_data(product): continue
+                state = self.kraken.get_symbol_tick_data(product)
+                if state is None: continue
 
                 # extract states
-                prev_state, latest_state = self.kraken.get_symbol_tick_data(product)
+                prev_state, latest_state = state
 
                 data[product] = {
                     'ask': latest_state.ask,
@@ -173,8 +296,7 @@ class CB_Client(Market):
                     'high': latest_state.high,
                     'low': latest_state.low,
                     'close': latest_state.close,
-                    'time': latest_state.time # 2021-01-31T18:04:12.616460Z
-                    # 'time': buy_state.time.strftime('%Y-%m-%dT%H:%M:%S.%fZ') # 2021-01-31T18:04:12.616460Z
+                    'time': latest_state.iso_time() # 2021-01-31T18:04:12.616460Z
                 }
 
             return data
@@ -185,27 +307,27 @@ class CB_Client(Market):
         else:
             # ticker format: {'type': 'ticker', 'sequence': 13438836927, 'product_id': 'ETH-USD', 'price': '1293.37', 'open_24h': '1377.19', 'volume_24h': '201254.23533537', 'low_24h': '1283', 'high_24h': '1392.23', 'volume_30d': '17943944.12693805', 'best_bid': '1293.25', 'best_ask': '1293.37', 'side': 'buy', 'time': '2021-01-31T18:04:12.616460Z', 'trade_id': 81168541, 'last_size': '0.05770902'}
             
+            ticks = self.socket.ticks.snapshot()
             for product in self.stream_products:
                 # Ensure data for product is present
-                has_data = product in self.socket.latest_buy_state and product in self.socket.latest_sell_state
-                if not has_data: continue
+                if product not in ticks: continue
 
                 # extract states
-                prev_buy_state, buy_state = self.socket.prev_buy_state[product], self.socket.latest_buy_state[product]
-                prev_sell_state, sell_state = self.socket.prev_sell_state[product], self.socket.latest_sell_state[product]
+                prev_buy_state, buy_state, prev_sell_state, sell_state = ticks[product]
 
+                # Missing feed fields are parsed to nan, sent as null since eel serializes to JSON
                 data[product] = {
-                    'ask': sell_state.best_ask,
-                    'prevAsk': prev_sell_state.best_ask,
-                    'open': buy_state.price,
-                    'askSize': sell_state.last_size,
-                    'prevAskSize': prev_sell_state.last_size,
-                    'bid': buy_state.best_bid,
-                    'bidSize': buy_state.last_size,
-                    'prevBidSize': prev_buy_state.last_size,
-                    'high': sell_state.high_24h,
-                    'low': sell_state.low_24h,
-                    'close': buy_state.price,
+                    'ask': json_num(sell_state.best_ask),
+                    'prevAsk': json_num(prev_sell_state.best_ask),
+                    'open': json_num(buy_state.price),
+                    'askSize': json_num(sell_state.last_size),
+                    'prevAskSize': json_num(prev_sell_state.last_size),
+                    'bid': json_num(buy_state.best_bid),
+                    'bidSize': json_num(buy_state.last_size),
+                    'prevBidSize': json_num(prev_buy_state.last_size),
+                    'high': json_num(sell_state.high_24h),
+                    'low': json_num(sell_state.low_24h),
+                    'close': json_num(buy_state.price),
                     'time': buy_state.time # 2021-01-31T18:04:12.616460Z
                     # 'time': buy_state.time.strftime('%Y-%m-%dT%H:%M:%S.%fZ') # 2021-01-31T18:04:12.616460Z
                 }
@@ -213,16 +335,56 @@ class CB_Client(Market):
             return data
 
     def latest_symbol_price(self, symbol: str) -> Tuple[float, float]:
+        quote = QUOTES.latest(symbol, self.exchange)
+        return quote.ask, quote.bid
+
+    def refresh_quote(self, symbol: str) -> Optional[Quote]:
+        """Blocking single-symbol quote fetch, used by the quote cache when a streamed quote goes stale"""
         if self.exchange == 'robinhood':
             print('rh: getting latest price')
             tick = CryptoTick.from_rh_data(rh.get_crypto_quote(symbol.split('-')[0]), symbol)
             self.latest_tick[symbol] = tick
-            return float(tick.best_ask), float(tick.best_bid)
+            return QUOTES.update(symbol, tick.best_bid, tick.best_ask, 'robinhood')
+
+        elif self.exchange == 'kraken':
+            pair = self.kraken._sanitize_pair(symbol).replace('/', '')
+            data = list(self.kraken.rest.public('Ticker', { 'pair': pair }).values())[0]
+            return QUOTES.update(symbol, data['b'][0], data['a'][0], 'kraken')
 
         else:
-            bid = self.socket.latest_buy_state[symbol].best_bid
-            ask = self.socket.latest_buy_state[symbol].best_ask
-            return float(ask), float(bid)
+            data = self.public_client.get_product_ticker(symbol)
+            return QUOTES.update(symbol, data['bid'], data['ask'], 'coinbase', iso_to_epoch(data.get('time')))
+
+    def poll_rh_quotes(self):
+        """Fetches all streamed robinhood quotes in a single batched request per interval while streaming is enabled"""
+        for product in self.stream_products:
+            if product not in self.rh_ids: self.rh_ids[product] = rh.get_crypto_id(product.split('-')[0])
+        symbols = { rh_id: product for product, rh_id in self.rh_ids.items() }
+
+        while self.tick_streaming_enabled:
+            try:
+                # Robinhood quotes carry no venue timestamp, so the poll's round trip is recorded as its latency
+                requested = arrival_time()
+                quotes = rh_request_get('https://api.robinhood.com/marketdata/forex/quotes/', 'results', { 'ids': ','.join(symbols.keys()) })
+                for data in quotes or []:
+                    if data is None or data.get('id') not in symbols: continue
+                    symbol = symbols[data['id']]
+                    tick = CryptoTick.from_rh_data(data, symbol)
+                    self.latest_tick[symbol] = tick
+                    LATENCY.record('robinhood', symbol, requested)
+                    QUOTES.update(symbol, tick.best_bid, tick.best_ask, 'robinhood')
+            except Exception as e: print('poll_rh_quotes error:', e)
+            sleep(self.rh_poll_interval)
+
+
+    def order_book(self, symbol: str) -> Optional[OrderBook]:
+        """Returns a consistent copy of the live L2 book for a symbol if one is being maintained"""
+        if self.exchange == 'kraken': book = self.kraken.books.get(symbol)
+        elif self.exchange == 'coinbase' and self.socket is not None: book = self.socket.books.get(symbol)
+        else: book = None
+
+        if book is None or not book.initialized: return None
+        return book.snapshot()
 
 
     async def get_n_candle_groups(self, contract: CryptoContract, granularity: int, end_date: datetime, duration_seconds: int,  n: int = 6) -> Tuple[str, pd.DataFrame]:
@@ -263,10 +425,11 @@ class CB_Client(Market):
         # return (contract.symbol, df.iloc[::-1])
         return (contract.symbol, df)
 
-    def get_historical_data(self, contracts: List[CryptoContract], size: int = 60, duration: str = '7 D', end_date: Union[datetime, str] = '', use_cached_if_available: bool = False, apply_config: ApplyConfig = None) -> List[Tuple[str, pd.DataFrame]]:
+    def get_historical_data(self, contracts: List[CryptoContract], size: int = 60, duration: str = '7 D', end_date: Union[datetime, str] = '', use_cached_if_available: bool = False, apply_config: ApplyConfig = None, priority: int = 0) -> List[Tuple[str, pd.DataFrame]]:
         """
         Given a list of contracts, executes and waits for historical bar requests in parallel.
         Coinbase api limits to 300 candles at a time (5 hours worth @ 1 min candles so multiple fetches may be needed
+        `priority` is accepted for interface parity with IB_Client and unused.
         """
         
         asyncio.set_event_loop(self.event_loop)
@@ -307,7 +470,12 @@ class CB_Client(Market):
             end_iso = end.isoformat()
             print('CB_Client:Requested end date:', end.strftime('%Y_%m_%d %H_%M_%S'))
     
-            if candles <= 300: # Can be fetched in single request
+            if self.exchange == 'kraken': # train on the venue we trade on
+                start = end.timestamp() - duration_seconds
+                group = asyncio.gather(*[self.kraken_history.bars(c.symbol, self.kraken._sanitize_pair(c.symbol).replace('/', ''), size, start, end.timestamp()) for c in contracts])
+                data = [(sym, df) for sym, df in self.event_loop.run_until_complete(group) if df is not None]
+
+            elif candles <= 300: # Can be fetched in single request
                 for contract in contracts:
                     candles = self.public_client.get_product_historic_rates(contract.symbol, end=end_iso, granularity=size)
                     if len(candles) > 1:
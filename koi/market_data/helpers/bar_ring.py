@@ -0,0 +1,139 @@
+import numpy as np, pandas as pd
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional
+
+
+class BarRing(object):
+    """
+    Fixed-capacity columnar ring buffer of bars for a single symbol.
+    Each column is a preallocated NumPy array written in place, so appending a bar (and evicting the oldest) is O(1).
+    Timestamps are deduped through a hash of unix -> slot, and a DataFrame is only assembled (then cached until
+    the next write) when something asks for one.
+    """
+    symbol: str
+    capacity: int
+    size: int
+    head: int       # slot the next bar is written to
+    version: int
+    columns: Dict[str, np.ndarray]
+
+    def __init__(self, symbol: str, capacity: int = 200):
+        self.symbol = symbol
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0
+        self.version = 0
+        self.columns = {}
+        self._slots: Dict[int, int] = {}    # unix -> slot
+        self._frame: Optional[pd.DataFrame] = None
+        self._frame_version = -1
+
+
+    def _column(self, name: str, sample) -> np.ndarray:
+        if name not in self.columns:
+            if isinstance(sample, (bool, np.bool_)): self.columns[name] = np.zeros(self.capacity, dtype=bool)
+            elif isinstance(sample, (int, np.integer)): self.columns[name] = np.zeros(self.capacity, dtype=np.int64)
+            elif isinstance(sample, (float, np.floating)): self.columns[name] = np.full(self.capacity, np.nan)
+            else: self.columns[name] = np.full(self.capacity, None, dtype=object)
+        return self.columns[name]
+
+    def _order(self) -> np.ndarray:
+        """Slots from oldest to newest"""
+        if self.size < self.capacity: return np.arange(self.size)
+        return np.roll(np.arange(self.capacity), -self.head)
+
+    @property
+    def newest(self) -> Optional[int]:
+        if self.size == 0: return None
+        return int(self.columns['unix'][(self.head - 1) % self.capacity])
+
+    def __contains__(self, unix) -> bool:
+        return int(unix) in self._slots
+
+    def __len__(self):
+        return self.size
+
+
+    # Writes
+    def append(self, row: Mapping) -> bool:
+        """Appends a bar, returning False for a duplicate or one older than the newest bar"""
+        unix = int(row['unix'])
+        newest = self.newest
+        if unix in self._slots or (newest is not None and unix < newest): return False
+
+        slot = self.head
+        if self.size == self.capacity: self._slots.pop(int(self.columns['unix'][slot]), None) # evict the oldest
+        else: self.size += 1
+
+        for name, value in row.items(): self._column(name, value)[slot] = value
+        for name, column in self.columns.items():
+            if name not in row: column[slot] = np.nan if column.dtype.kind == 'f' else 0 if column.dtype.kind in 'iub' else None
+
+        self._slots[unix] = slot
+        self.head = (slot + 1) % self.capacity
+        self.version += 1
+        return True
+
+    def extend(self, df: pd.DataFrame) -> int:
+        """Appends each new bar of a frame in order, returning how many were added"""
+        return sum(self.append(row) for row in df.to_dict('records'))
+
+    def load(self, df: pd.DataFrame):
+        """Replaces the contents with the latest `capacity` bars of a frame"""
+        if 'unix' not in df.columns: df = df.assign(unix=df['date'].apply(lambda d: int(d.timestamp())))
+        self.size, self.head, self.columns, self._slots = 0, 0, {}, {}
+        self.extend(df.iloc[-self.capacity:])
+        self.version += 1
+
+    def assign_tail(self, df: pd.DataFrame, n: int):
+        """Writes every column of a frame's last `n` rows over the newest `n` bars (e.g. freshly computed indicators)"""
+        n = min(n, self.size, df.shape[0])
+        if n <= 0: return
+        slots = self._order()[-n:]
+        for name in df.columns:
+            values = df[name].iloc[-n:].tolist() # python/pandas scalars, matching what append stores
+            self._column(name, values[-1])[slots] = values
+        self.version += 1
+
+
+    # Reads
+    def frame(self) -> pd.DataFrame:
+        """Chronological DataFrame of the buffered bars, rebuilt only after writes. Treat as read-only"""
+        if self._frame_version != self.version:
+            order = self._order()
+            self._frame = pd.DataFrame({ name: column[order] for name, column in self.columns.items() })
+            self._frame_version = self.version
+        return self._frame
+
+
+
+class BarFrames(Mapping):
+    """
+    Per-symbol BarRings behind the `Dict[str, DataFrame]` interface strategies already consume: indexing a symbol
+    returns its (cached) frame, assigning a frame reloads that symbol's ring.
+    """
+    capacity: int
+    rings: Dict[str, BarRing]
+
+    def __init__(self, capacity: int = 200):
+        self.capacity = capacity
+        self.rings = {}
+
+    def ring(self, symbol: str) -> BarRing:
+        if symbol not in self.rings: self.rings[symbol] = BarRing(symbol, self.capacity)
+        return self.rings[symbol]
+
+    def __getitem__(self, symbol: str) -> pd.DataFrame:
+        return self.rings[symbol].frame()
+
+    def __setitem__(self, symbol: str, df: pd.DataFrame):
+        self.ring(symbol).load(df)
+
+    def __contains__(self, symbol) -> bool:
+        return symbol in self.rings
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.rings.keys()))
+
+    def __len__(self):
+        return len(self.rings)
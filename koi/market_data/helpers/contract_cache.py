@@ -0,0 +1,149 @@
+import json, os, threading, time
+from typing import Dict, List, Optional, Tuple
+from ibapi.contract import Contract
+
+DEFAULT_CURRENCY = 'USD'
+
+# Known US stock conIds (SMART routed). Seeded as already expired so the first qualification
+# pass verifies them, but still usable for orders if IB can't be reached.
+SEED_CONIDS: Dict[str, int] = {
+    "AAPL": 265598,
+    "PLTR": 444857009,
+    "SPY": 756733,
+    "GME": 36285627,
+    "SPCE": 388824891,
+    "AMC": 1140070600,
+    "BBBY": 266630,
+    "TSLA": 76792991,
+    "GE": 7516,
+    "GM": 80986742,
+    "GOOG": 208813720,
+    "FB": 107113386,
+    'AMZN': 3691937,
+    'F': 9599491,
+    'SPOT': 312496724,
+    'EA': 268995,
+    'BA': 4762,
+    'UAL': 79498203,
+    'LYFT': 359130923,
+    'BABA': 166090175,
+    'SQ': 212671971,
+    'ABNB': 459530964,
+    'XOM': 13977,
+
+    'SRNE': 132304979,
+    'PLUG': 88385302,
+    'MARA': 360205428,
+    'GEVO': 320228879,
+    'TRXC': 393993722,
+    'WKHS': 215119556,
+    'BLNK': 287428879,
+    'PHUN': 347896223,
+    'XPEV': 441828902,
+    'VIAC': 393897513,
+    'CMCSA': 267748,
+    'BAC': 10098,
+
+    'QCOM': 273544,
+    'DD': 365921621,
+    'LLY': 9160,
+    'PFE': 11031,
+    'XSPA': 426480588,
+    'TIGR': 356857464,
+    'MVIS': 102558681,
+    'KO': 8894,
+    'RIOT': 292830677,
+    'ACB': 420446448,
+    'TLRY': 326196509,
+    'SNDL': 376499916,
+    'GILD': 269753,
+
+    'DIS': 6459,
+    'MU': 9939,
+    'NOK': 661513,
+    'PTON': 385087203,
+    'TWTR': 137780444,
+    'SBUX': 274105,
+    'UBER': 365207014,
+
+    'COF': 5941,
+    'T': 37018770,
+    'CCL': 5516,
+    'DKNG': 419221909,
+    'NIO': 332794741,
+    'SNAP': 268060148,
+    'NVDA': 4815747,
+    'NCLH': 120643512,
+    'PINS': 360975915,
+    'PYPL': 199169591,
+    'MGM': 9560,
+    'WFC': 10375,
+    'AMD': 4391,
+    'TSM': 6223250,
+    'AMAT': 266093,
+    'ADBE': 265768,
+    'JD': 152486141,
+    'V': 49462172,
+    'VALE': 60581038,
+}
+
+
+def contract_key(contract: Contract) -> str:
+    """Unset currencies (e.g. `Stock(sym, 'SMART')`) key as USD, the currency IB qualifies them to"""
+    return f'{contract.secType}:{contract.symbol}:{contract.exchange}:{contract.currency or DEFAULT_CURRENCY}'
+
+
+
+class ContractCache(object):
+    """
+    Persistent conId cache backing batched contract qualification.
+    Entries older than `max_age` seconds are requalified on the next `qualify` pass; lookups never hit IB.
+    """
+    path: str
+    max_age: float
+    entries: Dict[str, dict]
+
+    def __init__(self, path: str = 'config/contracts.json', max_age: float = 7 * 86400):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+        self.entries = { f'STK:{sym}:SMART:{DEFAULT_CURRENCY}': { 'conId': conId, 'primaryExchange': '', 'updated': 0 } for sym, conId in SEED_CONIDS.items() }
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r') as f: self.entries.update({ (k + DEFAULT_CURRENCY if k.endswith(':') else k): v for k, v in json.load(f).items() }) # older caches keyed unset currencies as ''
+            except Exception as e: print('ContractCache: unable to read cache:', e)
+
+
+    def lookup(self, contract: Contract) -> Optional[int]:
+        entry = self.entries.get(contract_key(contract))
+        return entry['conId'] if entry is not None else None
+
+    def apply(self, contract: Contract) -> bool:
+        """Fills a contract's conId (and primary exchange) from the cache, returns whether it was known"""
+        entry = self.entries.get(contract_key(contract))
+        if entry is None: return False
+
+        contract.conId = entry['conId']
+        if entry['primaryExchange'] and not contract.primaryExchange: contract.primaryExchange = entry['primaryExchange']
+        return True
+
+    def split(self, contracts: List[Contract]) -> Tuple[List[Contract], List[Contract]]:
+        """Splits contracts into (fresh, needs qualification), applying fresh cached entries in place"""
+        now = time.time()
+        fresh, stale = [], []
+        for c in contracts:
+            entry = self.entries.get(contract_key(c))
+            if entry is not None and now - entry['updated'] < self.max_age and self.apply(c): fresh.append(c)
+            else: stale.append(c)
+        return fresh, stale
+
+    def store(self, key: str, contract: Contract):
+        self.entries[key] = { 'conId': contract.conId, 'primaryExchange': contract.primaryExchange or '', 'updated': time.time() }
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f: json.dump(self.entries, f, indent=2)
+            os.replace(tmp, self.path)
@@ -0,0 +1,102 @@
+import math, time
+import numpy as np
+from typing import Dict
+
+# IB market depth update codes
+# See: https://interactivebrokers.github.io/tws-api/market_depth.html
+INSERT, UPDATE, DELETE = 0, 1, 2
+ASK, BID = 0, 1
+
+
+class DepthBook(object):
+    """
+    Fixed-size level 2 book for a single IB contract, updated in place from reqMktDepth rows.
+    Prices/sizes live in preallocated NumPy arrays indexed by IB's row position, and the depth totals behind
+    the imbalance feature are maintained incrementally so reads are O(1).
+    """
+    symbol: str
+    depth: int
+    prices: np.ndarray      # shape (2, depth): [ASK], [BID]; nan where a row is empty
+    sizes: np.ndarray       # shape (2, depth); 0 where a row is empty
+    totals: np.ndarray      # summed size per side
+    updates: int
+    updated: float          # monotonic time of the last update
+
+    def __init__(self, symbol: str, depth: int = 10):
+        self.symbol = symbol
+        self.depth = depth
+        self.prices = np.full((2, depth), np.nan)
+        self.sizes = np.zeros((2, depth))
+        self.totals = np.zeros(2)
+        self.updates = 0
+        self.updated = 0.0
+
+
+    def update(self, position: int, operation: int, side: int, price: float, size: float):
+        """Applies a single IB depth row (operation: 0 insert, 1 update, 2 delete | side: 0 ask, 1 bid)"""
+        if position < 0 or position >= self.depth: return
+        prices, sizes = self.prices[side], self.sizes[side]
+
+        if operation == INSERT:
+            self.totals[side] -= sizes[-1] # the last row is pushed out of the book
+            prices[position + 1:] = prices[position:-1].copy()
+            sizes[position + 1:] = sizes[position:-1].copy()
+            prices[position], sizes[position] = price, size
+            self.totals[side] += size
+        elif operation == UPDATE:
+            self.totals[side] += size - sizes[position]
+            prices[position], sizes[position] = price, size
+        elif operation == DELETE:
+            self.totals[side] -= sizes[position]
+            prices[position:-1] = prices[position + 1:].copy()
+            sizes[position:-1] = sizes[position + 1:].copy()
+            prices[-1], sizes[-1] = np.nan, 0
+
+        self.updates += 1
+        self.updated = time.monotonic()
+
+    def clear(self):
+        self.prices.fill(np.nan)
+        self.sizes.fill(0)
+        self.totals.fill(0)
+
+
+    # Features
+    def best_bid(self) -> float:
+        return float(self.prices[BID, 0])
+
+    def best_ask(self) -> float:
+        return float(self.prices[ASK, 0])
+
+    def mid(self) -> float:
+        return (self.best_bid() + self.best_ask()) / 2
+
+    def spread(self) -> float:
+        return self.best_ask() - self.best_bid()
+
+    def imbalance(self) -> float:
+        """Bid vs ask size across the whole book in [-1, 1], positive when bids outweigh asks"""
+        total = self.totals[BID] + self.totals[ASK]
+        return float((self.totals[BID] - self.totals[ASK]) / total) if total > 0 else math.nan
+
+    def top_imbalance(self) -> float:
+        bid, ask = self.sizes[BID, 0], self.sizes[ASK, 0]
+        return float((bid - ask) / (bid + ask)) if bid + ask > 0 else math.nan
+
+    def microprice(self) -> float:
+        """Top of book price weighted towards the side with less size (where the next trade is likelier to print)"""
+        bid_size, ask_size = self.sizes[BID, 0], self.sizes[ASK, 0]
+        if bid_size + ask_size <= 0: return math.nan
+        return float((self.prices[ASK, 0] * bid_size + self.prices[BID, 0] * ask_size) / (bid_size + ask_size))
+
+    def features(self) -> Dict[str, float]:
+        return {
+            'bid': self.best_bid(),
+            'ask': self.best_ask(),
+            'spread': self.spread(),
+            'imbalance': self.imbalance(),
+            'top_imbalance': self.top_imbalance(),
+            'microprice': self.microprice(),
+            'bid_depth': float(self.totals[BID]),
+            'ask_depth': float(self.totals[ASK]),
+        }
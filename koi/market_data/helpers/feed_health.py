@@ -0,0 +1,131 @@
+import threading, time
+from typing import Callable, Dict, List, Optional
+
+
+class FeedHealth(object):
+    """
+    Per-feed sequence & liveness tracking.
+    Feeds report every message (and its sequence number where the venue provides one). A watchdog resyncs
+    individual products that go silent or miss messages, and reconnects the feed only when the whole
+    connection goes quiet.
+    """
+    name: str
+    heartbeat_timeout: float    # seconds without any message before the connection is considered dead
+    product_timeout: Optional[float] # seconds without a message for a subscribed product before it is resynced (None: only on gaps)
+
+    messages: int
+    gaps: int
+    out_of_order: int
+    resyncs: int
+    reconnects: int
+    last_message: float
+    last_seen: Dict[str, float]
+    sequences: Dict[str, int]
+
+    def __init__(self, name: str, heartbeat_timeout: float = 10, product_timeout: Optional[float] = 30):
+        self.name = name
+        self.heartbeat_timeout = heartbeat_timeout
+        self.product_timeout = product_timeout
+        self.messages = 0
+        self.gaps = 0
+        self.out_of_order = 0
+        self.resyncs = 0
+        self.reconnects = 0
+        self.last_message = time.monotonic()
+        self.last_seen = {}
+        self.sequences = {}
+        self._watchdog: Optional[threading.Thread] = None
+
+
+    def message(self, product: str = None):
+        """Records a message arriving (heartbeats included), optionally for a specific product"""
+        now = time.monotonic()
+        self.messages += 1
+        self.last_message = now
+        if product is not None: self.last_seen[product] = now
+
+    def sequence(self, product: str, sequence: int, contiguous: bool = True) -> int:
+        """
+        Checks a product's sequence number against the last one seen.
+        Returns the number of missed messages (0 when in order) or -1 for a duplicate/out of order message that should be dropped.
+        Non-contiguous sequences (e.g. a channel sampling a venue-wide sequence) are only checked for ordering.
+        """
+        last = self.sequences.get(product)
+        if last is not None and sequence <= last:
+            self.out_of_order += 1
+            return -1
+
+        self.sequences[product] = sequence
+        if last is None or not contiguous or sequence == last + 1: return 0
+        self.gaps += 1
+        return sequence - last - 1
+
+    def gap(self, product: str):
+        """Records a gap detected by other means (e.g. a book checksum mismatch)"""
+        self.gaps += 1
+
+    def resynced(self, product: str):
+        self.resyncs += 1
+        self.sequences.pop(product, None)
+        self.last_seen[product] = time.monotonic()
+
+    def reconnected(self):
+        """Called by the feed once a connection has been re-established"""
+        self.reconnects += 1
+        self.sequences = {}
+        now = time.monotonic()
+        self.last_message = now
+        for product in self.last_seen: self.last_seen[product] = now
+
+
+    def silent(self) -> bool:
+        return time.monotonic() - self.last_message > self.heartbeat_timeout
+
+    def stale_products(self, products: List[str]) -> List[str]:
+        if self.product_timeout is None: return []
+        now = time.monotonic()
+        return [p for p in products if now - self.last_seen.get(p, now) > self.product_timeout]
+
+    def watch(self, products: Callable[[], List[str]], resync: Callable[[str], None], reconnect: Callable[[], None], active: Callable[[], bool], interval: float = 1.0):
+        """Starts a watchdog thread that resyncs stale products and reconnects a silent feed while `active()`"""
+        if self._watchdog is not None and self._watchdog.is_alive(): return
+        self.last_message = time.monotonic()
+
+        def run():
+            while True:
+                time.sleep(interval)
+                if not active(): return
+                try:
+                    if self.silent():
+                        print(f'{self.name}: no messages for {self.heartbeat_timeout}s, reconnecting')
+                        self.last_message = time.monotonic() # give the reconnect a full timeout before retrying
+                        reconnect()
+                        continue
+
+                    for product in self.stale_products(products()):
+                        print(f'{self.name}: {product} stale, resyncing')
+                        self.resynced(product)
+                        resync(product)
+                except Exception as e: print(f'{self.name}: watchdog error:', e)
+
+        self._watchdog = threading.Thread(target=run, daemon=True)
+        self._watchdog.start()
+
+    def to_dict(self) -> dict:
+        return {
+            'messages': self.messages,
+            'gaps': self.gaps,
+            'out_of_order': self.out_of_order,
+            'resyncs': self.resyncs,
+            'reconnects': self.reconnects,
+            'silent_for': time.monotonic() - self.last_message,
+        }
+
+
+
+# One tracker per feed, read by the UI
+FEEDS: Dict[str, FeedHealth] = {}
+
+def feed_health(name: str, **kwargs) -> FeedHealth:
+    if name not in FEEDS: FEEDS[name] = FeedHealth(name, **kwargs)
+    return FEEDS[name]
@@ -0,0 +1,122 @@
+import threading, time
+from collections import deque
+from typing import Any, Deque, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class VersionedSnapshot(Generic[T]):
+    """
+    Single-writer map handed to readers as immutable snapshots.
+    The feed thread mutates its working copy without locking and bumps `version` on every write. Readers get a
+    published copy that is only rebuilt (a single atomic dict copy) when the version has moved on, so they never
+    see a half-applied update and never make the feed thread wait.
+    """
+    name: str
+    version: int
+    reads: int
+    copies: int
+
+    def __init__(self, name: str):
+        self.name = name
+        self.version = 0
+        self.reads = 0
+        self.copies = 0
+        self._working: Dict[Hashable, T] = {}
+        self._published: Tuple[int, Dict[Hashable, T]] = (0, {})
+        HANDOFFS[name] = self
+
+
+    # Writer (feed thread only)
+    def put(self, key: Hashable, value: T):
+        self._working[key] = value
+        self.version += 1
+
+    def pop(self, key: Hashable):
+        if self._working.pop(key, None) is not None: self.version += 1
+
+    def clear(self):
+        self._working.clear()
+        self.version += 1
+
+
+    # Readers (any thread)
+    def snapshot(self) -> Dict[Hashable, T]:
+        """Consistent copy as of the latest version. Treat as read-only, it is shared between readers"""
+        self.reads += 1
+        version, data = self._published
+        if version == self.version: return data
+
+        version = self.version
+        data = self._working.copy() # a single C-level copy, atomic with respect to the writer
+        self._published = (version, data)
+        self.copies += 1
+        return data
+
+    def get(self, key: Hashable, default: Optional[T] = None) -> Optional[T]:
+        return self.snapshot().get(key, default)
+
+    def stats(self) -> Dict[str, int]:
+        return { 'version': self.version, 'reads': self.reads, 'copies': self.copies, 'size': len(self._working) }
+
+
+
+class SPSCQueue(Generic[T]):
+    """
+    Bounded single-producer/single-consumer queue. The producer never blocks: when the consumer falls behind the
+    oldest item is dropped and counted, which makes backpressure visible instead of stalling the feed thread.
+    """
+    name: str
+    maxsize: int
+    pushed: int
+    popped: int
+    dropped: int
+    high_water: int
+
+    def __init__(self, name: str, maxsize: int = 1024):
+        self.name = name
+        self.maxsize = maxsize
+        self.pushed = 0
+        self.popped = 0
+        self.dropped = 0
+        self.high_water = 0
+        self._items: Deque[T] = deque(maxlen=maxsize)
+        self._ready = threading.Event()
+        HANDOFFS[name] = self
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item: T):
+        if len(self._items) == self.maxsize: self.dropped += 1
+        self._items.append(item)
+        self.pushed += 1
+        self.high_water = max(self.high_water, len(self._items))
+        self._ready.set()
+
+    def drain(self) -> List[T]:
+        """Removes & returns everything queued, without waiting"""
+        items = []
+        while True:
+            try: items.append(self._items.popleft())
+            except IndexError: break
+        self.popped += len(items)
+        return items
+
+    def get_all(self, timeout: float) -> List[T]:
+        """Waits up to `timeout` seconds for at least one item, then drains the queue"""
+        if len(self._items) == 0:
+            self._ready.clear()
+            if len(self._items) == 0: self._ready.wait(timeout) # re-checked after clearing so a concurrent put isn't missed
+        return self.drain()
+
+    def stats(self) -> Dict[str, int]:
+        return { 'queued': len(self._items), 'pushed': self.pushed, 'popped': self.popped, 'dropped': self.dropped, 'high_water': self.high_water }
+
+
+
+# Every handoff point by name, read by the UI
+HANDOFFS: Dict[str, Any] = {}
+
+def handoff_stats() -> Dict[str, Dict[str, int]]:
+    return { name: handoff.stats() for name, handoff in list(HANDOFFS.items()) }
@@ -0,0 +1,118 @@
+import json, os, shutil
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+# Longest durationStr IB accepts in a single request for each bar size
+# See: https://interactivebrokers.github.io/tws-api/historical_limitations.html#hd_step_sizes
+DAY = 86400
+MAX_CHUNK_SECONDS: Dict[str, int] = {
+    '1 secs': 1800,
+    '5 secs': 3600,
+    '10 secs': 14400,
+    '15 secs': 14400,
+    '30 secs': 28800,
+    '1 min': DAY,
+    '2 mins': 2 * DAY,
+    '3 mins': 7 * DAY,
+    '5 mins': 7 * DAY,
+    '10 mins': 7 * DAY,
+    '15 mins': 14 * DAY,
+    '20 mins': 30 * DAY,
+    '30 mins': 30 * DAY,
+    '1 hour': 30 * DAY,
+    '2 hours': 30 * DAY,
+    '3 hours': 30 * DAY,
+    '4 hours': 30 * DAY,
+    '8 hours': 30 * DAY,
+    '1 day': 365 * DAY,
+    '1 week': 365 * DAY,
+    '1 month': 365 * DAY,
+}
+
+DURATION_UNITS = { 'S': 1, 'D': DAY, 'W': 7 * DAY, 'M': 30 * DAY, 'Y': 365 * DAY }
+
+
+def duration_seconds(duration: str) -> int:
+    """Converts an IB durationStr (e.g. '3 M') to seconds"""
+    quantity, unit = duration.split(' ')
+    return int(quantity) * DURATION_UNITS[unit.upper()]
+
+def to_duration_str(seconds: int) -> str:
+    """IB requires durations over a day to be expressed in days"""
+    return f'{seconds} S' if seconds < DAY else f'{-(-seconds // DAY)} D'
+
+def max_chunk_seconds(bar_size: str) -> int:
+    return MAX_CHUNK_SECONDS.get(bar_size, DAY)
+
+def needs_chunking(bar_size: str, duration: str) -> bool:
+    return duration_seconds(duration) > max_chunk_seconds(bar_size)
+
+
+def chunk_windows(end: datetime, duration: str, bar_size: str) -> List[Tuple[datetime, str]]:
+    """Splits a duration ending at `end` into IB-legal (endDateTime, durationStr) windows, newest first"""
+    remaining = duration_seconds(duration)
+    step = max_chunk_seconds(bar_size)
+    windows = []
+    while remaining > 0:
+        span = min(step, remaining)
+        windows.append((end, to_duration_str(span)))
+        end -= timedelta(seconds=span)
+        remaining -= span
+    return windows
+
+
+
+class ChunkStore(object):
+    """
+    On-disk progress of a chunked download. Each completed window is written to its own file in
+    `<cache path>.parts/` so an interrupted download only refetches the windows it is missing.
+    """
+    path: str
+    end: datetime
+
+    def __init__(self, path: str, end: Optional[datetime] = None, max_age: Optional[timedelta] = None):
+        """
+        `end` pins the download's end date. Without one (up to now) the first attempt's end is resumed, unless it is
+        older than `max_age`, in which case the stale partial download is dropped and started afresh.
+        """
+        self.path = path
+
+        # Anchor the windows to the first attempt's end date so a resumed download asks for the same chunks
+        manifest = os.path.join(path, 'manifest.json')
+        if os.path.isfile(manifest):
+            with open(manifest, 'r') as f: resumed = datetime.fromisoformat(json.load(f)['end'])
+            if (end is not None and resumed != end) or (end is None and max_age is not None and datetime.now() - resumed > max_age): self.clear()
+        os.makedirs(path, exist_ok=True)
+
+        if os.path.isfile(manifest): self.end = resumed
+        else:
+            self.end = end if end is not None else datetime.now().replace(microsecond=0)
+            with open(manifest, 'w') as f: json.dump({ 'end': self.end.isoformat() }, f)
+
+    def _chunk_path(self, end: datetime) -> str:
+        return os.path.join(self.path, end.strftime('%Y%m%d_%H%M%S') + '.csv')
+
+    def has(self, end: datetime) -> bool:
+        return os.path.isfile(self._chunk_path(end))
+
+    def save(self, end: datetime, df: Optional[pd.DataFrame]):
+        """Atomically records a completed window (empty windows, e.g. weekends, are recorded as empty files)"""
+        path = self._chunk_path(end)
+        tmp = path + '.tmp'
+        if df is None or df.shape[0] == 0: open(tmp, 'w').close()
+        else: df.to_csv(tmp, index=False)
+        os.replace(tmp, path)
+
+    def assemble(self) -> Optional[pd.DataFrame]:
+        """Joins every completed window into a single frame ordered by bar date"""
+        files = sorted(f for f in os.listdir(self.path) if f.endswith('.csv'))
+        frames = [pd.read_csv(os.path.join(self.path, f)) for f in files if os.path.getsize(os.path.join(self.path, f)) > 0]
+        if len(frames) == 0: return None
+
+        df = pd.concat(frames, ignore_index=True)
+        df['date'] = df['date'].astype(str)
+        return df.drop_duplicates(subset='date', keep='last').sort_values('date').reset_index(drop=True)
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,125 @@
+import asyncio, heapq, itertools, time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable, List, Tuple
+
+# Request priorities, higher values are dispatched first
+PRIORITY_BACKFILL = -10
+PRIORITY_SETUP = 0
+PRIORITY_LIVE = 10
+
+# IB only enforces the requests-per-10-minutes limit on bars of 30 seconds or less
+WINDOWED_BAR_SIZES = { '1 secs', '5 secs', '10 secs', '15 secs', '30 secs' }
+
+
+class PacingGovernor(object):
+    """
+    Schedules IB historical data requests within IB's pacing limits instead of letting them fail with pacing violations.
+    See: https://interactivebrokers.github.io/tws-api/historical_limitations.html
+        * No identical requests within `identical_spacing` seconds
+        * No more than `burst_limit` requests for the same contract/exchange/tick type within `burst_window` seconds
+        * No more than `window_limit` requests for bars of 30 seconds or less within any `window` seconds
+        * No more than `max_concurrent` requests in flight
+    Waiting requests are dispatched highest priority first (FIFO within a priority).
+    """
+    identical_spacing: float = 15
+    burst_limit: int = 5
+    burst_window: float = 2
+    window_limit: int = 60
+    window: float = 600
+    max_concurrent: int = 50
+
+    in_flight: int
+    dispatched: int
+    delayed: int
+
+    def __init__(self, max_concurrent: int = None, window_limit: int = None):
+        if max_concurrent is not None: self.max_concurrent = max_concurrent
+        if window_limit is not None: self.window_limit = window_limit
+
+        self.in_flight = 0
+        self.dispatched = 0
+        self.delayed = 0
+        self._sent: Deque[float] = deque()
+        self._identical: Dict[Hashable, float] = {}
+        self._bursts: Dict[Hashable, Deque[float]] = {}
+        self._waiting: List[Tuple[int, int, asyncio.Future, Hashable, Hashable, bool]] = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle = None
+
+
+    def _wait_time(self, key: Hashable, contract_key: Hashable, windowed: bool, now: float) -> float:
+        """Seconds until a request with the given keys may be sent (0 if it can be sent now)"""
+        if self.in_flight >= self.max_concurrent: return float('inf') # released by a completing request
+
+        while self._sent and now - self._sent[0] >= self.window: self._sent.popleft()
+        wait = 0.0
+        if windowed and len(self._sent) >= self.window_limit: wait = max(wait, self._sent[0] + self.window - now)
+
+        if key in self._identical: wait = max(wait, self._identical[key] + self.identical_spacing - now)
+
+        burst = self._bursts.get(contract_key)
+        if burst is not None:
+            while burst and now - burst[0] >= self.burst_window: burst.popleft()
+            if len(burst) >= self.burst_limit: wait = max(wait, burst[0] + self.burst_window - now)
+
+        return wait
+
+    def _record(self, key: Hashable, contract_key: Hashable, windowed: bool, now: float):
+        self.in_flight += 1
+        self.dispatched += 1
+        if windowed: self._sent.append(now)
+        self._identical = { k: sent for k, sent in self._identical.items() if now - sent < self.identical_spacing }
+        self._identical[key] = now
+        self._bursts.setdefault(contract_key, deque()).append(now)
+
+    def _dispatch(self):
+        """Releases every waiting request that can be sent now, in priority order, and schedules the next check"""
+        self._timer = None
+        now = time.monotonic()
+        next_wait = float('inf')
+
+        remaining = []
+        for item in sorted(self._waiting):
+            _, _, future, key, contract_key, windowed = item
+            if future.done(): continue
+
+            wait = self._wait_time(key, contract_key, windowed, now)
+            if wait <= 0:
+                self._record(key, contract_key, windowed, now)
+                future.set_result(True)
+            else:
+                next_wait = min(next_wait, wait)
+                remaining.append(item)
+
+        self._waiting = remaining
+        heapq.heapify(self._waiting)
+        if self._waiting and next_wait != float('inf'):
+            self._timer = asyncio.get_event_loop().call_later(next_wait, self._dispatch)
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable, contract_key: Hashable, priority: int = PRIORITY_SETUP, bar_size: str = None):
+        """
+        Waits until a request may be sent within pacing limits, then holds a concurrency slot for its duration.
+        `key` identifies identical requests, `contract_key` the contract/exchange/tick type.
+        """
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiting, (-priority, next(self._seq), future, key, contract_key, bar_size in WINDOWED_BAR_SIZES))
+        if self._timer is not None: self._timer.cancel()
+        self._dispatch()
+
+        if not future.done(): self.delayed += 1
+        try: await future
+        except asyncio.CancelledError:
+            if not future.cancelled(): self._release() # the slot was granted just before the cancellation landed
+            raise
+
+        try: yield
+        finally: self._release()
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def stats(self) -> Dict[str, int]:
+        return { 'in_flight': self.in_flight, 'waiting': len(self._waiting), 'dispatched': self.dispatched, 'delayed': self.delayed, 'sent_in_window': len(self._sent) }
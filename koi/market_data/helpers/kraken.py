@@ -1,22 +1,37 @@
-import json, time, urllib.request as urllib2, sys, platform, time, base64, hashlib, hmac, urllib
+import json, time
 from typing import List, Dict, Tuple, Union
 from dotenv import dotenv_values
 
 from koi.market_data.root import CryptoOrder
 from koi.market_data.helpers.kraken_ws import WssClient
+from koi.market_data.helpers.kraken_rest import Client as KrakenRest
 from koi.market_data.helpers.market_models import CryptoTick, KrakenTick
+from koi.market_data.helpers.order_book import OrderBook
+from koi.market_data.helpers.feed_health import FeedHealth, feed_health
+from koi.market_data.helpers.handoff import VersionedSnapshot
+from koi.market_data.quotes import QUOTES
+from koi.market_data.latency import LATENCY
 
 env = dotenv_values('.env')
 
 class Client():
     ws: WssClient
+    rest: KrakenRest
     # ws: WebSocket
     api_url = 'https://api.kraken.com'
     stream_ticks: bool
     ws_token: str
 
-    prev_tick_state: Dict[str, CryptoTick] = {}
-    latest_tick_state: Dict[str, CryptoTick] = {}
+    # Working state owned by the reactor thread, other threads read `ticks` snapshots of (prev, latest) per pair
+    prev_tick_state: Dict[str, KrakenTick] = {}
+    latest_tick_state: Dict[str, KrakenTick] = {}
+    ticks: VersionedSnapshot = VersionedSnapshot('kraken:ticks')
+    books: Dict[str, OrderBook] = {}
+    book_depth: int = 25
+    # Quiet pairs can go minutes without a book, spread or ticker change & kraken has no per-pair heartbeat, so pairs are
+    # only resynced on checksum mismatches (the connection heartbeat still catches a dead feed)
+    health: FeedHealth = feed_health('kraken', product_timeout=None)
+    stream_pairs: List[str] = []
 
     open_oders: List[Dict[str, dict]]
 
@@ -27,7 +42,11 @@ class Client():
         # Set up websocket
         ws_url = 'wss://ws-sandbox.kraken.com' if sandbox else 'wss://ws.kraken.com'
         try:
+            self.rest = KrakenRest(env['KRAKEN_API_KEY'], env['KRAKEN_API_SECRET'], api_url=env.get('KRAKEN_API_URL'))
             self.ws = WssClient(env['KRAKEN_API_KEY'], env['KRAKEN_API_SECRET'])
+            self.ws.health = self.health
+            self.ws.reconnect_callbacks.append(self._on_reconnect)
+            self.ws.token_provider = self.rest.ws_token
             self.ws.start()
 
             # Acquire token
@@ -55,16 +74,9 @@ class Client():
 
     # Helpers
     def _configure_token(self) -> str:
-        token_url = 'https://api.kraken.com/0/private/GetWebSocketsToken'
-        # req = requests.get(token_url, headers={
-        #     'API-Key': KRAKEN_API_KEY,
-        #     'API-Sign': ''
-        # })
-        api_nonce = bytes(str(int(time.time()*1000)), "utf-8")
-        api_request = urllib.request.Request(token_url, b"nonce=%s" % api_nonce)
-        api_request.add_header("API-Key", env['KRAKEN_API_KEY'])
-        api_request.add_header("API-Sign", base64.b64encode(hmac.new(base64.b64decode(env['KRAKEN_API_SECRET']), b"/0/private/GetWebSocketsToken" + hashlib.sha256(api_nonce + b"nonce=%s" % api_nonce).digest(), hashlib.sha512).digest()))
-        self.ws_token = json.loads(urllib.request.urlopen(api_request).read())['result']['token']
+        self.ws_token = self.rest.ws_token()
+        self.rest.keep_token_fresh()
+        return self.ws_token
 
     def _sanitize_pair(self, symbol: str) -> str:
         return symbol.replace('-', '/').replace('BTC', 'XBT')
@@ -72,20 +84,35 @@ class Client():
         return symbol.replace('/', '-').replace('XBT', 'BTC')
 
 
+    # Feed Health
+    def resync_product(self, symbol: str):
+        """Rebuilds a single pair's book from a fresh snapshot without touching the rest of the connection"""
+        if symbol in self.books: self.books[symbol].reset()
+        self.ws.resubscribe_public({ 'name': 'book', 'depth': self.book_depth }, self._sanitize_pair(symbol))
+
+    def _on_reconnect(self, private: bool):
+        # Replayed subscriptions resend snapshots, drop anything received before the disconnect
+        if private: return
+        for book in self.books.values(): book.reset()
+        self.prev_tick_state.clear()
+        self.latest_tick_state.clear()
+        self.ticks.clear()
+
+
     # Ticks
     def has_symbol_tick_data(self, symbol: str) -> bool:
-        return self._sanitize_pair(symbol) in self.latest_tick_state
+        return self._sanitize_pair(symbol) in self.ticks.snapshot()
 
     def get_symbol_tick_data(self, symbol: str) -> Tuple[KrakenTick, KrakenTick]:
-        pair = self._sanitize_pair(symbol)
-        if not self.has_symbol_tick_data(pair): return None
-        return (self.prev_tick_state[pair], self.latest_tick_state[pair])
+        return self.ticks.get(self._sanitize_pair(symbol))
 
     def handle_tick_data(self, msg: Union[list, dict]):
         if not isinstance(msg, list) or len(msg) < 4: return
 
         data, channel, symbol = msg[1], msg[2], msg[3]
         tick = KrakenTick(data, self._desanitize_pair(symbol))
+        self.health.message(tick.product)
+        QUOTES.update(tick.product, tick.bid, tick.ask, 'kraken')
 
         if symbol in self.latest_tick_state:
             self.prev_tick_state[symbol] = self.latest_tick_state[symbol]
@@ -93,14 +120,40 @@ class Client():
         else:
             self.prev_tick_state[symbol] = tick
             self.latest_tick_state[symbol] = tick
+        self.ticks.put(symbol, (self.prev_tick_state[symbol], tick))
 
-    def _handle_spread_data(self, msg: dict):
-        if isinstance(msg, dict) and 'event' in msg and msg['event'] in ['heartbeat', 'systemStatus']: return
-        pass
+    def _handle_spread_data(self, msg: Union[list, dict]):
+        if not isinstance(msg, list) or len(msg) < 4: return
+
+        # [channelID, [bid, ask, timestamp, bidVolume, askVolume], 'spread', pair]
+        bid, ask, timestamp = msg[1][0], msg[1][1], float(msg[1][2])
+        symbol = self._desanitize_pair(msg[3])
+        self.health.message(symbol)
+        LATENCY.record('kraken', symbol, timestamp)
+        QUOTES.update(symbol, bid, ask, 'kraken', timestamp)
+
+    def handle_book_data(self, msg: Union[list, dict]):
+        if not isinstance(msg, list) or len(msg) < 4: return
+
+        # [channelID, {as, bs}, 'book-25', pair] for snapshots
+        # [channelID, {a}, ({b, c},) 'book-25', pair] for updates
+        payloads, symbol = msg[1:-2], self._desanitize_pair(msg[-1])
+        if symbol not in self.books: self.books[symbol] = OrderBook(symbol, self.book_depth)
+        book = self.books[symbol]
+
+        self.health.message(symbol)
+        if 'as' in payloads[0] or 'bs' in payloads[0]:
+            book.apply_kraken_snapshot(payloads[0])
+        elif book.initialized and not book.apply_kraken_update(payloads):
+            print(f'Kraken Client: {symbol} book checksum mismatch, resyncing')
+            self.health.gap(symbol)
+            self.health.resynced(symbol)
+            self.resync_product(symbol)
 
     def start_tick_streaming(self, pairs: List[str]):
         if self.ws is None: raise Exception('No Active Kraken WS Connection')
         self.stream_ticks = True
+        self.stream_pairs = pairs
         print('start_tick_streaming:', pairs)
 
         self.ws.subscribe_public(
@@ -113,6 +166,12 @@ class Client():
             pair=[self._sanitize_pair(p) for p in pairs],
             callback=self._handle_spread_data
         )
+        self.ws.subscribe_public(
+            subscription={ 'name': 'book', 'depth': self.book_depth },
+            pair=[self._sanitize_pair(p) for p in pairs],
+            callback=self.handle_book_data
+        )
+        self.health.watch(lambda: self.stream_pairs, self.resync_product, self.ws.reconnect, lambda: self.stream_ticks)
 
 
 
@@ -143,20 +202,20 @@ class Client():
         if self.ws is None: raise Exception('No Active Kraken WS Connection')
         print('\nAdding Crypto Order:', order)
 
-        res = self.ws.request(
+        reqid = self.ws.request(
             request={
                 'event': "addOrder",
                 'ordertype': "limit",
                 'pair': self._sanitize_pair(order.symbol),
                 'price': f'{order.price}',
-                'token': self.ws_token,
+                'token': self.rest.ws_token(),
                 'type': order.side,
                 'volume': f'{round(order.quantity, 8)}'
             },
             callback=self.handle_add_order_cb
         )
 
-        print('add_order res:', res)
+        print('add_order reqid:', reqid)
 
 
 
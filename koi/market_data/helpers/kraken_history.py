@@ -0,0 +1,114 @@
+import asyncio, math
+import pandas as pd
+from typing import List, Optional, Tuple
+
+from koi.market_data.helpers.kraken_rest import Client as KrakenRest
+
+BAR_COLUMNS = ['unix', 'low', 'high', 'open', 'close', 'volume']
+
+
+class KrakenHistory(object):
+    """
+    Historical bars from Kraken itself.
+        * OHLC is used when the range fits inside the 720 most recent candles Kraken serves for a supported interval
+        * Anything longer (or an unsupported interval) is rebuilt from the Trades endpoint: the range is split into
+          slices paginated concurrently with `since` cursors, all spending from the client's shared rate limiter
+
+    Trades paging is rate bound: Kraken serves at most 1000 trades per page and public calls are limited to ~1/sec
+    (after a burst of `public_limit.capacity`), so slicing only overlaps request round trips up to that burst and a
+    long or busy range still costs about one second per page. Kraken has no bulk trade/OHLC download over the api,
+    so ranges beyond the OHLC window should be kept short (or backfilled once & cached).
+    """
+    ohlc_intervals = [1, 5, 15, 30, 60, 240, 1440, 10080, 21600] # minutes
+    ohlc_max_candles: int = 720
+    trade_slices: int # defaults to the public limiter's burst capacity, more slices would only queue on it
+
+    rest: KrakenRest
+    pages: int
+
+    def __init__(self, rest: KrakenRest, trade_slices: int = None):
+        self.rest = rest
+        self.trade_slices = trade_slices if trade_slices is not None else max(1, int(rest.public_limit.capacity))
+        self.pages = 0
+
+
+    def _result_rows(self, result: dict) -> list:
+        return next(v for k, v in result.items() if k != 'last')
+
+    def uses_ohlc(self, granularity: int, start: float, end: float) -> bool:
+        if granularity % 60 != 0 or granularity // 60 not in self.ohlc_intervals: return False
+        oldest_available = math.floor(end / granularity) * granularity - self.ohlc_max_candles * granularity
+        return start >= oldest_available
+
+
+    # OHLC
+    async def ohlc(self, pair: str, granularity: int, start: float, end: float) -> pd.DataFrame:
+        """Candles from the OHLC endpoint, following `last` until the end of the range"""
+        rows, since = [], int(start) - 1
+        while True:
+            result = await self.rest.public_async('OHLC', { 'pair': pair, 'interval': granularity // 60, 'since': since })
+            self.pages += 1
+            page = self._result_rows(result)
+            rows += page
+            last = int(result['last'])
+            if len(page) == 0 or last <= since or last >= end: break
+            since = last
+
+        # [time, open, high, low, close, vwap, volume, count]
+        df = pd.DataFrame([(int(r[0]), float(r[3]), float(r[2]), float(r[1]), float(r[4]), float(r[6])) for r in rows], columns=BAR_COLUMNS)
+        df = df.drop_duplicates(subset='unix', keep='last')
+        return df[(df['unix'] >= start) & (df['unix'] < end)].sort_values('unix').reset_index(drop=True)
+
+
+    # Trades
+    async def _trade_slice(self, pair: str, start: float, end: float) -> List[Tuple[float, float, float]]:
+        """Paginates trades forward from `start` until the first trade at or after `end`"""
+        trades, since = [], int(start * 1e9)
+        while True:
+            result = await self.rest.public_async('Trades', { 'pair': pair, 'since': since })
+            self.pages += 1
+            page = self._result_rows(result)
+
+            # [price, volume, time, side, type, misc, (trade_id)]
+            for t in page:
+                if float(t[2]) >= end: return trades
+                trades.append((float(t[2]), float(t[0]), float(t[1])))
+
+            last = int(result['last'])
+            if len(page) == 0 or last <= since: return trades
+            since = last
+
+    async def trades(self, pair: str, granularity: int, start: float, end: float) -> pd.DataFrame:
+        """Bars aggregated from raw trades, empty bars carry the previous close forward with no volume"""
+        bounds = [start + (end - start) * i / self.trade_slices for i in range(self.trade_slices + 1)]
+        slices = await asyncio.gather(*[self._trade_slice(pair, bounds[i], bounds[i + 1]) for i in range(self.trade_slices)])
+        trades = pd.DataFrame([t for s in slices for t in s], columns=['time', 'price', 'volume'])
+        if trades.shape[0] == 0: return pd.DataFrame(columns=BAR_COLUMNS)
+
+        trades['unix'] = (trades['time'] // granularity * granularity).astype(int)
+        grouped = trades.sort_values('time').groupby('unix')
+        bars = pd.DataFrame({
+            'low': grouped['price'].min(),
+            'high': grouped['price'].max(),
+            'open': grouped['price'].first(),
+            'close': grouped['price'].last(),
+            'volume': grouped['volume'].sum(),
+        })
+
+        index = range(int(bars.index[0]), int(bars.index[-1]) + 1, granularity)
+        bars = bars.reindex(index)
+        bars['close'] = bars['close'].ffill()
+        for col in ['low', 'high', 'open']: bars[col] = bars[col].fillna(bars['close'])
+        bars['volume'] = bars['volume'].fillna(0)
+        return bars.rename_axis('unix').reset_index()[BAR_COLUMNS]
+
+
+    async def bars(self, symbol: str, pair: str, granularity: int, start: float, end: float) -> Tuple[str, Optional[pd.DataFrame]]:
+        source = 'OHLC' if self.uses_ohlc(granularity, start, end) else 'Trades'
+        try: df = await (self.ohlc(pair, granularity, start, end) if source == 'OHLC' else self.trades(pair, granularity, start, end))
+        except Exception as e:
+            print(f'KrakenHistory:{symbol} {source} error:', e)
+            return (symbol, None)
+
+        print(f'KrakenHistory:{symbol}: {df.shape[0]} bars from {source} ({self.pages} pages so far, {self.rest.public_limit.waited:.1f}s rate limited)')
+        return (symbol, df)
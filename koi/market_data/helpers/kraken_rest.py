@@ -0,0 +1,160 @@
+import asyncio, base64, hashlib, hmac, threading, time, urllib.parse
+import concurrent.futures
+from typing import Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class NonceGenerator(object):
+    """Strictly increasing microsecond nonces, safe to share between threads"""
+    last: int
+
+    def __init__(self):
+        self.last = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> int:
+        with self._lock:
+            self.last = max(time.time_ns() // 1000, self.last + 1)
+            return self.last
+
+
+
+class RateLimiter(object):
+    """
+    Token bucket mirroring Kraken's call counters: each call spends `cost` from a bucket of `capacity`
+    that refills at `rate` per second. Shared by every thread using a client so concurrent fetches stay under the limit.
+    """
+    capacity: float
+    rate: float
+    tokens: float
+    waited: float
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.waited = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cost: float = 1):
+        """Blocks until `cost` tokens are available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                wait = (cost - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+
+
+class Client(object):
+    """
+    Kraken REST client over a persistent keep-alive connection pool.
+    Private calls reuse an established TLS connection, so each call costs a single round trip.
+    """
+    api_url = 'https://api.kraken.com'
+    api_version = '0'
+    timeout: float = 10
+
+    # Websocket tokens expire 15 minutes after issue unless a connection is opened with them
+    token_ttl: float = 15 * 60
+    token_refresh_margin: float = 3 * 60
+
+    key: Optional[str]
+    secret: Optional[str]
+    session: requests.Session
+    nonce: NonceGenerator
+    public_limit: RateLimiter
+    private_limit: RateLimiter
+
+    def __init__(self, key: str = None, secret: str = None, api_url: str = None, pool_size: int = 8):
+        self.key = key
+        self.secret = secret
+        if api_url is not None: self.api_url = api_url
+        self.nonce = NonceGenerator()
+
+        # Public endpoints allow roughly 1 call/sec, private calls spend from a counter of 15 decaying at 0.33/sec (starter tier)
+        self.public_limit = RateLimiter(capacity=3, rate=1)
+        self.private_limit = RateLimiter(capacity=15, rate=0.33)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({ 'User-Agent': 'koi', 'Connection': 'keep-alive' })
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size)
+
+        self._token: Optional[str] = None
+        self._token_issued: float = 0
+        self._token_lock = threading.Lock()
+        self._refresh_timer: Optional[threading.Timer] = None
+
+
+    # Helpers
+    def _sign(self, path: str, data: Dict[str, str]) -> str:
+        postdata = urllib.parse.urlencode(data)
+        message = path.encode() + hashlib.sha256((str(data['nonce']) + postdata).encode()).digest()
+        return base64.b64encode(hmac.new(base64.b64decode(self.secret), message, hashlib.sha512).digest()).decode()
+
+    def _handle(self, res: requests.Response) -> dict:
+        res.raise_for_status()
+        body = res.json()
+        if body.get('error'): raise Exception(f'Kraken API error: {body["error"]}')
+        return body['result']
+
+
+    # Requests
+    def public(self, method: str, params: Dict[str, str] = None) -> dict:
+        self.public_limit.acquire()
+        url = f'{self.api_url}/{self.api_version}/public/{method}'
+        return self._handle(self.session.get(url, params=params or {}, timeout=self.timeout))
+
+    def private(self, method: str, data: Dict[str, str] = None, cost: float = 1) -> dict:
+        if self.key is None or self.secret is None: raise Exception('Kraken API key & secret required for private calls')
+        self.private_limit.acquire(cost)
+
+        path = f'/{self.api_version}/private/{method}'
+        data = dict(data or {}, nonce=self.nonce.next())
+        headers = { 'API-Key': self.key, 'API-Sign': self._sign(path, data) }
+        return self._handle(self.session.post(self.api_url + path, data=data, headers=headers, timeout=self.timeout))
+
+    async def public_async(self, method: str, params: Dict[str, str] = None) -> dict:
+        return await asyncio.get_event_loop().run_in_executor(self.executor, self.public, method, params)
+
+    async def private_async(self, method: str, data: Dict[str, str] = None) -> dict:
+        return await asyncio.get_event_loop().run_in_executor(self.executor, self.private, method, data)
+
+
+    # Websocket tokens
+    def ws_token(self, force: bool = False) -> str:
+        """Returns a cached websocket token, only hitting the api when the cached one is near expiry"""
+        with self._token_lock:
+            age = time.time() - self._token_issued
+            if force or self._token is None or age > self.token_ttl - self.token_refresh_margin:
+                self._token = self.private('GetWebSocketsToken')['token']
+                self._token_issued = time.time()
+            return self._token
+
+    def keep_token_fresh(self):
+        """Proactively refreshes the websocket token in the background ahead of its expiry"""
+        def refresh():
+            try: self.ws_token(force=True)
+            except Exception as e: print('Kraken REST: token refresh error:', e)
+            self.keep_token_fresh()
+
+        if self._refresh_timer is not None: self._refresh_timer.cancel()
+        self._refresh_timer = threading.Timer(self.token_ttl - self.token_refresh_margin, refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def close(self):
+        if self._refresh_timer is not None: self._refresh_timer.cancel()
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -3,6 +3,8 @@ import threading
 import json
 import hmac
 import hashlib
+from urllib.parse import urlparse
+from dotenv import dotenv_values
 from autobahn.twisted.websocket import WebSocketClientFactory, \
     WebSocketClientProtocol, \
     connectWS
@@ -10,27 +12,45 @@ from twisted.internet import reactor, ssl
 from twisted.internet.protocol import ReconnectingClientFactory
 from twisted.internet.error import ReactorAlreadyRunning
 
+from koi.market_data.helpers.market_models import json_loads
+
+env = dotenv_values('.env')
+
+HEARTBEAT_PAYLOAD = b'{"event":"heartbeat"}'
+
 
 class KrakenClientProtocol(WebSocketClientProtocol):
 
-    def __init__(self, factory, payload=None):
+    def __init__(self, factory):
         super().__init__()
         self.factory = factory
-        self.payload = payload
 
     def onOpen(self):
         self.factory.protocol_instance = self
+        if self.factory.opened: self.factory.base_client._reconnected(self.factory)
+        self.factory.opened = True
+
+        # (re)send every subscription multiplexed over this connection, then any queued requests
+        for payload in self.factory.subscriptions + self.factory.pending:
+            self.sendMessage(payload, isBinary=False)
+        self.factory.pending = []
 
     def onConnect(self, response):
-        if self.payload:
-            self.sendMessage(self.payload, isBinary=False)
         # reset the delay after reconnecting
         self.factory.resetDelay()
 
+    def onClose(self, wasClean, code, reason):
+        if self.factory.protocol_instance is self: self.factory.protocol_instance = None
+
     def onMessage(self, payload, isBinary):
         if not isBinary:
+            health = self.factory.base_client.health
+            if health is not None: health.message()
+
+            # Heartbeats are by far the most common system frame and carry no data
+            if payload == HEARTBEAT_PAYLOAD: return
             try:
-                payload_obj = json.loads(payload.decode('utf8'))
+                payload_obj = json_loads(payload)
             except ValueError:
                 pass
             else:
@@ -48,12 +68,18 @@ class KrakenReconnectingClientFactory(ReconnectingClientFactory):
 
 
 class KrakenClientFactory(WebSocketClientFactory, KrakenReconnectingClientFactory):
+    """
+    Factory for a single multiplexed connection.
+    `subscriptions` are replayed on every (re)connect, `pending` holds one-off requests until connected.
+    """
 
-    def __init__(self, *args, payload=None, **kwargs):
+    def __init__(self, *args, **kwargs):
         WebSocketClientFactory.__init__(self, *args, **kwargs)
         self.protocol_instance = None
         self.base_client = None
-        self.payload = payload
+        self.subscriptions = []
+        self.pending = []
+        self.opened = False
 
     protocol = KrakenClientProtocol
     _reconnect_error_payload = {
@@ -61,6 +87,17 @@ class KrakenClientFactory(WebSocketClientFactory, KrakenReconnectingClientFactor
         'm': 'Max reconnect retries reached'
     }
 
+    def send(self, payload, persistent=False):
+        """Sends a payload over the connection. Must be called from the reactor thread"""
+        if persistent: self.subscriptions.append(payload)
+
+        if self.protocol_instance is not None: self.protocol_instance.sendMessage(payload, isBinary=False)
+        elif not persistent: self.pending.append(payload)
+
+    def drop(self):
+        """Drops a (possibly half-open) connection so the factory reconnects. Must be called from the reactor thread"""
+        if self.protocol_instance is not None: self.protocol_instance.dropConnection(abort=True)
+
     def clientConnectionFailed(self, connector, reason):
         self.retry(connector)
         if self.retries > self.maxRetries:
@@ -72,14 +109,25 @@ class KrakenClientFactory(WebSocketClientFactory, KrakenReconnectingClientFactor
             self.callback(self._reconnect_error_payload)
 
     def buildProtocol(self, addr):
-        return KrakenClientProtocol(self, payload=self.payload)
+        return KrakenClientProtocol(self)
 
 
 class KrakenSocketManager(threading.Thread):
-
-    STREAM_URL = 'wss://ws.kraken.com'
+    """
+    Owns at most two connections: one public and one authenticated private connection.
+    All subscriptions are multiplexed over them and incoming messages are routed to
+    subscriber callbacks by channel id (falling back to channel name + pair), while
+    order requests are correlated with their responses by `reqid`.
+    """
+
+    # Endpoints can be overridden (e.g. to point at koi.simulator)
+    STREAM_URL = env.get('KRAKEN_WS_URL') or 'wss://ws.kraken.com'
     SANDBOX_STREAM_URL = 'wss://ws-sandbox.kraken.com'
-    PRIVATE_STREAM_URL = 'wss://ws-auth.kraken.com'
+    PRIVATE_STREAM_URL = env.get('KRAKEN_WS_AUTH_URL') or 'wss://ws-auth.kraken.com'
+
+    PUBLIC = 'public'
+    PRIVATE = 'private'
+    SYSTEM_EVENTS = ['heartbeat', 'systemStatus', 'pong']
 
     def __init__(self):  # client
         """Initialise the KrakenSocketManager"""
@@ -87,41 +135,150 @@ class KrakenSocketManager(threading.Thread):
         self.factories = {}
         self._connected_event = threading.Event()
         self._conns = {}
-        self._user_timer = None
-        self._user_listen_key = None
-        self._user_callback = None
-
-    def _start_socket(self, id_, payload, callback, private=False):
-        if id_ in self._conns:
-            return False
+        self._lock = threading.Lock()
+
+        # Routing tables
+        self._routes = {}           # (channel name, pair) -> callback for public channels
+        self._channels = {}         # channel id -> callback, learned from subscriptionStatus events
+        self._private_routes = {}   # channel name -> callback for private channels
+        self._requests = {}         # reqid -> callback for order requests
+        self._reqid = 0
+        self._private_payloads = {} # channel name -> subscribe payload, replayed on reconnect
+        self._private_subscriptions = {} # channel name -> subscription, resubscribed when a sequence gap is detected
+
+        # Optional FeedHealth tracking messages, private channel sequences & reconnects
+        self.health = None
+        self.reconnect_callbacks = []
+
+        # Optional callable returning a current websocket token (e.g. kraken_rest's ws_token), used when resubscribing
+        self.token_provider = None
+
+    def _connection(self, private):
+        """Returns the factory for the public/private connection, opening it on first use"""
+        id_ = self.PRIVATE if private else self.PUBLIC
+        with self._lock:
+            if id_ in self.factories: return self.factories[id_]
+
+            factory_url = self.PRIVATE_STREAM_URL if private else self.STREAM_URL
+            factory = KrakenClientFactory(factory_url)
+            factory.base_client = self
+            factory.protocol = KrakenClientProtocol
+            factory.callback = self._route_private if private else self._route_public
+            factory.reconnect = True
+            self.factories[id_] = factory
 
-        if private:
-            factory_url = self.PRIVATE_STREAM_URL
-        else:
-            factory_url = self.STREAM_URL
-
-        factory = KrakenClientFactory(factory_url, payload=payload)
-        factory.base_client = self
-        factory.protocol = KrakenClientProtocol
-        factory.callback = callback
-        factory.reconnect = True
-        self.factories[id_] = factory
         reactor.callFromThread(self.add_connection, id_, factory_url)
+        return factory
+
+    def _send(self, payload, private=False, persistent=False):
+        factory = self._connection(private)
+        reactor.callFromThread(factory.send, payload, persistent)
+
+    def _reconnected(self, factory):
+        """Called on the reactor thread when a connection reopens, before its subscriptions are replayed"""
+        if self.health is not None: self.health.reconnected()
+        private = factory is self.factories.get(self.PRIVATE)
+        for callback in self.reconnect_callbacks: callback(private)
+
+    def reconnect(self, private=False):
+        """Drops a connection and lets the reconnecting factory reopen it"""
+        factory = self.factories.get(self.PRIVATE if private else self.PUBLIC)
+        if factory is not None: reactor.callFromThread(factory.drop)
 
     def add_connection(self, id_, url):
         """
         Convenience function to connect and store the resulting
         connector.
         """
-        if not url.startswith("wss://"):
-            raise ValueError("expected wss:// URL prefix")
-
-        hostname = url[6:]
+        if not url.startswith("wss://") and not url.startswith("ws://"):
+            raise ValueError("expected wss:// or ws:// URL prefix")
 
         factory = self.factories[id_]
-        options = ssl.optionsForClientTLS(hostname=hostname) # for TLS SNI
+        if url.startswith("ws://"): # plain connections are only used against local simulators
+            self._conns[id_] = connectWS(factory)
+            return
+
+        options = ssl.optionsForClientTLS(hostname=urlparse(url).hostname) # for TLS SNI
         self._conns[id_] = connectWS(factory, options)
 
+
+    # Routing
+    def _route_public(self, msg):
+        if isinstance(msg, dict): return self._route_event(msg)
+        if not isinstance(msg, list) or len(msg) < 4: return
+
+        # [channelID, payload(s)..., channelName, pair]
+        callback = self._channels.get(msg[0])
+        if callback is None: callback = self._routes.get((msg[-2].split('-')[0], msg[-1]))
+        if callback is not None: callback(msg)
+
+    def _route_private(self, msg):
+        if isinstance(msg, dict): return self._route_event(msg)
+        if not isinstance(msg, list) or len(msg) < 2: return
+
+        # [payload, channelName, {sequence}]
+        if self.health is not None and isinstance(msg[-1], dict) and 'sequence' in msg[-1]:
+            if self.health.sequence(f'private:{msg[1]}', msg[-1]['sequence']) > 0 and msg[1] in self._private_subscriptions:
+                # Resubscribing resends the channel's snapshot
+                print(f'KrakenSocketManager: {msg[1]} sequence gap, resubscribing')
+                self.health.resynced(f'private:{msg[1]}')
+                self._resubscribe_private(msg[1])
+
+        callback = self._private_routes.get(msg[1])
+        if callback is not None: callback(msg)
+
+    def _resubscribe_private(self, name):
+        """
+        Unsubscribes a private channel, then subscribes again with a current token (kraken rejects a subscribe for a
+        channel that is still subscribed). Runs on the reactor thread, the token is fetched off it.
+        """
+        subscription = self._private_subscriptions[name]
+        self.factories[self.PRIVATE].send(self._payload('unsubscribe', subscription))
+
+        def fetch_token():
+            token = subscription.get('token')
+            try:
+                if self.token_provider is not None: token = self.token_provider()
+            except Exception as e: print(f'KrakenSocketManager: {name} token refresh error:', e)
+            reactor.callFromThread(self._subscribe_private_with, name, token)
+        reactor.callInThread(fetch_token)
+
+    def _subscribe_private_with(self, name, token):
+        """Subscribes a private channel with `token`, replacing the payload replayed on reconnect. Reactor thread only"""
+        subscription = dict(self._private_subscriptions[name], token=token)
+        payload = self._payload('subscribe', subscription)
+        factory = self.factories[self.PRIVATE]
+        factory.subscriptions = [payload if p == self._private_payloads[name] else p for p in factory.subscriptions]
+        self._private_subscriptions[name] = subscription
+        self._private_payloads[name] = payload
+        factory.send(payload)
+
+    @staticmethod
+    def _payload(event, subscription, **kwargs):
+        data = { 'event': event, 'subscription': subscription }
+        data.update(**kwargs)
+        return json.dumps(data, ensure_ascii=False).encode('utf8')
+
+    def _route_event(self, msg):
+        event = msg.get('event')
+        if event in self.SYSTEM_EVENTS: return
+
+        if event == 'subscriptionStatus':
+            if msg.get('status') == 'subscribed' and 'channelID' in msg:
+                callback = self._routes.get((msg['subscription']['name'], msg.get('pair')))
+                if callback is not None: self._channels[msg['channelID']] = callback
+            elif msg.get('status') == 'error':
+                print('KrakenSocketManager: subscription error:', msg.get('errorMessage'), msg.get('pair', ''))
+            return
+
+        if 'reqid' in msg:
+            callback = self._requests.pop(msg['reqid'], None)
+            if callback is not None: callback(msg)
+        elif msg.get('e') == 'error':
+            # Reconnect failures are broadcast to every subscriber
+            for callback in set(self._routes.values()) | set(self._private_routes.values()): callback(msg)
+
+
     def stop_socket(self, conn_key):
         """Stop a websocket given the connection key
 
@@ -139,9 +296,10 @@ class KrakenSocketManager(threading.Thread):
             return
 
         # disable reconnecting if we are closing
-        self._conns[conn_key].factory = WebSocketClientFactory(self.STREAM_URL)
+        self.factories[conn_key].stopTrying()
         self._conns[conn_key].disconnect()
         del self._conns[conn_key]
+        del self.factories[conn_key]
 
     def run(self):
         try:
@@ -187,20 +345,31 @@ class WssClient(KrakenSocketManager):
         self._subscribe(subscription, callback, True, **kwargs)
 
     def _subscribe(self, subscription, callback, private, **kwargs):
-        if 'pair' in kwargs:
-            id_ = "_".join([subscription['name'], kwargs['pair'][0]])
+        if private:
+            self._private_routes[subscription['name']] = callback
         else:
-            id_ = "_".join([subscription['name']])
+            for pair in kwargs.get('pair', [None]):
+                self._routes[(subscription['name'], pair)] = callback
 
-        data = {
-            'event': 'subscribe',
-            'subscription': subscription,
-        }
-        data.update(**kwargs)
-        payload = json.dumps(data, ensure_ascii=False).encode('utf8')
-        return self._start_socket(id_, payload, callback, private=private)
+        payload = self._payload('subscribe', subscription, **kwargs)
+        if private:
+            self._private_subscriptions[subscription['name']] = subscription
+            self._private_payloads[subscription['name']] = payload
+        return self._send(payload, private=private, persistent=True)
+
+    def resubscribe_public(self, subscription, pair):
+        """Unsubscribes & resubscribes a single pair, making kraken resend that channel's snapshot"""
+        for event in ['unsubscribe', 'subscribe']:
+            payload = json.dumps({ 'event': event, 'subscription': subscription, 'pair': [pair] }, ensure_ascii=False).encode('utf8')
+            self._send(payload, private=False, persistent=False)
 
     def request(self, request, callback, **kwargs):
-        id_ = "_".join([request['event'], request['type']])
-        payload = json.dumps(request, ensure_ascii=False).encode('utf8')
-        return self._start_socket(id_, payload, callback, private=True)
\ No newline at end of file
+        """Sends a request over the private connection, returning the `reqid` its response will be routed by"""
+        with self._lock:
+            self._reqid += 1
+            reqid = self._reqid
+
+        self._requests[reqid] = callback
+        payload = json.dumps(dict(request, reqid=reqid), ensure_ascii=False).encode('utf8')
+        self._send(payload, private=True, persistent=False)
+        return reqid
@@ -1,22 +1,44 @@
-import datetime as dt
+import datetime as dt, time as _time
 from typing import Union
 
+# Prefer orjson for feed decoding when available, it parses ticker payloads several times faster
+try: from orjson import loads as json_loads
+except ImportError: from json import loads as json_loads
+
+
+def _num(value: Union[str, float, int, None]) -> float:
+    """Parses a numeric feed field once, mapping missing/empty values to nan"""
+    if value is None or value == '': return float('nan')
+    return float(value)
+
+def json_num(value: float):
+    """nan -> None for payloads serialized to JSON (e.g. for the UI), where NaN isn't valid"""
+    return None if value != value else value
+
+
 class CryptoTick(object):
+    """Coinbase-style ticker record. Numeric fields are parsed to floats once on ingestion."""
+    __slots__ = ('product_id', 'sequence', 'trade_id', 'price', 'open_24h', 'volume_24h', 'low_24h', 'high_24h', 'volume_30d', 'best_bid', 'best_ask', 'side', 'time', 'last_size')
+
     product_id: str
-    price: str
-    open_24h: str
-    volume_24h: str
-    low_24h: str
-    high_24h: str
-    volume_30d: str
-    best_bid: str
-    best_ask: str
+    sequence: int
+    trade_id: int
+    price: float
+    open_24h: float
+    volume_24h: float
+    low_24h: float
+    high_24h: float
+    volume_30d: float
+    best_bid: float
+    best_ask: float
     side: str
     time: str
-    last_size: str
+    last_size: float
 
-    def __init__(self, type: str, sequence: str, trade_id: str, product_id: str, price: str, open_24h: str, volume_24h: str, low_24h: str, high_24h: str, volume_30d: str, best_bid: str, best_ask: str, side: str, time: str, last_size: str):
+    def __init__(self, type: str, sequence: int, trade_id: int, product_id: str, price: float, open_24h: float, volume_24h: float, low_24h: float, high_24h: float, volume_30d: float, best_bid: float, best_ask: float, side: str, time: str, last_size: float):
         self.product_id = product_id
+        self.sequence = sequence
+        self.trade_id = trade_id
         self.price = price
         self.open_24h = open_24h
         self.volume_24h = volume_24h
@@ -31,14 +53,19 @@ class CryptoTick(object):
 
     @classmethod
     def from_json(cls, data: dict):
-        return cls(**data)
+        get = data.get
+        return cls(
+            '', get('sequence', 0), get('trade_id', 0), data['product_id'],
+            _num(get('price')), _num(get('open_24h')), _num(get('volume_24h')), _num(get('low_24h')), _num(get('high_24h')), _num(get('volume_30d')),
+            _num(get('best_bid')), _num(get('best_ask')), get('side', ''), get('time', ''), _num(get('last_size'))
+        )
 
     @classmethod
     def from_rh_data(cls, data: dict, symbol: str):
         return cls(
-            type='', sequence='', trade_id=data["id"], product_id=symbol,
-            price=data['mark_price'], open_24h=data['open_price'], volume_24h=data["volume"], low_24h=data["low_price"], high_24h=data["high_price"], volume_30d="",
-            best_bid=data["bid_price"], best_ask=data["ask_price"], side='buy', time='', last_size=''
+            type='', sequence=0, trade_id=data["id"], product_id=symbol,
+            price=_num(data['mark_price']), open_24h=_num(data['open_price']), volume_24h=_num(data["volume"]), low_24h=_num(data["low_price"]), high_24h=_num(data["high_price"]), volume_30d=float('nan'),
+            best_bid=_num(data["bid_price"]), best_ask=_num(data["ask_price"]), side='buy', time='', last_size=float('nan')
         )
 
 
@@ -79,6 +106,9 @@ class TickData(object):
 
 """
 class KrakenTick(object):
+    """Kraken ticker record. `time` is the local receipt epoch, formatted lazily via `iso_time`"""
+    __slots__ = ('product', 'ask', 'ask_size', 'bid', 'bid_size', 'high', 'low', 'close', 'open', 'time')
+
     product: str
     ask: float
     ask_size: int
@@ -88,20 +118,24 @@ class KrakenTick(object):
     low: float
     close: float
     open: float
-    time: str
+    time: float
 
-    def __init__(self, data: dict, product: str):
+    def __init__(self, data: dict, product: str, received: float = None):
         self.product = product
 
-        self.ask = float(data['a'][0])
-        self.ask_size = int(data['a'][1])
-        self.bid = float(data['b'][0])
-        self.bid_size = int(data['b'][1])
+        a, b = data['a'], data['b']
+        self.ask = float(a[0])
+        self.ask_size = int(a[1])
+        self.bid = float(b[0])
+        self.bid_size = int(b[1])
         self.high = float(data['h'][1])
         self.low = float(data['l'][1])
         self.close = float(data['c'][0])
         self.open = float(data['o'][1])
-        self.time = dt.datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        self.time = received if received is not None else _time.time()
+
+    def iso_time(self) -> str:
+        return dt.datetime.fromtimestamp(self.time).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
 
 
 
@@ -162,6 +196,17 @@ class CryptoOrderStatus(object):
             self.settled = (data['state'] == 'filled')
             self.failed = (data['state'] in ['rejected', 'canceled', 'failed'])
 
+        elif exchange == 'coinbase':
+            if 'id' not in data: raise Exception(f'No id provided in ', data)
+            self.id = data['id']
+            self.fees = self.validate_numeric_field(data, 'fill_fees')
+            self.fill_quantity = self.validate_numeric_field(data, 'filled_size')
+            self.executed_value = self.validate_numeric_field(data, 'executed_value')
+            self.price = self.executed_value / self.fill_quantity if self.fill_quantity > 0 else 0
+            self.state = data.get('status', '')
+            self.settled = bool(data.get('settled', False)) and data.get('done_reason', 'filled') == 'filled'
+            self.failed = self.state == 'rejected' or (self.state == 'done' and data.get('done_reason') == 'canceled')
+
     def validate_numeric_field(self, data: dict, field: str, default: Union[float, int] = 0) -> Union[float, int]:
         if field in data:
             if isinstance(data[field], int) or isinstance(data[field], float): return data[field]
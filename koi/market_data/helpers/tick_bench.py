@@ -0,0 +1,95 @@
+"""
+Tick ingestion throughput benchmark.
+Measures decode + tick construction rate (messages/sec on a single core) for coinbase & kraken
+ticker payloads, comparing the stdlib json path with the fast ingestion path.
+
+Usage: python -m koi.market_data.helpers.tick_bench [-n messages]
+"""
+import datetime as dt, json, time
+from optparse import OptionParser
+from typing import Callable, List
+
+from koi.market_data.helpers.market_models import CryptoTick, KrakenTick, json_loads
+
+
+CB_TICKER = '{"type":"ticker","sequence":13438836927,"product_id":"ETH-USD","price":"1293.37","open_24h":"1377.19","volume_24h":"201254.23533537","low_24h":"1283","high_24h":"1392.23","volume_30d":"17943944.12693805","best_bid":"1293.25","best_ask":"1293.37","side":"buy","time":"2021-01-31T18:04:12.616460Z","trade_id":81168541,"last_size":"0.05770902"}'
+CB_HEARTBEAT = '{"type":"heartbeat","last_trade_id":81168541,"product_id":"ETH-USD","sequence":13438836928,"time":"2021-01-31T18:04:12.616460Z"}'
+KRAKEN_TICKER = b'[548,{"a":["1692.88000",17,"17.14695000"],"b":["1692.87000",137,"137.43150142"],"c":["1692.88000","0.25000000"],"v":["14317.92380552","31294.58260897"],"p":["1710.28692","1710.48644"],"t":[12483,20971],"l":["1683.06000","1670.61000"],"h":["1724.63000","1731.70000"],"o":["1715.00000","1676.82000"]},"ticker","ETH/USD"]'
+KRAKEN_HEARTBEAT = b'{"event":"heartbeat"}'
+
+
+class _LegacyCryptoTick(object):
+    """Pre-optimization coinbase tick (string fields, instance dict) kept as a baseline"""
+    def __init__(self, **data):
+        for field in ['product_id', 'price', 'open_24h', 'volume_24h', 'low_24h', 'high_24h', 'volume_30d', 'best_bid', 'best_ask', 'side', 'time', 'last_size']:
+            setattr(self, field, data[field])
+
+class _LegacyKrakenTick(object):
+    """Pre-optimization kraken tick (instance dict, time formatted on construction) kept as a baseline"""
+    def __init__(self, data: dict, product: str):
+        self.product = product
+
+        self.ask = float(data['a'][0])
+        self.ask_size = int(data['a'][1])
+        self.bid = float(data['b'][0])
+        self.bid_size = int(data['b'][1])
+        self.high = float(data['h'][1])
+        self.low = float(data['l'][1])
+        self.close = float(data['c'][0])
+        self.open = float(data['o'][1])
+        self.time = dt.datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _run(name: str, fn: Callable[[], None], rounds: int, per_round: int = 100) -> float:
+    start = time.process_time()
+    for _ in range(rounds): fn()
+    elapsed = time.process_time() - start
+    rate = (rounds * per_round) / elapsed if elapsed > 0 else float('inf')
+    print(f'{name:<40} {rate:>14,.0f} msgs/sec/core')
+    return rate
+
+
+def run(n: int = 200_000) -> List[float]:
+    # 1 in 10 messages is a heartbeat, roughly what we see with a handful of products subscribed
+    cb_msgs = [CB_HEARTBEAT if i % 10 == 0 else CB_TICKER for i in range(100)]
+    kraken_msgs = [KRAKEN_HEARTBEAT if i % 10 == 0 else KRAKEN_TICKER for i in range(100)]
+    rounds = max(1, n // 100)
+
+    def cb_legacy():
+        for raw in cb_msgs:
+            msg = json.loads(raw)
+            if msg.get('type') == 'ticker':
+                tick = _LegacyCryptoTick(**msg)
+                float(tick.best_ask), float(tick.best_bid)
+
+    def cb_fast():
+        for raw in cb_msgs:
+            if raw.startswith('{"type":"heartbeat"'): continue
+            tick = CryptoTick.from_json(json_loads(raw))
+            tick.best_ask, tick.best_bid
+
+    def kraken_legacy():
+        for raw in kraken_msgs:
+            msg = json.loads(raw.decode('utf8'))
+            if isinstance(msg, list): _LegacyKrakenTick(msg[1], msg[3])
+
+    def kraken_fast():
+        for raw in kraken_msgs:
+            if raw == KRAKEN_HEARTBEAT: continue
+            msg = json_loads(raw)
+            KrakenTick(msg[1], msg[3])
+
+    print(f'Tick ingestion benchmark ({rounds * 100:,} messages per case, single core)')
+    return [
+        _run('coinbase: json + string tick', lambda: cb_legacy(), rounds),
+        _run('coinbase: fast decode + slots tick', lambda: cb_fast(), rounds),
+        _run('kraken: json + formatted time', lambda: kraken_legacy(), rounds),
+        _run('kraken: fast decode + lazy time', lambda: kraken_fast(), rounds),
+    ]
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option("-n", "--messages", dest="messages", type=int, default=200_000, help="Messages to decode per benchmark case")
+    (options, _) = parser.parse_args()
+    run(options.messages)
@@ -1,61 +1,42 @@
-import asyncio, nest_asyncio, os, concurrent.futures, logging, pandas as pd, numpy as np, dotenv, random
-from asyncio.events import AbstractEventLoop
-from asyncio.tasks import Task
-from typing import Dict, List, Union, Tuple
-from datetime import datetime
-from ib_insync import IB, util, ticker
+import asyncio, nest_asyncio, os, logging, pandas as pd, numpy as np, dotenv, random, threading
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union, Tuple
+from datetime import datetime, timedelta
+from ib_insync import IB, BarDataList, util, ticker
 from ibapi.contract import Contract
+from concurrent.futures import Future
 from threading import Thread
 
 from koi.models import ContractData, KoiState
 from koi.market_data.root import ApplyConfig, Market, apply_strategies, apply_without_strategies, extract_contracts
+from koi.market_data.quotes import QUOTES, Quote
+from koi.market_data.latency import LATENCY
+from koi.market_data.helpers.ib_pacing import PacingGovernor, PRIORITY_LIVE, PRIORITY_SETUP, PRIORITY_BACKFILL
+from koi.market_data.helpers.ib_history import ChunkStore, chunk_windows, needs_chunking
+from koi.market_data.helpers.contract_cache import ContractCache, contract_key
+from koi.market_data.helpers.depth_book import DepthBook
 
 pd.options.mode.chained_assignment = None  # default='warn'
 logging.getLogger('asyncio').setLevel(logging.CRITICAL)
 env = dotenv.dotenv_values('.env')
 
-# Helpers
-def historical_bars(ib: IB, contract: Contract, bar_size: str = '5 mins', duration: str = '4 D', end_date: Union[str, datetime] = '', loop: AbstractEventLoop = None) -> Tuple[str, pd.DataFrame]:
-    """
-    Gets data for specified timespan & frequency
-    See: https://interactivebrokers.github.io/tws-api/historical_bars.html
-    """
-    if loop is not None: asyncio.set_event_loop(loop)
-
-    whatToShow = 'MIDPOINT' if contract.exchange == 'IDEALPRO' else 'TRADES'
-    try:
-        if not ib.isConnected():
-            print('Not connected!!\n')
-            ib.connect('127.0.0.1', int(env['IB_PORT']), clientId=random.randint(1, 100))
-
-        bars = ib.reqHistoricalData(
-            contract,
-            endDateTime=end_date,
-            durationStr=duration,
-            barSizeSetting=bar_size,
-            whatToShow=whatToShow,
-            useRTH=True,
-            # useRTH=False,
-            formatDate=1,
-            keepUpToDate=False,
-            timeout=180
-        )
-
-    except Exception as e: raise 'IB_Client: reqHistoricalData error: {}'.format(e)
-
-    barsList = list(bars)
-    df = util.df(barsList)
-    return (contract.symbol, df)
-
-
-EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=5)
 class IB_Client(Market):
     ib = IB()
     event_loop = asyncio.new_event_loop()
+    loop_thread: Optional[Thread] = None   # the only thread driving event_loop once connected
     stream_contracts: List[ContractData] = []
     tickers: List[ticker.Ticker] = []
     latest: Dict[str, ticker.Ticker] = {}
-    stream_task: Task = None
+    last_rt_time: Dict[str, datetime] = {}
+    stream_task: Optional[Future] = None
+    bar_subscriptions: Dict[Tuple[str, str], BarDataList] = {}
+    bar_listeners: Dict[Tuple[str, str], List[Callable[[str, pd.DataFrame], None]]] = {}
+    depth_books: Dict[str, DepthBook] = {}
+    depth_tickers: Dict[str, Tuple[ticker.Ticker, bool]] = {}
+    depth_rows: int = int(env.get('IB_DEPTH_ROWS') or 0)
+    pacing = PacingGovernor(max_concurrent=int(env.get('IB_MAX_CONCURRENT_HISTORICAL') or 50))
+    contract_cache = ContractCache(max_age=float(env.get('CONID_CACHE_MAX_AGE_DAYS') or 7) * 86400)
+    qualify_batch_size: int = 50
+    snapshot_timeout: float = 5
 
     def __init__(self, state: KoiState):
         try:
@@ -70,15 +51,157 @@ class IB_Client(Market):
             if state is not None:
                 self.stream_contracts = extract_contracts(state.strategies).stocks
 
+            QUOTES.register_refresher('ib', self.refresh_quote)
+
         except Exception as e:
             print('IB_Client Error: ', e)
             # if self.ib.isConnected(): self.ib.disconnect()
 
+        self.start_loop()
+
+
+
+    # IB Event Loop
+    def start_loop(self):
+        """
+        Runs the IB event loop forever on one dedicated thread. ib_insync isn't thread-safe, so requests from other
+        threads are submitted to it (`run`/`call`) rather than driving the loop themselves. A loop that is always
+        running also keeps streamed tickers & keepUpToDate bars flowing without tick streaming being enabled.
+        """
+        if IB_Client.loop_thread is not None and IB_Client.loop_thread.is_alive(): return
+
+        def run():
+            asyncio.set_event_loop(self.event_loop)
+            self.event_loop.run_forever()
+
+        IB_Client.loop_thread = Thread(target=run, name='koi-ib-loop', daemon=True)
+        IB_Client.loop_thread.start()
 
+    @property
+    def loop_running(self) -> bool:
+        return self.loop_thread is not None and self.loop_thread.is_alive()
 
-    def get_historical_data(self, contracts: List[Contract], size: str = '5 mins', duration: str = '7 D', end_date: Union[datetime, str] = '', use_cached_if_available: bool = False, apply_config: ApplyConfig = None) -> List[Tuple[str, pd.DataFrame]]:
-        """Given a list of contracts, executes and waits for historical bar requests in parallel"""        
-        asyncio.set_event_loop(self.event_loop)
+    def run(self, coro: Coroutine, timeout: float = None) -> Any:
+        """Runs a coroutine on the IB loop thread and waits for its result"""
+        if not self.loop_running or threading.current_thread() is self.loop_thread:
+            asyncio.set_event_loop(self.event_loop)
+            return self.event_loop.run_until_complete(coro) # re-entrant (nest_asyncio) on the loop thread itself
+        return asyncio.run_coroutine_threadsafe(coro, self.event_loop).result(timeout)
+
+    def run_all(self, coros: List[Coroutine]) -> List[Any]:
+        """Runs coroutines concurrently on the IB loop, returning exceptions in place of failed results"""
+        async def gather(): return await asyncio.gather(*coros, return_exceptions=True)
+        return self.run(gather())
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Runs a non-blocking ib_insync call (placeOrder, cancel..., req... without waiting) on the IB loop thread"""
+        async def invoke(): return fn(*args, **kwargs)
+        return self.run(invoke())
+
+    def shutdown(self):
+        """Disconnects from TWS & stops the loop thread"""
+        self.tick_streaming_enabled = False
+        try:
+            if self.ib.isConnected(): self.call(self.ib.disconnect)
+        except Exception as e: print('IB_Client:shutdown error:', e)
+
+        if self.loop_running:
+            self.event_loop.call_soon_threadsafe(self.event_loop.stop)
+            self.loop_thread.join(5)
+
+
+
+    # Contract Qualification
+    async def qualify_contracts_async(self, contracts: List[Contract]) -> List[Contract]:
+        """Qualifies contracts missing from (or expired in) the conId cache in batches, returning any IB couldn't resolve"""
+        _, stale = self.contract_cache.split(contracts)
+        if len(stale) == 0: return []
+
+        keys = { id(c): contract_key(c) for c in stale }
+        unresolved = []
+        for i in range(0, len(stale), self.qualify_batch_size):
+            batch = stale[i:i + self.qualify_batch_size]
+            try: await self.ib.qualifyContractsAsync(*batch)
+            except Exception as e: print('IB_Client:qualify_contracts error:', e)
+
+            for c in batch:
+                if c.conId: self.contract_cache.store(keys[id(c)], c)
+                elif not self.contract_cache.apply(c): unresolved.append(c) # fall back to an expired entry if there is one
+
+        self.contract_cache.save()
+        return unresolved
+
+    def qualify_contracts(self, contracts: List[Contract]) -> List[Contract]:
+        """
+        Resolves conIds for all contracts up front so the order path never makes a blocking qualification round trip.
+        Cached conIds are applied in place, only unknown or expired contracts are sent to IB.
+        """
+        unresolved = self.run(self.qualify_contracts_async(contracts))
+        print(f'IB_Client:qualify_contracts: {len(contracts) - len(unresolved)}/{len(contracts)} contracts resolved')
+        for c in unresolved: print(f'IB_Client:qualify_contracts: unable to resolve {c.symbol} ({contract_key(c)})')
+        return unresolved
+
+
+    async def historical_bars_async(self, contract: Contract, bar_size: str = '5 mins', duration: str = '4 D', end_date: Union[str, datetime] = '', priority: int = PRIORITY_SETUP) -> Tuple[str, pd.DataFrame]:
+        """
+        Gets data for specified timespan & frequency, waiting on the pacing governor for a request slot
+        See: https://interactivebrokers.github.io/tws-api/historical_bars.html
+        """
+        whatToShow = 'MIDPOINT' if contract.exchange == 'IDEALPRO' else 'TRADES'
+        key = (contract.conId or contract.symbol, contract.exchange, whatToShow, bar_size, duration, str(end_date))
+        contract_key = (contract.conId or contract.symbol, contract.exchange, whatToShow)
+
+        async with self.pacing.slot(key, contract_key, priority, bar_size):
+            try:
+                if not self.ib.isConnected():
+                    print('Not connected!!\n')
+                    await self.ib.connectAsync('127.0.0.1', int(env['IB_PORT']), clientId=random.randint(1, 100))
+
+                bars = await self.ib.reqHistoricalDataAsync(
+                    contract,
+                    endDateTime=end_date,
+                    durationStr=duration,
+                    barSizeSetting=bar_size,
+                    whatToShow=whatToShow,
+                    useRTH=True,
+                    # useRTH=False,
+                    formatDate=1,
+                    keepUpToDate=False,
+                    timeout=180
+                )
+
+            except Exception as e: raise Exception('IB_Client: reqHistoricalData error: {}'.format(e))
+
+        return (contract.symbol, util.df(list(bars)) if bars else None)
+
+    async def download_history(self, contract: Contract, bar_size: str, duration: str, end_date: Union[str, datetime], cache_path: str, parts_path: str) -> Tuple[str, pd.DataFrame]:
+        """
+        Downloads a range longer than IB allows in one request as a series of IB-legal windows.
+        Each completed window is persisted as it arrives so an interrupted download resumes where it stopped,
+        and the joined bars are written straight into the bar cache.
+        """
+        store = ChunkStore(parts_path, end_date if isinstance(end_date, datetime) else None, max_age=timedelta(days=1))
+        windows = chunk_windows(store.end, duration, bar_size)
+        missing = [(end, span) for end, span in windows if not store.has(end)]
+        print(f'download_history:{contract.symbol}: {len(windows) - len(missing)}/{len(windows)} chunks cached, fetching {len(missing)}')
+
+        async def fetch(end: datetime, span: str):
+            _, df = await self.historical_bars_async(contract, bar_size, span, end, PRIORITY_BACKFILL)
+            store.save(end, df)
+
+        results = await asyncio.gather(*[fetch(end, span) for end, span in missing], return_exceptions=True)
+        errors = [res for res in results if isinstance(res, Exception)]
+        if len(errors) > 0: raise Exception(f'download_history:{contract.symbol}: {len(errors)} chunks failed, rerun to resume ({errors[0]})')
+
+        df = store.assemble()
+        if df is not None:
+            if not os.path.exists(os.path.dirname(cache_path)): os.makedirs(os.path.dirname(cache_path))
+            df.to_csv(cache_path)
+        store.clear()
+        return (contract.symbol, df)
+
+    def get_historical_data(self, contracts: List[Contract], size: str = '5 mins', duration: str = '7 D', end_date: Union[datetime, str] = '', use_cached_if_available: bool = False, apply_config: ApplyConfig = None, priority: int = PRIORITY_SETUP) -> List[Tuple[str, pd.DataFrame]]:
+        """Given a list of contracts, requests historical bars for all of them concurrently within IB's pacing limits"""
         print(f'get_historical_data: {duration} @ {size} steps  |  Strategies: {apply_config is not None}')
 
         # Temp
@@ -89,6 +212,9 @@ class IB_Client(Market):
 
         precise_date_string = datetime.now().strftime('%Y_%m_%d %H_%M_%S') if isinstance(end_date, str) else end_date.strftime('%Y_%m_%d %H_%M_%S')
         inprecise_date_string = datetime.now().strftime('%Y_%m_%d') if isinstance(end_date, str) else end_date.strftime('%Y_%m_%d')
+        # Chunked downloads resume by their resolved end date: an explicit end is pinned exactly, an open end ('' = now)
+        # resumes the latest unfinished download (see ChunkStore)
+        parts_end = end_date.strftime('%Y_%m_%d %H_%M_%S') if isinstance(end_date, datetime) else 'latest'
         filepaths = {}
         for c in contracts:
             if int(duration[:2]) > 9 and use_cached_if_available:  filepaths[c.symbol] = f'config/data/{c.symbol}/{c.symbol}_{inprecise_date_string}_{size}_{duration}.csv'
@@ -96,15 +222,25 @@ class IB_Client(Market):
 
         # If allowing use of cache, ensure all contracts are saved, otherwise redownload all
         used_cache = False
+        chunked = set()
         data: List[Tuple[str, pd.DataFrame]] = []
         if use_cached_if_available and all([os.path.isfile(filepaths[c.symbol]) for c in contracts]):
             data = [(c.symbol, pd.read_csv(filepaths[c.symbol])) for c in contracts]
             used_cache = True
             print('get_historical_data:used cache')
         else:
-            for c in contracts:
-                res = self.event_loop.run_in_executor(EXECUTOR, historical_bars, self.ib, c, size, duration, end_date, self.event_loop)
-                data.append(list(self.event_loop.run_until_complete(asyncio.gather(*[res])))[0])
+            # Ranges longer than IB allows for the bar size are downloaded in resumable chunks into the cache
+            chunked = set(c.symbol for c in contracts) if needs_chunking(size, duration) else set()
+            requests = [
+                self.download_history(c, size, duration, end_date, filepaths[c.symbol], f'config/data/{c.symbol}/{c.symbol}_{parts_end}_{size}_{duration}.parts') if c.symbol in chunked
+                else self.historical_bars_async(c, size, duration, end_date, priority)
+                for c in contracts
+            ]
+            results = self.run_all(requests)
+            for res in results:
+                if isinstance(res, Exception): print('get_historical_data:', res)
+            data = [res for res in results if not isinstance(res, Exception)]
+            print(f'get_historical_data:pacing {self.pacing.stats()}')
 
 
         if not isinstance(data, list): raise Exception('Error retrieving bar data')
@@ -113,7 +249,7 @@ class IB_Client(Market):
         if use_cached_if_available and not used_cache:
             print('get_historical_data:saving new data to cache')
             for sym, df in data:
-                if data is None: continue
+                if data is None or sym in chunked: continue
                 if not os.path.exists(f'config/data/{sym}'): os.mkdir(f'config/data/{sym}')
                 if df is not None: df.to_csv(filepaths[sym])
 
@@ -126,18 +262,139 @@ class IB_Client(Market):
 
 
 
+
+    # Live Bar Subscriptions
+    async def subscribe_bars_async(self, contract: Contract, bar_size: str, duration: str = '1 D') -> BarDataList:
+        whatToShow = 'MIDPOINT' if contract.exchange == 'IDEALPRO' else 'TRADES'
+        contract_key = (contract.conId or contract.symbol, contract.exchange, whatToShow)
+        async with self.pacing.slot(contract_key + (bar_size, 'live'), contract_key, PRIORITY_LIVE, bar_size):
+            return await self.ib.reqHistoricalDataAsync(contract, endDateTime='', durationStr=duration, barSizeSetting=bar_size, whatToShow=whatToShow, useRTH=True, formatDate=1, keepUpToDate=True)
+
+    def subscribe_bars(self, contracts: List[Contract], bar_size: str, listener: Callable[[str, pd.DataFrame], None]):
+        """
+        Opens (or joins) one keepUpToDate bar subscription per contract & bar size. `listener` is called with the
+        symbol and its latest completed bars each time a bar closes.
+        Updates are delivered on the IB loop thread.
+        """
+        new = []
+        for c in contracts:
+            key = (c.symbol, bar_size)
+            self.bar_listeners.setdefault(key, [])
+            if listener not in self.bar_listeners[key]: self.bar_listeners[key].append(listener)
+            if key not in self.bar_subscriptions: new.append(c)
+
+        results = self.run_all([self.subscribe_bars_async(c, bar_size) for c in new])
+        for c, bars in zip(new, results):
+            if isinstance(bars, Exception):
+                print(f'IB_Client:subscribe_bars: {c.symbol} error:', bars)
+                continue
+            bars.updateEvent += self._on_bar_update
+            self.bar_subscriptions[(c.symbol, bar_size)] = bars
+            print(f'IB_Client:subscribe_bars: streaming {bar_size} bars for {c.symbol}')
+
+    def unsubscribe_bars(self, symbols: List[str], bar_size: str, listener: Callable[[str, pd.DataFrame], None]):
+        """Removes a listener, cancelling a subscription once nothing listens to it"""
+        for sym in symbols:
+            key = (sym, bar_size)
+            listeners = self.bar_listeners.get(key, [])
+            if listener in listeners: listeners.remove(listener)
+            if len(listeners) > 0 or key not in self.bar_subscriptions: continue
+
+            bars = self.bar_subscriptions.pop(key)
+            bars.updateEvent -= self._on_bar_update
+            try: self.call(self.ib.cancelHistoricalData, bars)
+            except Exception as e: print(f'IB_Client:unsubscribe_bars: {sym} error:', e)
+
+    def _on_bar_update(self, bars: BarDataList, hasNewBar: bool):
+        """The last bar keeps updating until the next one opens, so a new bar means the one before it just closed"""
+        if not hasNewBar or len(bars) < 2: return
+
+        key = (bars.contract.symbol, bars.barSizeSetting)
+        df = apply_without_strategies(util.df(list(bars[-3:-1])))
+        for listener in self.bar_listeners.get(key, []):
+            try: listener(key[0], df)
+            except Exception as e: print(f'IB_Client:bar listener error ({key[0]}):', e)
+
+
+    # Market Depth
+    def subscribe_depth(self, contracts: List[Contract], rows: int = 10, smart: bool = True):
+        """
+        Streams level 2 rows for each contract into a fixed-size DepthBook (IB allows few concurrent depth
+        subscriptions by default, so reserve this for actively traded symbols).
+        Updates are applied on the IB loop thread.
+        """
+        for c in contracts:
+            if c.symbol in self.depth_tickers: continue
+            self.depth_books[c.symbol] = DepthBook(c.symbol, rows)
+            try:
+                depth_ticker = self.call(self.ib.reqMktDepth, c, numRows=rows, isSmartDepth=smart)
+                depth_ticker.updateEvent += self._on_depth
+                self.depth_tickers[c.symbol] = (depth_ticker, smart)
+            except Exception as e: print(f'IB_Client:subscribe_depth: {c.symbol} error:', e)
+
+    def unsubscribe_depth(self, symbols: List[str]):
+        for sym in symbols:
+            subscription = self.depth_tickers.pop(sym, None)
+            self.depth_books.pop(sym, None)
+            if subscription is None: continue
+
+            depth_ticker, smart = subscription
+            depth_ticker.updateEvent -= self._on_depth
+            try: self.call(self.ib.cancelMktDepth, depth_ticker.contract, isSmartDepth=smart)
+            except Exception as e: print(f'IB_Client:unsubscribe_depth: {sym} error:', e)
+
+    def _on_depth(self, depth_ticker: ticker.Ticker):
+        book = self.depth_books.get(depth_ticker.contract.symbol)
+        if book is None: return
+        for row in depth_ticker.domTicks: book.update(row.position, row.operation, row.side, row.price, row.size)
+
+    def depth_features(self, symbol: str) -> Optional[Dict[str, float]]:
+        """Latest imbalance / microprice features for a symbol with a depth subscription"""
+        book = self.depth_books.get(symbol)
+        return book.features() if book is not None and book.updates > 0 else None
+
+
     
     # Tick Data Streaming / Fetching
+    def _on_ticker(self, ticker: ticker.Ticker):
+        symbol = str(ticker.contract.symbol)
+        self.latest[symbol] = ticker
+
+        # RT Volume (generic tick 233) carries the exchange time of the last trade, record each trade once
+        if ticker.rtTime is not None and ticker.rtTime != self.last_rt_time.get(symbol):
+            self.last_rt_time[symbol] = ticker.rtTime
+            LATENCY.record('ib', symbol, ticker.rtTime.timestamp())
+
+        QUOTES.update(symbol, ticker.bid, ticker.ask, 'ib', ticker.time.timestamp() if ticker.time else np.nan)
+
+    def refresh_quote(self, symbol: str) -> Optional[Quote]:
+        """
+        Refreshes a quote the cache considers stale. IB tickers only update when prices change, so while the stream is
+        live a quiet symbol's streamed bid/ask are still current & are re-stamped without a round trip. Otherwise a
+        snapshot is requested on the IB loop thread.
+        """
+        streamed = self.latest.get(symbol)
+        streaming = self.tick_streaming_enabled and self.stream_task is not None and not self.stream_task.done()
+        if streaming and streamed is not None and self.ib.isConnected():
+            return QUOTES.update(symbol, streamed.bid, streamed.ask, 'ib', streamed.time.timestamp() if streamed.time else np.nan)
+
+        contracts = [c.to_contract() for c in self.stream_contracts if c.symbol == symbol]
+        if len(contracts) == 0: return None
+
+        tickers = self.run(self.ib.reqTickersAsync(*contracts), timeout=self.snapshot_timeout)
+        if len(tickers) == 0: return None
+        self.latest[symbol] = tickers[0]
+        return QUOTES.update(symbol, tickers[0].bid, tickers[0].ask, 'ib', tickers[0].time.timestamp() if tickers[0].time else np.nan)
+
     async def begin_tick_monitoring(self, contract_list: List[ContractData]):
         with await self.ib.connectAsync():
             contracts = [c.to_contract() for c in contract_list]
-            for contract in contracts: self.ib.reqMktData(contract)
+            for contract in contracts: self.ib.reqMktData(contract, '233')
 
             try:
                 async for tickers in self.ib.pendingTickersEvent:
                     if not self.tick_streaming_enabled: raise Exception('disabled')
-                    for ticker in tickers:
-                        self.latest[str(ticker.contract.symbol)] = ticker
+                    for ticker in tickers: self._on_ticker(ticker)
             except Exception as e:
                 if str(e) != 'disabled': print('Stream Error:', str(e))
                 return
@@ -146,14 +403,13 @@ class IB_Client(Market):
     async def fetch_latest_ticks(self):
         contracts = [c.to_contract() for c in self.stream_contracts]
 
-        for contract in contracts: self.ib.reqMktData(contract)
+        for contract in contracts: self.ib.reqMktData(contract, '233')
 
         while self.tick_streaming_enabled:
             try:
                 async for tickers in self.ib.pendingTickersEvent:
                     if not self.tick_streaming_enabled: raise Exception('disabled')
-                    for ticker in tickers:
-                        self.latest[str(ticker.contract.symbol)] = ticker
+                    for ticker in tickers: self._on_ticker(ticker)
             except Exception as e:
                 if str(e) != 'disabled': print('Stream Error:', str(e))
                 return
@@ -165,27 +421,25 @@ class IB_Client(Market):
     
 
 
-    def stream_forever(self, loop: AbstractEventLoop):
-        # asyncio.set_event_loop(loop)
-        asyncio.set_event_loop(self.event_loop)
-
+    async def stream_forever(self):
         while self.tick_streaming_enabled:
-            try:
-                task = loop.create_task(self.begin_tick_monitoring(self.stream_contracts))
-                self.stream_task = task
-                loop.run_until_complete(task)
-
+            try: await self.begin_tick_monitoring(self.stream_contracts)
             except Exception as e: print('Error with tick monitoring:', e)
+            await asyncio.sleep(1)
 
     def stream_tickers(self):
-        """Asynchronously monitors tick streams for all given contracts"""
+        """Asynchronously monitors tick streams for all given contracts (as a task on the IB loop thread)"""
         self.tick_streaming_enabled = True
-        
-        Thread(target=self.stream_forever, args=[self.event_loop]).start()
+        self.start_loop()
+        self.stream_task = asyncio.run_coroutine_threadsafe(self.stream_forever(), self.event_loop)
 
     def toggle_tick_streaming(self):
-        if self.tick_streaming_enabled: self.tick_streaming_enabled = False
-        else: self.stream_tickers()
+        if self.tick_streaming_enabled:
+            self.tick_streaming_enabled = False
+            self.unsubscribe_depth(list(self.depth_tickers.keys()))
+        else:
+            self.stream_tickers()
+            if self.depth_rows > 0: self.subscribe_depth([c.to_contract() for c in self.stream_contracts], self.depth_rows)
 
 
 
@@ -206,5 +460,6 @@ class IB_Client(Market):
                 'close': ticker.close if not np.isnan(ticker.close) else ticker.ask,
                 'time': ticker.time.strftime('%Y-%m-%d %H:%M:%S')
             }
+            if symbol in self.depth_books: data[symbol]['depth'] = self.depth_features(symbol)
 
         return data
\ No newline at end of file
@@ -0,0 +1,146 @@
+import json, math, os, threading, time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+from dotenv import dotenv_values
+
+env = dotenv_values('.env')
+
+# Wall clock anchored to the monotonic clock once, so arrival times can be compared with venue timestamps
+# without being thrown off by NTP steps while running
+CLOCK_ANCHOR = time.time() - time.monotonic()
+
+def arrival_time() -> float:
+    return time.monotonic() + CLOCK_ANCHOR
+
+
+# Bucket upper bounds in seconds: 100µs -> ~60s, 25% apart
+BUCKET_BOUNDS: List[float] = [0.0001 * 1.25 ** i for i in range(60)]
+
+
+class LatencyHistogram(object):
+    """
+    Log-bucketed latency histogram.
+    Percentiles cover a rolling window (the current and previous `window` second generations), while lifetime
+    bucket counts, sum & count are kept for cumulative exports.
+    """
+    window: float
+    count: int          # lifetime
+    total: float        # lifetime sum (seconds)
+    lifetime: List[int]
+
+    def __init__(self, window: float = 300):
+        self.window = window
+        self.count = 0
+        self.total = 0.0
+        self.lifetime = [0] * (len(BUCKET_BOUNDS) + 1)
+        self._current = [0] * (len(BUCKET_BOUNDS) + 1)
+        self._previous = [0] * (len(BUCKET_BOUNDS) + 1)
+        self._max_current = 0.0
+        self._max_previous = 0.0
+        self._rotated = time.monotonic()
+
+    def _rotate(self, now: float):
+        if now - self._rotated < self.window: return
+        stale = now - self._rotated >= 2 * self.window
+        self._previous = [0] * len(self._current) if stale else self._current
+        self._max_previous = 0.0 if stale else self._max_current
+        self._current = [0] * len(self._previous)
+        self._max_current = 0.0
+        self._rotated = now
+
+    def record(self, seconds: float):
+        self._rotate(time.monotonic())
+        i = bisect_left(BUCKET_BOUNDS, seconds)
+        self._current[i] += 1
+        self.lifetime[i] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self._max_current: self._max_current = seconds
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile of the rolling window"""
+        self._rotate(time.monotonic())
+        counts = [a + b for a, b in zip(self._current, self._previous)]
+        total = sum(counts)
+        if total == 0: return math.nan
+
+        target, seen = q * total, 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= target: return min(BUCKET_BOUNDS[i], self.max()) if i < len(BUCKET_BOUNDS) else self.max()
+        return self.max()
+
+    def max(self) -> float:
+        return max(self._max_current, self._max_previous)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """Rolling window stats in seconds (None when there were no samples, keeps the output valid JSON)"""
+        samples = sum(self._current) + sum(self._previous)
+        if samples == 0: return { 'samples': 0, 'p50': None, 'p99': None, 'max': None }
+        return { 'samples': samples, 'p50': self.percentile(0.5), 'p99': self.percentile(0.99), 'max': self.max() }
+
+
+
+class LatencyRecorder(object):
+    """
+    Venue timestamp -> local arrival latency per feed & symbol.
+    Latency includes any clock offset between us and the venue; samples that come out negative (our clock behind
+    theirs) are recorded as 0 and counted in `skewed`.
+    """
+    window: float
+    histograms: Dict[Tuple[str, str], LatencyHistogram]
+    skewed: Dict[str, int]
+
+    def __init__(self, window: float = 300):
+        self.window = window
+        self.histograms = {}
+        self.skewed = {}
+        self._writer: Optional[threading.Thread] = None
+
+    def _histogram(self, feed: str, symbol: str) -> LatencyHistogram:
+        key = (feed, symbol)
+        if key not in self.histograms: self.histograms[key] = LatencyHistogram(self.window)
+        return self.histograms[key]
+
+    def record(self, feed: str, symbol: str, exchange_time: float, arrival: float = None):
+        """Records a message's latency given its venue timestamp (epoch seconds). Messages without one are ignored"""
+        if exchange_time is None or math.isnan(exchange_time): return
+        latency = (arrival if arrival is not None else arrival_time()) - exchange_time
+        if latency < 0:
+            self.skewed[feed] = self.skewed.get(feed, 0) + 1
+            latency = 0.0
+
+        self._histogram(feed, symbol).record(latency)
+        self._histogram(feed, '*').record(latency)
+
+    def to_dict(self) -> Dict[str, dict]:
+        data = {}
+        for (feed, symbol), histogram in list(self.histograms.items()):
+            data.setdefault(feed, { 'skewed': self.skewed.get(feed, 0), 'symbols': {} })['symbols'][symbol] = histogram.stats()
+        return data
+
+
+    # Metrics file
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f: json.dump({ 'time': time.time(), 'window': self.window, 'feeds': self.to_dict() }, f, indent=2, default=str)
+        os.replace(tmp, path)
+
+    def start_writer(self, path: str = 'config/metrics/feed_latency.json', interval: float = 10):
+        """Periodically rewrites the metrics file in the background"""
+        if self._writer is not None and self._writer.is_alive(): return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try: self.write(path)
+                except Exception as e: print('LatencyRecorder: write error:', e)
+
+        self._writer = threading.Thread(target=run, daemon=True)
+        self._writer.start()
+
+
+
+# Shared recorder every feed reports into
+LATENCY = LatencyRecorder(window=float(env.get('FEED_LATENCY_WINDOW') or 300))
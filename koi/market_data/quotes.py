@@ -0,0 +1,108 @@
+import math, threading, time
+from datetime import datetime
+from typing import Callable, Dict, NamedTuple, Optional
+from dotenv import dotenv_values
+
+env = dotenv_values('.env')
+
+
+class Quote(NamedTuple):
+    symbol: str
+    bid: float
+    ask: float
+    source: str
+    exchange_time: float    # venue timestamp (epoch seconds), nan if the venue doesn't provide one
+    received: float         # local monotonic receipt time
+    max_age: float          # staleness bound (seconds) for this quote's source
+
+    def age(self) -> float:
+        return time.monotonic() - self.received
+
+    def is_stale(self) -> bool:
+        return self.age() > self.max_age
+
+
+def iso_to_epoch(value: str) -> float:
+    """Parses venue ISO-8601 timestamps (e.g. 2021-01-31T18:04:12.616460Z) to epoch seconds"""
+    if not value: return math.nan
+    try: return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError: return math.nan
+
+
+
+class QuoteCache(object):
+    """
+    Latest top-of-book quote per symbol, written by every venue (IB tickers, coinbase/kraken sockets,
+    robinhood polling) and read by the broker in O(1).
+    Venues register a refresher which is called synchronously only when a quote is missing or older
+    than its source's freshness limit.
+    """
+    max_age: float
+    source_max_age: Dict[str, float]
+    quotes: Dict[str, Quote]
+    refreshers: Dict[str, Callable[[str], Optional[Quote]]]
+    refresh_count: int
+    stale_count: int
+
+    def __init__(self, max_age: float = 2.0, source_max_age: Dict[str, float] = None):
+        self.max_age = max_age
+        self.source_max_age = source_max_age if source_max_age is not None else {}
+        self.quotes = {}
+        self.refreshers = {}
+        self.refresh_count = 0
+        self.stale_count = 0
+        self._refresh_lock = threading.Lock()
+
+    def update(self, symbol: str, bid: float, ask: float, source: str, exchange_time: float = math.nan) -> Optional[Quote]:
+        """Stores the latest quote for a symbol. Quotes missing either side are ignored"""
+        bid, ask = float(bid), float(ask)
+        if math.isnan(bid) or math.isnan(ask) or bid <= 0 or ask <= 0: return None
+
+        quote = Quote(symbol, bid, ask, source, exchange_time, time.monotonic(), self.source_max_age.get(source, self.max_age))
+        self.quotes[symbol] = quote
+        return quote
+
+    def get(self, symbol: str) -> Optional[Quote]:
+        return self.quotes.get(symbol)
+
+    def register_refresher(self, source: str, refresher: Callable[[str], Optional[Quote]]):
+        """Registers a blocking fetch used to refresh a source's quote when it goes stale"""
+        self.refreshers[source] = refresher
+
+    def latest(self, symbol: str, source: str = None) -> Quote:
+        """
+        Returns the cached quote for a symbol, synchronously refreshing it from its
+        source only if it is missing or stale. Raises if no usable quote is available.
+        """
+        quote = self.quotes.get(symbol)
+        if quote is not None and not quote.is_stale(): return quote
+
+        self.stale_count += 1
+        refresher = self.refreshers.get(quote.source if quote is not None else source)
+        if refresher is not None:
+            with self._refresh_lock:
+                # Another thread may have refreshed while we waited
+                current = self.quotes.get(symbol)
+                if current is not None and not current.is_stale(): return current
+
+                self.refresh_count += 1
+                try: refreshed = refresher(symbol)
+                except Exception as e:
+                    print(f'QuoteCache: {symbol} refresh error:', e)
+                    refreshed = None
+                if refreshed is not None: return refreshed
+
+        if quote is None: raise Exception(f'No quote available for {symbol}')
+        print(f'QuoteCache: using stale {symbol} quote ({quote.age():.2f}s old)')
+        return quote
+
+    def to_dict(self) -> Dict[str, dict]:
+        return { sym: dict(q._asdict(), age=q.age()) for sym, q in self.quotes.items() }
+
+
+
+# Shared cache every venue writes into
+QUOTES = QuoteCache(
+    max_age=float(env.get('QUOTE_MAX_AGE') or 2.0),
+    source_max_age={ 'robinhood': float(env.get('RH_QUOTE_MAX_AGE') or 5.0) }
+)
@@ -156,7 +156,7 @@ class Market:
     def __init__(self, state: KoiState):
         pass
 
-    def get_historical_data(self, contracts: Union[List[Contract], List[CryptoContract]], size: Union[str, int] = '5 mins', duration: str = '7 D', end_date: Union[datetime, str] = '' , use_cached_if_available: bool = False, apply_config: ApplyConfig = None) -> List[Tuple[str, pd.DataFrame]]:
+    def get_historical_data(self, contracts: Union[List[Contract], List[CryptoContract]], size: Union[str, int] = '5 mins', duration: str = '7 D', end_date: Union[datetime, str] = '' , use_cached_if_available: bool = False, apply_config: ApplyConfig = None, priority: int = 0) -> List[Tuple[str, pd.DataFrame]]:
         pass
 
     def toggle_tick_streaming(self):
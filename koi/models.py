@@ -109,6 +109,36 @@ class Decision(object):
         self.symbol = contract.symbol
 
 
+class OrderTicket(object):
+    """A decision sized by the broker and ready to submit. Tickets that couldn't be sized (no price/capital) have no quantity"""
+    decision: Decision
+    transaction_type: TransactionType
+    quantity: float
+    price: float
+    state: Any # bar the decision was made on
+    is_backtest: bool
+    crypto: bool
+    symbol: str
+
+    def __init__(self, decision: Decision, type: TransactionType, quantity: float, price: float, state: Any, is_backtest: bool = False, crypto: bool = False):
+        self.decision = decision
+        self.transaction_type = type
+        self.quantity = quantity
+        self.price = price
+        self.state = state
+        self.is_backtest = is_backtest
+        self.crypto = crypto
+        self.symbol = decision.symbol
+
+    @property
+    def sized(self) -> bool:
+        return self.quantity > 0
+
+    @property
+    def notional(self) -> float:
+        return self.quantity * self.price if self.sized else 0
+
+
 class Transaction(object):
     succeeded: bool
     transaction_type: TransactionType
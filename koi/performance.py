@@ -5,6 +5,7 @@ from pandas.core.series import Series
 
 from koi.models import TransactionReport, TransactionType
 from koi.portfolio import Portfolio
+from koi.journal import JOURNAL
 
 
 class Stat(object):
@@ -71,6 +72,17 @@ class StrategyPerformance(object):
         self.strategy_profit = 0
         self.initial_capital = initial_capital
 
+    def restore(self, strategy_name: str):
+        """Seeds trade counters & extremes from the transaction journal so live performance carries across restarts"""
+        summary = JOURNAL.summary(strategy_name)
+        self.total_buys, self.total_sells = int(summary['buys']), int(summary['sells'])
+        self.strategy_profit = summary['realized_pl'] # summed trade p/l, the last total_pl only covers the portfolios open when it was written
+        self.buys = { sym: int(stats['buys']) for sym, stats in JOURNAL.symbol_stats(strategy_name).items() if stats['buys'] > 0 }
+
+        for attr, largest in [('largest_profit', True), ('largest_loss', False)]:
+            sell = JOURNAL.extreme_sell(strategy_name, largest)
+            if sell is not None: setattr(self, attr, TransactionHistory(sell['purchase_date'] or '', sell['date'], sell['trade_pl'], sell['symbol']))
+
     def update(self, portfolios: Dict[str, Portfolio], transactions: List[TransactionReport], states: Dict[str, Series]):
         self.observations += 1
         self.all_transactions += transactions
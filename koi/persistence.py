@@ -0,0 +1,133 @@
+import os, threading
+from typing import Callable, Dict, List, Optional, Tuple
+from dotenv import dotenv_values
+
+env = dotenv_values('.env')
+
+
+class WriteBehind(object):
+    """
+    Background writer keeping disk off the trading path.
+        * `put` queues a whole-file snapshot, only the latest snapshot per path is written (coalescing)
+        * `append` queues text for an append-only file, every chunk is written in order
+    A single thread writes everything queued every `interval` seconds as one batch: snapshots go to temp files that
+    are fsynced then renamed into place, appended files are fsynced once per batch. `flush` writes synchronously.
+    """
+    interval: float
+    batches: int
+    writes: int
+    coalesced: int
+    errors: int
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.batches = 0
+        self.writes = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._snapshots: Dict[str, Callable[[str], None]] = {}     # path -> writer given the temp path to write to
+        self._appends: Dict[str, Tuple[Optional[str], List[str]]] = {}  # path -> (header for a new file, chunks)
+        self._lock = threading.Lock()           # guards the queues
+        self._write_lock = threading.Lock()     # serializes batches so flushes never interleave with the writer
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+
+    # Producers (any thread)
+    def put(self, path: str, write: Callable[[str], None]):
+        """
+        Queues `write(tmp_path)` to replace `path`, superseding any snapshot of it not yet written.
+        `write` must capture a snapshot that isn't mutated afterwards (e.g. `df.copy().to_csv`)
+        """
+        with self._lock:
+            if path in self._snapshots: self.coalesced += 1
+            self._snapshots[path] = write
+        self._start()
+
+    def append(self, path: str, text: str, header: str = None):
+        """Queues text to be appended to `path`, preceded by `header` if the file is new or empty"""
+        with self._lock:
+            if path not in self._appends: self._appends[path] = (header, [])
+            self._appends[path][1].append(text)
+        self._start()
+
+    def flush(self):
+        """Writes everything queued so far before returning"""
+        self._write_batch()
+
+    def close(self):
+        """Stops the writer thread after a final flush"""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None: self._thread.join()
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock: queued = len(self._snapshots) + len(self._appends)
+        return { 'queued': queued, 'batches': self.batches, 'writes': self.writes, 'coalesced': self.coalesced, 'errors': self.errors }
+
+
+    # Writer
+    def _start(self):
+        if self._thread is not None or self._stopped: return
+        with self._lock:
+            if self._thread is not None: return
+            self._thread = threading.Thread(target=self._run, name='koi-write-behind', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._write_batch()
+
+    def _write_batch(self):
+        with self._write_lock:
+            with self._lock:
+                snapshots, self._snapshots = self._snapshots, {}
+                appends, self._appends = self._appends, {}
+            if len(snapshots) == 0 and len(appends) == 0: return
+
+            directories = set()
+            for path, write in snapshots.items():
+                tmp = path + '.tmp'
+                try:
+                    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                    write(tmp)
+                    _fsync(tmp)
+                    os.replace(tmp, path)
+                    directories.add(os.path.dirname(path) or '.')
+                    self.writes += 1
+                except Exception as e:
+                    self.errors += 1
+                    print(f'WriteBehind: {path} write error:', e)
+
+            for path, (header, chunks) in appends.items():
+                try:
+                    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                    with open(path, 'a', encoding='utf-8') as f:
+                        if header is not None and f.tell() == 0: f.write(header)
+                        f.write(''.join(chunks))
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self.writes += 1
+                except Exception as e:
+                    self.errors += 1
+                    print(f'WriteBehind: {path} append error:', e)
+
+            # One directory fsync per batch makes the renames durable
+            for directory in directories: _fsync(directory)
+            self.batches += 1
+
+
+def _fsync(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try: os.fsync(fd)
+        finally: os.close(fd)
+    except OSError: pass # directories can't be opened for fsync on every platform
+
+
+
+# Shared by everything persisting live trading artifacts
+PERSISTENCE = WriteBehind(interval=float(env.get('PERSIST_INTERVAL') or 1))
@@ -0,0 +1,83 @@
+import asyncio, functools, threading
+from asyncio.events import AbstractEventLoop
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, Optional
+from dotenv import dotenv_values
+
+env = dotenv_values('.env')
+
+
+class Runtime(object):
+    """
+    Long-lived home for trader step pipelines.
+        * One event loop on its own thread runs every trader's async stages
+        * One bounded thread pool runs the blocking work those stages hand off (market data requests,
+          indicators, predictions, orders), replacing the per-call pools & per-step threads
+    """
+    max_workers: int
+    loop: Optional[AbstractEventLoop] = None
+    executor: Optional[ThreadPoolExecutor] = None
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts the loop thread & executor (idempotent, called lazily on first use)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive(): return
+            self.loop = asyncio.new_event_loop()
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='koi-worker')
+            self.loop.set_default_executor(self.executor)
+            self._thread = threading.Thread(target=self._run, name='koi-runtime', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+    # Scheduling
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedules a coroutine on the runtime loop from any thread"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: float = None) -> Any:
+        """Runs a coroutine on the runtime loop and waits for its result. Must not be called from the loop itself"""
+        return self.submit(coro).result(timeout)
+
+    async def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Awaits a blocking call on the shared executor"""
+        return await self.loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    def blocking(self, fn: Callable, *args, **kwargs) -> Any:
+        """Runs a blocking call on the shared executor from outside the loop and waits for it"""
+        self.start()
+        return self.executor.submit(fn, *args, **kwargs).result()
+
+
+    def shutdown(self, timeout: float = 30):
+        """Cancels in-flight pipelines, waits for them to unwind, then stops the loop & drains the executor"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive(): return
+
+            async def cancel_all():
+                tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+                for task in tasks: task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+            try: asyncio.run_coroutine_threadsafe(cancel_all(), self.loop).result(timeout)
+            except Exception as e: print('Runtime: shutdown error:', e)
+
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+            self.executor.shutdown(wait=True)
+            if not self.loop.is_running(): self.loop.close()
+            self._thread = None
+
+
+
+# Shared by every trader & backtester
+RUNTIME = Runtime(max_workers=int(env.get('TRADER_WORKERS') or 8))
@@ -0,0 +1,145 @@
+import asyncio, heapq, math, time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from dotenv import dotenv_values
+
+from koi.market_data.latency import LatencyHistogram
+from koi.runtime import RUNTIME
+
+env = dotenv_values('.env')
+
+
+class ScheduledJob(object):
+    """A callback fired at every close of a `frequency` second bar (aligned to the epoch), `settle_delay` seconds late"""
+    name: str
+    frequency: int
+    settle_delay: float
+    callback: Callable[[float], Awaitable]
+
+    fired: int
+    missed: int                 # bar closes that passed without firing (scheduler held up for longer than a bar)
+    last_lateness: float        # seconds between the due time and the actual start of the last fire
+    lateness: LatencyHistogram
+    next_due: float
+
+    def __init__(self, name: str, frequency: int, callback: Callable[[float], Awaitable], settle_delay: float):
+        self.name = name
+        self.frequency = frequency
+        self.callback = callback
+        self.settle_delay = settle_delay
+        self.fired = 0
+        self.missed = 0
+        self.last_lateness = 0.0
+        self.lateness = LatencyHistogram()
+        self.next_due = math.nan
+
+    def next_close(self, now: float) -> float:
+        """The first bar close strictly after `now`"""
+        return (math.floor(now / self.frequency) + 1) * self.frequency
+
+    def to_dict(self) -> dict:
+        return {
+            'frequency': self.frequency,
+            'settle_delay': self.settle_delay,
+            'fired': self.fired,
+            'missed': self.missed,
+            'next_due': self.next_due,
+            'last_lateness': self.last_lateness,
+            'lateness': self.lateness.stats(),
+        }
+
+
+
+class BarScheduler(object):
+    """
+    Single timer wheel driving every trader's step.
+    Slots are keyed on wall-clock due times (bar close + settle delay) and one task on the runtime loop sleeps until
+    the earliest slot. Every due time is derived from the wall clock rather than the previous sleep, so fires don't
+    drift, and each fire's lateness is recorded per job.
+    """
+    settle_delay: float
+    jobs: Dict[str, ScheduledJob]
+    slots: Dict[float, List[Tuple[ScheduledJob, float]]]   # due time -> (job, bar close)
+
+    def __init__(self, settle_delay: float = 2.0):
+        self.settle_delay = settle_delay
+        self.jobs = {}
+        self.slots = {}
+        self._due: List[float] = []     # heap of slot due times
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+
+    # Any thread
+    def add(self, name: str, frequency: int, callback: Callable[[float], Awaitable], settle_delay: float = None):
+        """Fires `callback(bar_close)` on the runtime loop at every bar close + settle delay until removed"""
+        job = ScheduledJob(name, frequency, callback, self.settle_delay if settle_delay is None else settle_delay)
+        RUNTIME.start()
+        RUNTIME.loop.call_soon_threadsafe(self._add, job)
+
+    def remove(self, name: str):
+        if RUNTIME.loop is not None: RUNTIME.loop.call_soon_threadsafe(self._remove, name)
+
+    def to_dict(self) -> Dict[str, dict]:
+        return { name: job.to_dict() for name, job in list(self.jobs.items()) }
+
+
+    # Runtime loop only
+    def _add(self, job: ScheduledJob):
+        self.jobs[job.name] = job
+        self._schedule(job, time.time())
+
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        else: self._wakeup.set()
+
+    def _remove(self, name: str):
+        # Slot entries of a removed job are skipped when their slot comes up
+        self.jobs.pop(name, None)
+
+    def _schedule(self, job: ScheduledJob, now: float):
+        # Measured from `now - settle_delay` so a job added (or fired) within a settle window still gets that bar
+        bar_close = job.next_close(now - job.settle_delay)
+        due = bar_close + job.settle_delay
+        job.next_due = due
+
+        if due not in self.slots:
+            self.slots[due] = []
+            heapq.heappush(self._due, due)
+        self.slots[due].append((job, bar_close))
+
+    async def _run(self):
+        while len(self.jobs) > 0:
+            delay = self._due[0] - time.time() if len(self._due) > 0 else None
+            if delay is None or delay > 0:
+                self._wakeup.clear()
+                try: await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError: pass
+                continue
+
+            due = heapq.heappop(self._due)
+            for job, bar_close in self.slots.pop(due):
+                if self.jobs.get(job.name) is job: self._fire(job, due, bar_close)
+
+        self._task = None
+
+    def _fire(self, job: ScheduledJob, due: float, bar_close: float):
+        now = time.time()
+        lateness = now - due
+        job.fired += 1
+        job.last_lateness = lateness
+        job.lateness.record(max(lateness, 0.0))
+
+        # Bars that closed while we were held up are skipped, not fired back to back
+        missed = int((now - job.settle_delay - bar_close) // job.frequency)
+        if missed > 0:
+            job.missed += missed
+            print(f'BarScheduler:{job.name}: {missed} bar(s) missed, fired {lateness:.2f}s late')
+
+        asyncio.ensure_future(job.callback(bar_close))
+        self._schedule(job, now)
+
+
+
+# Drives every active trader
+SCHEDULER = BarScheduler(settle_delay=float(env.get('BAR_SETTLE_DELAY') or 2))
@@ -0,0 +1,599 @@
+"""
+Local exchange simulator for load & latency testing.
+Serves coinbase-compatible or kraken-compatible websocket feeds and REST endpoints so that
+CB_Client, the kraken WssClient and Broker order paths can be exercised offline.
+
+Usage:
+    python -m koi.simulator -e coinbase -s 10 -r 50 -l 5
+    python -m koi.simulator -e kraken --replay config/sessions/kraken.jsonl --speed 4
+    python -m koi.simulator -e coinbase --record config/sessions/coinbase.jsonl --record-seconds 60 -p BTC-USD
+
+Point the clients at it through .env:
+    COINBASE_API_URL=http://localhost:8090   COINBASE_WS_URL=ws://localhost:8091
+    KRAKEN_API_URL=http://localhost:8090     KRAKEN_WS_URL=ws://localhost:8091   KRAKEN_WS_AUTH_URL=ws://localhost:8091
+
+Every streamed message carries an exchange timestamp stamped at send time, so the
+feed latency monitors measure end-to-end (simulator -> client) latency.
+"""
+import calendar, json, math, random, time, uuid
+from optparse import OptionParser
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from autobahn.twisted.websocket import WebSocketServerFactory, WebSocketServerProtocol
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET, Site
+
+from koi.market_data.helpers.order_book import OrderBook
+from koi.market_data.latency import LatencyHistogram
+
+
+class SimConfig(NamedTuple):
+    exchange: str = 'coinbase'      # 'coinbase' | 'kraken'
+    symbols: int = 5                # number of generated products (ignored if products given)
+    products: List[str] = None      # explicit product list, e.g. ['BTC-USD', 'ETH-USD']
+    rate: float = 10                # ticker messages per second per product
+    latency: float = 0              # added one-way latency (ms)
+    jitter: float = 0               # uniform latency jitter (ms)
+    fill_probability: float = 1.0   # chance an order fills, otherwise it is rejected
+    fill_delay: float = 0.25        # seconds before an accepted order fills
+    book_depth: int = 10
+    replay: Optional[str] = None    # recorded session (jsonl) to replay instead of generating data
+    speed: float = 1.0              # replay speed multiplier
+    rest_port: int = 8090
+    ws_port: int = 8091
+    seed: int = 0
+
+
+
+# Market model
+class SimulatedProduct(object):
+    """Random-walk mid price with a grid of book levels around it"""
+    symbol: str
+    mid: float
+    tick: float
+    book: OrderBook
+    trade_id: int
+    sequence: int
+
+    def __init__(self, symbol: str, price: float, depth: int, rng: random.Random):
+        self.symbol = symbol
+        self.mid = price
+        self.tick = max(round(price * 0.0001, 2), 0.01)
+        self.book = OrderBook(symbol, depth)
+        self.depth = depth
+        self.rng = rng
+        self.trade_id = 0
+        self.sequence = 0
+        self.open = price
+        self.high = price
+        self.low = price
+        self.volume = 0.0
+        self.last_size = 0.0
+        self.book.load_snapshot(*self._levels())
+
+    def _fmt_price(self, price: float) -> str: return f'{price:.5f}'
+    def _fmt_size(self, size: float) -> str: return f'{size:.8f}'
+
+    def _levels(self) -> Tuple[List[list], List[list]]:
+        best_bid = math.floor(self.mid / self.tick) * self.tick
+        bids = [[self._fmt_price(best_bid - i * self.tick), self._fmt_size(self.rng.uniform(0.01, 5))] for i in range(self.depth)]
+        asks = [[self._fmt_price(best_bid + (i + 1) * self.tick), self._fmt_size(self.rng.uniform(0.01, 5))] for i in range(self.depth)]
+        return (bids, asks)
+
+    def step(self) -> List[Tuple[str, str, str]]:
+        """Moves the price and returns the resulting book changes as (side, price, size)"""
+        self.mid *= math.exp(self.rng.gauss(0, 0.0005))
+        self.high, self.low = max(self.high, self.mid), min(self.low, self.mid)
+        self.last_size = round(self.rng.expovariate(2), 8)
+        self.volume += self.last_size
+        self.trade_id += 1
+        self.sequence += 1
+
+        bids, asks = self._levels()
+        changes: List[Tuple[str, str, str]] = []
+        for side, book_side, levels in [('buy', self.book.bids, bids), ('sell', self.book.asks, asks)]:
+            new = { p: s for p, s in levels }
+            old = { p: s for p, s in book_side.raw }
+            for p in old:
+                if p not in new: changes.append((side, p, '0'))
+            for p, s in new.items():
+                if old.get(p) != s: changes.append((side, p, s))
+
+        for side, price, size in changes: self.book.apply(side, price, size)
+        self.book._truncate()
+        return changes
+
+    def best(self) -> Tuple[float, float]:
+        return (self.book.best_bid(), self.book.best_ask())
+
+
+
+def history_price(symbol: str, timestamp: float, base: float) -> float:
+    """Deterministic synthetic price for historical endpoints, stable across requests"""
+    phase = sum(ord(c) for c in symbol)
+    noise = random.Random(f'{symbol}{int(timestamp)}').gauss(0, 0.0008)
+    return base * (1 + 0.02 * math.sin(timestamp / 7200 + phase) + 0.005 * math.sin(timestamp / 600) + noise)
+
+
+
+# Order handling
+class SimulatedOrder(object):
+    def __init__(self, symbol: str, side: str, size: float, price: Optional[float]):
+        self.id = str(uuid.uuid4())
+        self.symbol = symbol
+        self.side = side
+        self.size = size
+        self.price = price
+        self.created = time.time()
+        self.status = 'pending'     # pending -> done | rejected
+        self.accepted = True        # decided once when the order is placed
+        self.filled_size = 0.0
+        self.fill_price = 0.0
+
+class OrderEngine(object):
+    """Accepts orders and fills or rejects them after the configured delay"""
+    orders: Dict[str, SimulatedOrder]
+
+    def __init__(self, config: SimConfig, products: Dict[str, SimulatedProduct], rng: random.Random):
+        self.config = config
+        self.products = products
+        self.rng = rng
+        self.orders = {}
+
+    def accepts(self) -> bool:
+        """Rolls whether an order is accepted (and later filled) or rejected"""
+        return self.rng.random() <= self.config.fill_probability
+
+    def place(self, symbol: str, side: str, size: float, price: Optional[float], accepted: bool = None) -> SimulatedOrder:
+        """Places an order, rolling its acceptance unless the caller already did"""
+        order = SimulatedOrder(symbol, side, size, price)
+        order.accepted = self.accepts() if accepted is None else accepted
+        self.orders[order.id] = order
+        reactor.callLater(self.config.fill_delay, self._resolve, order)
+        return order
+
+    def _resolve(self, order: SimulatedOrder):
+        if not order.accepted or order.symbol not in self.products:
+            order.status = 'rejected'
+            return
+
+        bid, ask = self.products[order.symbol].best()
+        order.fill_price = ask if order.side == 'buy' else bid
+        if order.price is not None: order.fill_price = min(order.fill_price, order.price) if order.side == 'buy' else max(order.fill_price, order.price)
+        order.filled_size = order.size
+        order.status = 'done'
+
+
+
+# Websocket feeds
+class SimProtocol(WebSocketServerProtocol):
+
+    def onOpen(self):
+        self.subscriptions = set() # (channel, product)
+        self.factory.clients.append(self)
+
+    def onClose(self, wasClean, code, reason):
+        if self in self.factory.clients: self.factory.clients.remove(self)
+
+    def onMessage(self, payload, isBinary):
+        try: msg = json.loads(payload.decode('utf8'))
+        except ValueError: return
+        self.factory.exchange.handle_client_message(self, msg)
+
+    def send(self, msg):
+        self.factory.exchange.send(self, msg)
+
+
+class SimExchange(object):
+    """Shared state & behaviour for a simulated venue. Subclasses implement the venue wire format"""
+    name: str
+
+    def __init__(self, config: SimConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        products = config.products or [f'SIM{i}-USD' for i in range(config.symbols)]
+        self.products = { p: SimulatedProduct(p, self.rng.uniform(10, 50_000), config.book_depth, self.rng) for p in products }
+        self.engine = OrderEngine(config, self.products, self.rng)
+        self.factory: WebSocketServerFactory = None
+        self.sent = 0
+        self.replayed = 0
+        self.replay_lag = LatencyHistogram(window=3600) # replayed message send time vs its recorded offset
+
+    def send(self, client: SimProtocol, msg):
+        """Sends a message after the configured latency"""
+        payload = json.dumps(msg).encode('utf8')
+        delay = (self.config.latency + self.rng.uniform(0, self.config.jitter)) / 1000
+        self.sent += 1
+        if delay > 0: reactor.callLater(delay, client.sendMessage, payload, False)
+        else: client.sendMessage(payload, False)
+
+    def subscribers(self, channel: str, product: str) -> List[SimProtocol]:
+        return [c for c in self.factory.clients if (channel, product) in c.subscriptions]
+
+    def start(self):
+        if self.config.replay is not None: return self.replay(self.config.replay)
+        for product in self.products.values():
+            LoopingCall(self.tick, product).start(1 / self.config.rate, now=False)
+        LoopingCall(self.heartbeat).start(1, now=False)
+        LoopingCall(self.report).start(10, now=False)
+
+    def replay(self, path: str):
+        """Replays a recorded session (jsonl of {"t": seconds, "msg": payload}) to every connected client"""
+        with open(path, 'r') as f: records = [json.loads(line) for line in f if line.strip()]
+        print(f'Simulator: replaying {len(records)} messages from {path} @ {self.config.speed}x')
+        start = time.time()
+        for record in records:
+            reactor.callLater(record['t'] / self.config.speed, self._broadcast, record['msg'], start + record['t'] / self.config.speed)
+
+        duration = (records[-1]['t'] / self.config.speed) if records else 0
+        progress = LoopingCall(self.replay_report, start)
+        progress.start(10, now=False)
+
+        def finished():
+            if progress.running: progress.stop()
+            self.replay_report(start)
+        reactor.callLater(duration + 1, finished)
+
+    def _broadcast(self, msg, due: float = None):
+        if due is not None:
+            self.replay_lag.record(max(time.time() - due, 0))
+            self.replayed += 1
+        for client in self.factory.clients: self.send(client, msg)
+
+    def replay_report(self, start: float):
+        elapsed = max(time.time() - start, 1e-9)
+        print(f'Simulator: replayed {self.replayed} messages in {elapsed:.1f}s ({self.replayed / elapsed:.1f} msgs/s), {self.sent} sent to {len(self.factory.clients)} clients | lag {format_latency(self.replay_lag)}')
+
+    def report(self):
+        print(f'Simulator: {self.sent} messages sent, {len(self.factory.clients)} clients, {len(self.engine.orders)} orders')
+
+    # Implemented per venue
+    def handle_client_message(self, client: SimProtocol, msg: dict): pass
+    def tick(self, product: SimulatedProduct): pass
+    def heartbeat(self): pass
+    def rest(self, method: str, path: List[str], args: Dict[str, str], body: dict) -> Tuple[int, object]: return (404, { 'message': 'NotFound' })
+
+
+
+class CoinbaseExchange(SimExchange):
+    name = 'coinbase'
+
+    def handle_client_message(self, client: SimProtocol, msg: dict):
+        if msg.get('type') not in ['subscribe', 'unsubscribe']: return
+        channels = [c if isinstance(c, str) else c['name'] for c in msg.get('channels', [])]
+        products = msg.get('product_ids', [])
+
+        for channel in channels:
+            for product in products:
+                if msg['type'] == 'subscribe':
+                    client.subscriptions.add((channel, product))
+                    if channel == 'level2' and product in self.products:
+                        book = self.products[product].book
+                        client.send({ 'type': 'snapshot', 'product_id': product, 'bids': [list(l) for l in book.bids.raw], 'asks': [list(l) for l in book.asks.raw] })
+                else: client.subscriptions.discard((channel, product))
+        client.send({ 'type': 'subscriptions', 'channels': [{ 'name': c, 'product_ids': products } for c in channels] })
+
+    def tick(self, product: SimulatedProduct):
+        changes = product.step()
+        bid, ask = product.best()
+        now = time.time()
+        stamp = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now)) + f'.{int((now % 1) * 1e6):06d}Z'
+
+        ticker = {
+            'type': 'ticker', 'sequence': product.sequence, 'product_id': product.symbol, 'price': f'{product.mid:.2f}',
+            'open_24h': f'{product.open:.2f}', 'volume_24h': f'{product.volume:.8f}', 'low_24h': f'{product.low:.2f}', 'high_24h': f'{product.high:.2f}',
+            'volume_30d': f'{product.volume:.8f}', 'best_bid': f'{bid:.5f}', 'best_ask': f'{ask:.5f}', 'side': self.rng.choice(['buy', 'sell']),
+            'time': stamp, 'trade_id': product.trade_id, 'last_size': f'{product.last_size:.8f}'
+        }
+        for client in self.subscribers('ticker', product.symbol): client.send(ticker)
+
+        if changes:
+            update = { 'type': 'l2update', 'product_id': product.symbol, 'changes': [list(c) for c in changes], 'time': stamp }
+            for client in self.subscribers('level2', product.symbol): client.send(update)
+
+    def heartbeat(self):
+        now = time.strftime('%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime())
+        for product in self.products.values():
+            msg = { 'type': 'heartbeat', 'sequence': product.sequence, 'last_trade_id': product.trade_id, 'product_id': product.symbol, 'time': now }
+            for client in self.subscribers('heartbeat', product.symbol): client.send(msg)
+
+    def _order_json(self, order: SimulatedOrder) -> dict:
+        return {
+            'id': order.id, 'product_id': order.symbol, 'side': order.side, 'size': f'{order.size:.8f}',
+            'price': f'{order.price:.5f}' if order.price is not None else None, 'type': 'limit' if order.price is not None else 'market',
+            'status': order.status, 'settled': order.status == 'done', 'done_reason': 'filled' if order.status == 'done' else None,
+            'filled_size': f'{order.filled_size:.8f}', 'executed_value': f'{order.filled_size * order.fill_price:.8f}',
+            'fill_fees': f'{order.filled_size * order.fill_price * 0.005:.8f}', 'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(order.created))
+        }
+
+    def rest(self, method: str, path: List[str], args: Dict[str, str], body: dict) -> Tuple[int, object]:
+        if method == 'GET' and path == ['accounts']:
+            return (200, [{ 'id': 'sim-usd', 'currency': 'USD', 'balance': '1000000', 'available': '1000000', 'hold': '0', 'profile_id': 'sim', 'trading_enabled': True }])
+
+        if method == 'POST' and path == ['orders']:
+            order = self.engine.place(body['product_id'], body['side'], float(body['size']), float(body['price']) if body.get('price') else None)
+            return (200, self._order_json(order))
+
+        if method == 'GET' and len(path) == 2 and path[0] == 'orders':
+            if path[1] not in self.engine.orders: return (404, { 'message': 'NotFound' })
+            return (200, self._order_json(self.engine.orders[path[1]]))
+
+        if method == 'GET' and len(path) == 3 and path[0] == 'products' and path[1] in self.products:
+            product = self.products[path[1]]
+            if path[2] == 'ticker':
+                bid, ask = product.best()
+                return (200, { 'trade_id': product.trade_id, 'price': f'{product.mid:.2f}', 'size': f'{product.last_size:.8f}', 'bid': f'{bid:.5f}', 'ask': f'{ask:.5f}', 'volume': f'{product.volume:.8f}', 'time': time.strftime('%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime()) })
+            if path[2] == 'candles':
+                granularity = int(args.get('granularity', 60))
+                end = parse_time(args.get('end')) or time.time()
+                start = parse_time(args.get('start')) or end - granularity * 300
+                return (200, self._candles(product, start, end, granularity))
+
+        return super().rest(method, path, args, body)
+
+    def _candles(self, product: SimulatedProduct, start: float, end: float, granularity: int) -> List[list]:
+        rows = []
+        t = int(end // granularity) * granularity
+        while t >= start and len(rows) < 300:
+            o, c = history_price(product.symbol, t, product.open), history_price(product.symbol, t + granularity, product.open)
+            rows.append([t, min(o, c) * 0.999, max(o, c) * 1.001, o, c, abs(o - c) * 10])
+            t -= granularity
+        return rows
+
+
+
+class KrakenExchange(SimExchange):
+    name = 'kraken'
+
+    def __init__(self, config: SimConfig):
+        super().__init__(config)
+        self.channel_ids: Dict[Tuple[str, str], int] = {}
+
+    def _pair(self, product: str) -> str: return product.replace('-', '/').replace('BTC', 'XBT')
+    def _product(self, pair: str) -> str: return pair.replace('/', '-').replace('XBT', 'BTC')
+
+    def _channel_id(self, name: str, pair: str) -> int:
+        if (name, pair) not in self.channel_ids: self.channel_ids[(name, pair)] = len(self.channel_ids) + 1
+        return self.channel_ids[(name, pair)]
+
+    def _channel_name(self, subscription: dict) -> str:
+        return f'book-{subscription.get("depth", 10)}' if subscription['name'] == 'book' else subscription['name']
+
+    def handle_client_message(self, client: SimProtocol, msg: dict):
+        event = msg.get('event')
+        if event == 'ping':
+            client.send({ 'event': 'pong', 'reqid': msg.get('reqid') })
+
+        elif event in ['subscribe', 'unsubscribe']:
+            subscription = msg['subscription']
+            name = subscription['name']
+            if name in ['openOrders', 'ownTrades']:
+                client.send({ 'event': 'subscriptionStatus', 'status': 'subscribed', 'channelName': name, 'subscription': { 'name': name } })
+                return
+
+            for pair in msg.get('pair', []):
+                product = self._product(pair)
+                if event == 'unsubscribe':
+                    client.subscriptions.discard((name, product))
+                    client.send({ 'event': 'subscriptionStatus', 'status': 'unsubscribed', 'pair': pair, 'subscription': subscription, 'channelName': self._channel_name(subscription) })
+                    continue
+
+                client.subscriptions.add((name, product))
+                channel_id = self._channel_id(name, pair)
+                client.send({ 'event': 'subscriptionStatus', 'status': 'subscribed', 'channelID': channel_id, 'channelName': self._channel_name(subscription), 'pair': pair, 'subscription': subscription })
+                if name == 'book' and product in self.products:
+                    book = self.products[product].book
+                    depth = subscription.get('depth', 10)
+                    stamp = f'{time.time():.6f}'
+                    client.send([channel_id, { 'as': [[p, s, stamp] for p, s in book.asks.raw[:depth]], 'bs': [[p, s, stamp] for p, s in book.bids.raw[:depth]] }, self._channel_name(subscription), pair])
+
+        elif event == 'addOrder':
+            if not self.engine.accepts():
+                client.send({ 'event': 'addOrderStatus', 'reqid': msg.get('reqid'), 'status': 'error', 'errorMessage': 'EOrder:Insufficient funds' })
+            else:
+                order = self.engine.place(self._product(msg['pair']), msg['type'], float(msg['volume']), float(msg['price']) if msg.get('price') else None, accepted=True)
+                client.send({ 'event': 'addOrderStatus', 'reqid': msg.get('reqid'), 'status': 'ok', 'txid': order.id, 'descr': f'{msg["type"]} {msg["volume"]} {msg["pair"]} @ limit {msg.get("price")}' })
+
+    def tick(self, product: SimulatedProduct):
+        changes = product.step()
+        bid, ask = product.best()
+        pair = self._pair(product.symbol)
+        now = time.time()
+
+        ticker = {
+            'a': [f'{ask:.5f}', 1, '1.00000000'], 'b': [f'{bid:.5f}', 1, '1.00000000'], 'c': [f'{product.mid:.5f}', f'{product.last_size:.8f}'],
+            'v': [f'{product.volume:.8f}', f'{product.volume:.8f}'], 'p': [f'{product.mid:.5f}', f'{product.mid:.5f}'], 't': [product.trade_id, product.trade_id],
+            'l': [f'{product.low:.5f}', f'{product.low:.5f}'], 'h': [f'{product.high:.5f}', f'{product.high:.5f}'], 'o': [f'{product.open:.5f}', f'{product.open:.5f}']
+        }
+        for client in self.subscribers('ticker', product.symbol): client.send([self._channel_id('ticker', pair), ticker, 'ticker', pair])
+
+        spread = [f'{bid:.5f}', f'{ask:.5f}', f'{now:.6f}', '1.00000000', '1.00000000']
+        for client in self.subscribers('spread', product.symbol): client.send([self._channel_id('spread', pair), spread, 'spread', pair])
+
+        if changes:
+            stamp = f'{now:.6f}'
+            asks = [[p, s, stamp] for side, p, s in changes if side == 'sell']
+            bids = [[p, s, stamp] for side, p, s in changes if side == 'buy']
+            payloads = []
+            if asks: payloads.append({ 'a': asks })
+            if bids: payloads.append({ 'b': bids })
+            payloads[-1]['c'] = str(product.book.kraken_checksum())
+            name = f'book-{self.config.book_depth}'
+            for client in self.subscribers('book', product.symbol): client.send([self._channel_id('book', pair)] + payloads + [name, pair])
+
+    def heartbeat(self):
+        for client in self.factory.clients:
+            if client.subscriptions: client.send({ 'event': 'heartbeat' })
+
+    def rest(self, method: str, path: List[str], args: Dict[str, str], body: dict) -> Tuple[int, object]:
+        def ok(result): return (200, { 'error': [], 'result': result })
+
+        if path == ['0', 'private', 'GetWebSocketsToken']: return ok({ 'token': 'simulated-token', 'expires': 900 })
+
+        if len(path) == 3 and path[:2] == ['0', 'public']:
+            pair = args.get('pair', '')
+            product = next((p for p in self.products.values() if self._pair(p.symbol).replace('/', '') == pair.replace('/', '')), None)
+            if product is None: return (200, { 'error': ['EQuery:Unknown asset pair'] })
+
+            if path[2] == 'Ticker':
+                bid, ask = product.best()
+                return ok({ pair: { 'a': [f'{ask:.5f}', '1', '1.000'], 'b': [f'{bid:.5f}', '1', '1.000'], 'c': [f'{product.mid:.5f}', f'{product.last_size:.8f}'] } })
+
+            if path[2] == 'OHLC':
+                interval = int(args.get('interval', 1)) * 60
+                end = int(time.time() // interval) * interval
+                since = max(int(float(args.get('since', 0))), end - interval * 720)
+                rows = []
+                for t in range(since - since % interval, end + 1, interval):
+                    o, c = history_price(product.symbol, t, product.open), history_price(product.symbol, t + interval, product.open)
+                    rows.append([t, f'{o:.5f}', f'{max(o, c) * 1.001:.5f}', f'{min(o, c) * 0.999:.5f}', f'{c:.5f}', f'{(o + c) / 2:.5f}', f'{abs(o - c) * 10:.8f}', 5])
+                return ok({ pair: rows, 'last': end })
+
+            if path[2] == 'Trades':
+                since = int(args.get('since', 0))
+                start = since / 1e9 if since > 1e12 else max(since, time.time() - 86400)
+                trades, t = [], start
+                while t < time.time() and len(trades) < 1000:
+                    t += 2.5
+                    trades.append([f'{history_price(product.symbol, t, product.open):.5f}', f'{random.Random(t).uniform(0.001, 1):.8f}', t, 'b', 'l', '', len(trades)])
+                return ok({ pair: trades, 'last': str(int(t * 1e9)) })
+
+        return (404, { 'error': ['EGeneral:Unknown method'] })
+
+
+
+# REST
+def parse_time(value: Optional[str]) -> Optional[float]:
+    if not value: return None
+    try: return float(value)
+    except ValueError: pass
+    try: return time.mktime(time.strptime(value[:19], '%Y-%m-%dT%H:%M:%S'))
+    except ValueError: return None
+
+class RestResource(Resource):
+    isLeaf = True
+
+    def __init__(self, exchange: SimExchange):
+        super().__init__()
+        self.exchange = exchange
+
+    def _render(self, request, method: str):
+        path = [p.decode('utf8') for p in request.postpath if p]
+        args = { k.decode('utf8'): v[0].decode('utf8') for k, v in request.args.items() }
+        raw = request.content.read() if request.content is not None else b''
+        try: body = json.loads(raw) if raw.startswith(b'{') else args
+        except ValueError: body = {}
+
+        status, data = self.exchange.rest(method, path, args, body)
+        payload = json.dumps(data).encode('utf8')
+        request.setResponseCode(status)
+        request.setHeader(b'content-type', b'application/json')
+
+        delay = (self.exchange.config.latency + self.exchange.rng.uniform(0, self.exchange.config.jitter)) / 1000
+        if delay <= 0: return payload
+
+        def respond():
+            request.write(payload)
+            request.finish()
+        reactor.callLater(delay, respond)
+        return NOT_DONE_YET
+
+    def render_GET(self, request): return self._render(request, 'GET')
+    def render_POST(self, request): return self._render(request, 'POST')
+    def render_DELETE(self, request): return self._render(request, 'DELETE')
+
+
+
+# Recording
+def format_latency(histogram: LatencyHistogram) -> str:
+    stats = histogram.stats()
+    if stats['samples'] == 0: return 'no samples'
+    return f'p50 {stats["p50"] * 1000:.1f}ms, p99 {stats["p99"] * 1000:.1f}ms, max {stats["max"] * 1000:.1f}ms ({stats["samples"]} samples)'
+
+def message_time(msg) -> Optional[float]:
+    """Venue timestamp of a recorded message (Coinbase 'time', Kraken spread/book stamps), None when it has none"""
+    try:
+        if isinstance(msg, dict) and isinstance(msg.get('time'), str):
+            stamp = msg['time'].rstrip('Z')
+            whole, _, fraction = stamp.partition('.')
+            return calendar.timegm(time.strptime(whole, '%Y-%m-%dT%H:%M:%S')) + (float(f'0.{fraction}') if fraction else 0)
+        if isinstance(msg, list) and len(msg) >= 4 and msg[-2] == 'spread': return float(msg[1][2])
+        if isinstance(msg, list) and len(msg) >= 4 and str(msg[-2]).startswith('book'):
+            stamps = [float(level[2]) for payload in msg[1:-2] for side in ['a', 'b', 'as', 'bs'] for level in payload.get(side, [])]
+            return max(stamps) if stamps else None
+    except (ValueError, TypeError, IndexError, AttributeError): return None
+    return None
+
+def record_session(url: str, subscribe: dict, path: str, seconds: float):
+    """Records a live feed to jsonl ({"t": seconds since start, "msg": payload}) for later replay, reporting throughput & feed latency"""
+    from websocket import create_connection
+
+    ws = create_connection(url)
+    ws.send(json.dumps(subscribe))
+    start, count = time.time(), 0
+    latency = LatencyHistogram(window=max(seconds, 1))
+    with open(path, 'w') as f:
+        while time.time() - start < seconds:
+            msg = json.loads(ws.recv())
+            received = time.time()
+            exchange_time = message_time(msg)
+            if exchange_time is not None: latency.record(max(received - exchange_time, 0))
+            f.write(json.dumps({ 't': received - start, 'msg': msg }) + '\n')
+            count += 1
+    ws.close()
+    elapsed = max(time.time() - start, 1e-9)
+    print(f'Recorded {count} messages to {path} in {elapsed:.1f}s ({count / elapsed:.1f} msgs/s) | feed latency {format_latency(latency)}')
+
+
+
+def run(config: SimConfig):
+    exchange = CoinbaseExchange(config) if config.exchange == 'coinbase' else KrakenExchange(config)
+
+    factory = WebSocketServerFactory(f'ws://127.0.0.1:{config.ws_port}')
+    factory.protocol = SimProtocol
+    factory.clients = []
+    factory.exchange = exchange
+    exchange.factory = factory
+
+    reactor.listenTCP(config.ws_port, factory)
+    reactor.listenTCP(config.rest_port, Site(RestResource(exchange)))
+    print(f'Simulating {config.exchange}: {len(exchange.products)} products @ {config.rate} msgs/s each | ws://127.0.0.1:{config.ws_port} | http://127.0.0.1:{config.rest_port}')
+
+    exchange.start()
+    reactor.run()
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option("-e", "--exchange", dest="exchange", type=str, default='coinbase', help="Venue to simulate: coinbase | kraken")
+    parser.add_option("-s", "--symbols", dest="symbols", type=int, default=5, help="Number of generated products")
+    parser.add_option("-p", "--products", dest="products", type=str, action="append", default=None, help="Explicit products to simulate (e.g. BTC-USD), repeatable")
+    parser.add_option("-r", "--rate", dest="rate", type=float, default=10, help="Ticker messages per second per product")
+    parser.add_option("-l", "--latency", dest="latency", type=float, default=0, help="Added one-way latency in ms")
+    parser.add_option("-j", "--jitter", dest="jitter", type=float, default=0, help="Uniform latency jitter in ms")
+    parser.add_option("--fill-probability", dest="fill_probability", type=float, default=1.0, help="Chance an order is filled rather than rejected")
+    parser.add_option("--fill-delay", dest="fill_delay", type=float, default=0.25, help="Seconds before accepted orders fill")
+    parser.add_option("--depth", dest="book_depth", type=int, default=10, help="Simulated book depth")
+    parser.add_option("--replay", dest="replay", type=str, default=None, help="Recorded session to replay")
+    parser.add_option("--speed", dest="speed", type=float, default=1.0, help="Replay speed multiplier")
+    parser.add_option("--rest-port", dest="rest_port", type=int, default=8090)
+    parser.add_option("--ws-port", dest="ws_port", type=int, default=8091)
+    parser.add_option("--seed", dest="seed", type=int, default=0)
+    parser.add_option("--record", dest="record", type=str, default=None, help="Record a live feed to this path instead of simulating")
+    parser.add_option("--record-seconds", dest="record_seconds", type=float, default=60)
+    (options, _) = parser.parse_args()
+
+    if options.record is not None:
+        products = options.products or ['BTC-USD']
+        if options.exchange == 'coinbase':
+            record_session('wss://ws-feed.pro.coinbase.com', { 'type': 'subscribe', 'product_ids': products, 'channels': ['ticker', 'level2', 'heartbeat'] }, options.record, options.record_seconds)
+        else:
+            pairs = [p.replace('-', '/').replace('BTC', 'XBT') for p in products]
+            record_session('wss://ws.kraken.com', { 'event': 'subscribe', 'pair': pairs, 'subscription': { 'name': 'ticker' } }, options.record, options.record_seconds)
+    else:
+        run(SimConfig(
+            options.exchange, options.symbols, options.products, options.rate, options.latency, options.jitter,
+            options.fill_probability, options.fill_delay, options.book_depth, options.replay, options.speed,
+            options.rest_port, options.ws_port, options.seed
+        ))
@@ -0,0 +1,165 @@
+import copy, json, math, os, sqlite3, threading, time
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from koi.models import KoiState, StrategyInfo
+from koi.persistence import PERSISTENCE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    strategy TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (strategy, field)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# StrategyInfo fields persisted per strategy (as accepted by StrategyInfo.from_json)
+FIELDS = ['equity', 'available_capital', 'initial_capital', 'start_date', 'crypto', 'trade_config', 'analysis_config', 'cnn_config', 'contracts', 'portfolios', 'indicators']
+OPTIONAL_FIELDS = ['analysis_config', 'cnn_config', 'indicators'] # left out when empty, from_json only parses them if present
+
+
+def to_jsonable(value: Any) -> Any:
+    """Plain JSON data for a config/state value (objects by their attributes, NamedTuples as dicts)"""
+    if isinstance(value, tuple) and hasattr(value, '_asdict'): return to_jsonable(value._asdict())
+    if isinstance(value, dict): return { str(k): to_jsonable(v) for k, v in value.items() }
+    if isinstance(value, (list, tuple)): return [to_jsonable(v) for v in value]
+    if isinstance(value, datetime): return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, Enum): return value.value
+    if isinstance(value, float) and math.isnan(value): return None
+    if hasattr(value, '__dict__'): return to_jsonable(value.__dict__)
+    if hasattr(value, 'item'): return value.item() # numpy scalars
+    return value
+
+
+class StateStore(object):
+    """
+    Embedded transactional store for strategy state (SQLite, WAL mode).
+    Every strategy field (capital, portfolios, configs, ...) is its own record, so updates touch only what changed
+    and commit atomically, and concurrent savers of different fields can't overwrite each other. Reads are served
+    from an in-memory cache. `config/state.json` stays the human-editable format: it is imported when edited
+    externally and re-exported (write-behind) after every update.
+    """
+    path: str
+    json_path: str
+
+    def __init__(self, path: str = 'config/state.db', json_path: str = 'config/state.json'):
+        self.path = path
+        self.json_path = json_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+
+    def _connection(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conn is not None: return self._conn
+
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+
+            for strategy, field, value in conn.execute('SELECT strategy, field, value FROM records'):
+                self._cache.setdefault(strategy, {})[field] = json.loads(value)
+
+            # Pick up state.json if it was edited since we last wrote it (or this is the first run)
+            if os.path.isfile(self.json_path):
+                synced = self._meta('json_mtime')
+                if len(self._cache) == 0 or synced is None or os.path.getmtime(self.json_path) > float(synced): self.import_json()
+            return conn
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._connection().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_meta(self, key: str, value: str):
+        with self._lock:
+            conn = self._connection()
+            with conn: conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+
+    # Reads (cached)
+    def strategies(self) -> List[str]:
+        self._connection()
+        return list(self._cache.keys())
+
+    def get(self, strategy: str, field: str, default: Any = None) -> Any:
+        self._connection()
+        return copy.deepcopy(self._cache.get(strategy, {}).get(field, default))
+
+    def load(self) -> KoiState:
+        self._connection()
+        with self._lock: data = copy.deepcopy(self._cache) # from_json consumes the dicts it's given
+        return KoiState([StrategyInfo.from_json(name, fields) for name, fields in data.items()])
+
+
+    # Writes
+    def update(self, strategy: str, **fields):
+        """Atomically sets the given fields of a strategy's record, leaving its other fields untouched"""
+        values = { field: to_jsonable(value) for field, value in fields.items() if field in FIELDS }
+        values = { f: v for f, v in values.items() if not (f in OPTIONAL_FIELDS and not v) }
+        if len(values) == 0: return
+
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            with conn: conn.executemany('INSERT OR REPLACE INTO records (strategy, field, value, updated) VALUES (?, ?, ?, ?)', [(strategy, f, json.dumps(v), now) for f, v in values.items()])
+            self._cache.setdefault(strategy, {}).update(values)
+        self.export_json()
+
+    def save_strategy(self, info: StrategyInfo):
+        self.update(info.name, **{ field: getattr(info, field, None) for field in FIELDS })
+
+    def remove(self, strategy: str):
+        with self._lock:
+            conn = self._connection()
+            with conn: conn.execute('DELETE FROM records WHERE strategy = ?', (strategy,))
+            self._cache.pop(strategy, None)
+        self.export_json()
+
+
+    # JSON compatibility
+    def export_json(self):
+        """Queues a rewrite of state.json from the cache on the write-behind writer"""
+        with self._lock: text = json.dumps({ 'strategies': self._cache }, indent=4)
+
+        def write(tmp: str):
+            with open(tmp, 'w', encoding='utf-8') as f: f.write(text)
+            self._set_meta('json_mtime', str(os.path.getmtime(tmp))) # the rename keeps this mtime, so our own export isn't re-imported
+
+        PERSISTENCE.put(self.json_path, write)
+
+    def import_json(self, path: str = None):
+        """Replaces every record with the contents of a state.json file, in one transaction"""
+        path = path or self.json_path
+        with open(path, 'r') as f: data = json.load(f)
+
+        with self._lock:
+            conn = self._connection() if self._conn is None else self._conn
+            now = time.time()
+            rows = [(name, field, json.dumps(value), now) for name, info in data['strategies'].items() for field, value in info.items() if field in FIELDS]
+            with conn:
+                conn.execute('DELETE FROM records')
+                conn.executemany('INSERT INTO records (strategy, field, value, updated) VALUES (?, ?, ?, ?)', rows)
+                if path == self.json_path: conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('json_mtime', str(os.path.getmtime(path))))
+
+            self._cache = {}
+            for name, field, value, _ in rows: self._cache.setdefault(name, {})[field] = json.loads(value)
+        print(f'StateStore: imported {len(self._cache)} strategies from {path}')
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None: self._conn.close()
+            self._conn = None
+
+
+
+# Shared store behind load_state/save_strategy_config
+STATE = StateStore()
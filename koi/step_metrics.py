@@ -0,0 +1,109 @@
+import threading, time
+from contextlib import contextmanager
+from timeit import default_timer as timer
+from typing import Dict, Optional, Tuple
+from dotenv import dotenv_values
+
+from koi.market_data.latency import BUCKET_BOUNDS, LatencyHistogram
+from koi.persistence import PERSISTENCE
+
+env = dotenv_values('.env')
+
+# Stages timed within a trader step, in pipeline order ('step' is the whole step, 'predict' spans fit, model & decide)
+STAGES = ['fetch', 'merge', 'indicators', 'predict', 'fit', 'model', 'decide', 'order', 'persist', 'notify', 'step']
+
+
+def _label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class StepMetrics(object):
+    """
+    Per strategy, stage & symbol step latency histograms ('*' holds a stage's total across symbols).
+    Rolling p50/p99/max feed the UI, lifetime buckets are exported in the Prometheus text format.
+    """
+    window: float
+    histograms: Dict[Tuple[str, str, str], LatencyHistogram]
+
+    def __init__(self, window: float = 300):
+        self.window = window
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+
+    def record(self, strategy: str, stage: str, seconds: float, symbol: str = '*'):
+        key = (strategy, stage, symbol)
+        with self._lock: # stages of different symbols are timed on different workers
+            if key not in self.histograms: self.histograms[key] = LatencyHistogram(self.window)
+            self.histograms[key].record(seconds)
+
+    @contextmanager
+    def timed(self, strategy: str, stage: str, symbol: str = '*'):
+        """Records how long the block took, including blocks left by an exception"""
+        start = timer()
+        try: yield
+        finally: self.record(strategy, stage, timer() - start, symbol)
+
+    def export(self, strategy: str) -> Dict[Tuple[str, str, str], LatencyHistogram]:
+        """A strategy's histograms, e.g. for a worker process to hand back to the parent"""
+        with self._lock: return { key: h for key, h in self.histograms.items() if key[0] == strategy }
+
+    def absorb(self, histograms: Dict[Tuple[str, str, str], LatencyHistogram]):
+        """Takes over histograms exported by a worker process (they hold the worker's lifetime of samples)"""
+        with self._lock: self.histograms.update(histograms)
+
+    def to_dict(self) -> Dict[str, Dict[str, dict]]:
+        """{ strategy: { stage: { symbol: rolling stats } } }"""
+        with self._lock: items = list(self.histograms.items())
+        data = {}
+        for (strategy, stage, symbol), histogram in sorted(items, key=lambda i: (i[0][0], _stage_order(i[0][1]), i[0][2])):
+            data.setdefault(strategy, {}).setdefault(stage, {})[symbol] = histogram.stats()
+        return data
+
+
+    # Prometheus text exposition
+    def prometheus(self) -> str:
+        with self._lock: items = sorted(self.histograms.items())
+        lines = [
+            '# HELP koi_step_stage_seconds Trader step latency per strategy, stage & symbol',
+            '# TYPE koi_step_stage_seconds histogram',
+        ]
+        for (strategy, stage, symbol), histogram in items:
+            labels = f'strategy="{_label(strategy)}",stage="{_label(stage)}",symbol="{_label(symbol)}"'
+            cumulative = 0
+            for bound, n in zip(BUCKET_BOUNDS, histogram.lifetime):
+                cumulative += n
+                lines.append(f'koi_step_stage_seconds_bucket{{{labels},le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'koi_step_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'koi_step_stage_seconds_sum{{{labels}}} {histogram.total:.6f}')
+            lines.append(f'koi_step_stage_seconds_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        """Queues a rewrite of the metrics file (e.g. for node_exporter's textfile collector)"""
+        text = self.prometheus()
+        def write(tmp: str):
+            with open(tmp, 'w') as f: f.write(text)
+        PERSISTENCE.put(path, write)
+
+    def start_writer(self, path: str = 'config/metrics/step_latency.prom', interval: float = 10):
+        """Periodically rewrites the metrics file in the background"""
+        if self._writer is not None and self._writer.is_alive(): return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try: self.write(path)
+                except Exception as e: print('StepMetrics: write error:', e)
+
+        self._writer = threading.Thread(target=run, daemon=True)
+        self._writer.start()
+
+
+def _stage_order(stage: str) -> int:
+    return STAGES.index(stage) if stage in STAGES else len(STAGES)
+
+
+
+# Shared by every trader's step
+STEP_METRICS = StepMetrics(window=float(env.get('STEP_METRICS_WINDOW') or 300))
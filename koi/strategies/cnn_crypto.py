@@ -25,7 +25,7 @@ class Strategy(StrategyInterface):
         if not self.start_date or self.start_date == '':
             self.start_date = list(dfs.values())[0].iloc[0]['date']
 
-        self.fit(dfs)
+        with self.timed('fit'): self.fit(dfs)
 
         decisions: List[Decision] = []
         buy_opportunities: List[Opportunity] = []
@@ -34,13 +34,13 @@ class Strategy(StrategyInterface):
             p = self.portfolios[c.symbol]
 
             if p.has_stock:
-                (sell, confidence, reason) = self.should_sell(dfs[c.symbol], c.symbol)
+                with self.timed('model', c.symbol): (sell, confidence, reason) = self.should_sell(dfs[c.symbol], c.symbol)
                 print(f'{c.symbol} should sell: {sell} | {reason}')
                 if sell:
                     decisions.append(Decision(Move.Sell, c, p.quantity, confidence, reason))
                     pending_capital += (p.quantity * p.purchase_price * .8)
             else:
-                (buy, confidence, reason) = self.should_buy(dfs[c.symbol], c.symbol)
+                with self.timed('model', c.symbol): (buy, confidence, reason) = self.should_buy(dfs[c.symbol], c.symbol)
                 print(f'{c.symbol} should buy: {buy} | {reason}')
                 if buy: buy_opportunities.append(Opportunity(c, confidence, reason))
 
@@ -59,11 +59,12 @@ class Strategy(StrategyInterface):
         #             decisions = [d for d in decisions if d.symbol != contract.symbol] + [Decision(Move.Sell, contract, self.portfolios[contract.symbol].quantity, 0, 'Better capital opportunities present')]
         #             buy_opportunities = [opp for opp in buy_opportunities if opp.contract.symbol != contract.symbol]
 
-        if len(buy_opportunities) > 0 and pending_capital > 10:
-            # TODO: Allow for more than one opportunity to be taken at a time
-            # best_opportunity = sorted(buy_opportunities, key=lambda o:o.confidence, reverse=True)[0]
-            best_opportunity = sorted(buy_opportunities, key=lambda o:o.confidence - self.cnn_manager.conf_threshold[o.contract.symbol], reverse=True)[0]
-            decisions.append(Decision(Move.Buy, best_opportunity.contract, BuyQuantity.Max, best_opportunity.confidence, best_opportunity.description))
+        with self.timed('decide'):
+            if len(buy_opportunities) > 0 and pending_capital > 10:
+                # TODO: Allow for more than one opportunity to be taken at a time
+                # best_opportunity = sorted(buy_opportunities, key=lambda o:o.confidence, reverse=True)[0]
+                best_opportunity = sorted(buy_opportunities, key=lambda o:o.confidence - self.cnn_manager.conf_threshold[o.contract.symbol], reverse=True)[0]
+                decisions.append(Decision(Move.Buy, best_opportunity.contract, BuyQuantity.Max, best_opportunity.confidence, best_opportunity.description))
 
         print('\n\n')
         return (decisions, self.predictions)
@@ -38,7 +38,7 @@ class Strategy(StrategyInterface):
         if not self.start_date or self.start_date == '':
             self.start_date = list(dfs.values())[0].iloc[0]['date']
 
-        self.fit(dfs)
+        with self.timed('fit'): self.fit(dfs)
 
         decisions: List[Decision] = []
         buy_opportunities: List[Opportunity] = []
@@ -46,17 +46,18 @@ class Strategy(StrategyInterface):
             p = self.portfolios[c.symbol]
 
             if p.has_stock:
-                (sell, confidence, reason) = self.should_sell(dfs[c.symbol], c.symbol)
+                with self.timed('model', c.symbol): (sell, confidence, reason) = self.should_sell(dfs[c.symbol], c.symbol)
                 if sell: decisions.append(Decision(Move.Sell, c, p.quantity, confidence, reason))
 
             else:
-                (buy, confidence, reason) = self.should_buy(dfs[c.symbol], c.symbol)
+                with self.timed('model', c.symbol): (buy, confidence, reason) = self.should_buy(dfs[c.symbol], c.symbol)
                 if buy: buy_opportunities.append(Opportunity(c, confidence, reason))
 
-        if len(buy_opportunities) > 0 and self.available_capital > 0:
-            # TODO: Allow for more than one opportunity to be taken at a time
-            best_opportunity = sorted(buy_opportunities, key=lambda o:o.confidence, reverse=True)[0]
-            decisions.append(Decision(Move.Buy, best_opportunity.contract, BuyQuantity.Max, best_opportunity.confidence, best_opportunity.description))
+        with self.timed('decide'):
+            if len(buy_opportunities) > 0 and self.available_capital > 0:
+                # TODO: Allow for more than one opportunity to be taken at a time
+                best_opportunity = sorted(buy_opportunities, key=lambda o:o.confidence, reverse=True)[0]
+                decisions.append(Decision(Move.Buy, best_opportunity.contract, BuyQuantity.Max, best_opportunity.confidence, best_opportunity.description))
 
         return (decisions, self.predictions)
 
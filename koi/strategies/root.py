@@ -1,4 +1,5 @@
 from asyncio.events import AbstractEventLoop
+from contextlib import nullcontext
 from enum import Enum
 from typing import Dict, List, Tuple, Union
 import pandas as pd, os
@@ -11,6 +12,7 @@ from koi.portfolio import Portfolio
 from koi.performance import StrategyPerformance
 from koi.modeling.cnn import CNN_Manager
 from koi.modeling.modeling_models import ModelParams
+from koi.step_metrics import STEP_METRICS
 
 class StrategyTarget(Enum):
     # non-modeled
@@ -76,6 +78,10 @@ class StrategyInterface:
         
 
     
+    def timed(self, stage: str, symbol: str = '*'):
+        """Times a block into the live step metrics (backtests aren't recorded)"""
+        return nullcontext() if self.is_backtest else STEP_METRICS.timed(self.name, stage, symbol)
+
     def training_required(self, symbols: List[str]) -> bool:
         """Returns whether the strategy uses targets that require training"""
         if self.targets == [StrategyTarget.cnn]:
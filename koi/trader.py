@@ -2,20 +2,30 @@ import asyncio, time
 from asyncio.events import AbstractEventLoop
 from datetime import datetime, timedelta
 from threading import Thread
-from typing import Optional, Union, Dict, List
-import eel
+from typing import Optional, Tuple, Union, Dict, List
 from ib_insync.contract import Contract, Stock
 import pandas as pd
-from multiprocessing.pool import ThreadPool
 from timeit import default_timer as timer
+from dotenv import dotenv_values
 
 from koi.broker import Broker
 from koi.strategies.root import StrategyInterface
-from koi.models import CryptoContract, Decision, Move, TransactionReport
+from koi.models import CryptoContract, Decision, Move, OrderTicket, TransactionReport, TransactionType
 from koi.portfolio import Portfolio
 from koi.utils import save_strategy_data, save_transaction, to_bar_size, save_strategy_config
 from koi.market_data import Market, apply_strategies, IB_Client, ApplyConfig
+from koi.market_data.helpers.ib_pacing import PRIORITY_LIVE
+from koi.market_data.helpers.ib_history import MAX_CHUNK_SECONDS
+from koi.market_data.helpers.handoff import SPSCQueue
+from koi.market_data.helpers.bar_ring import BarFrames
 from koi.notifier import NotificationService
+from koi.runtime import RUNTIME
+from koi.persistence import PERSISTENCE
+from koi.scheduler import SCHEDULER
+from koi.step_metrics import STEP_METRICS
+from koi.workers import PROCESS_MODE, WORKERS, StrategyWorker
+
+env = dotenv_values('.env')
 
 
 class Trader:
@@ -24,14 +34,16 @@ class Trader:
         Event Flow:
             * Fetch initial data to be used for training (if needed) & analysis (if req'd)
             * Trigger training & analysis of each portfolio dataframe in parallel
-            * 'Step' is called each strategy-specified time period apart to trigger a buy/sell decision
+            * 'Step' is called each strategy-specified time period apart to trigger a buy/sell decision,
+              running fetch -> merge -> indicators -> predict -> orders as async stages on the shared runtime
             * Stategy state is saved upon execution of buy/sell decisions and portfolio updates 
     """
     strategy: StrategyInterface
     broker: Broker
     md: Market
     ns: NotificationService
-    dfs: Dict[str, pd.DataFrame] = {}
+    dfs: BarFrames          # live bars per symbol, read as Dict[str, pd.DataFrame]
+    bar_capacity: int = 200
 
     active: bool = False
     stage: str = ''
@@ -39,11 +51,32 @@ class Trader:
     analysis_dfs: Dict[str, pd.DataFrame] = {}
     train_dfs: Dict[str, pd.DataFrame] = {}
 
+    # Completed bars pushed by live bar subscriptions (IB loop thread), consumed by the next step
+    live_bars: SPSCQueue
+    live_bar_size: Optional[str] = None
+    live_bar_grace: float = 5 # seconds a step waits for subscribed bars before requesting them
+
+    # One step in flight at a time, each finishing within `step_budget` of its bar's period
+    step_budget: float = float(env.get('STEP_BUDGET') or 0.8)
+    stepping: bool = False
+    pending_bar: Optional[float] = None     # latest bar close that fired while a step was in flight
+    step_counts: Dict[str, int]             # steps, overlaps, skipped, overruns, degraded
+    last_step_duration: float = 0.0
+
+    # Process mode: predictions run in the strategy's worker process, fed bars through shared memory
+    worker: Optional[StrategyWorker] = None
+
     def __init__(self, strategy: StrategyInterface, marketData: Market, broker: Broker, notifier: NotificationService):
         self.broker = broker
         self.strategy = strategy
         self.md = marketData
         self.ns = notifier
+        self.dfs = BarFrames(self.bar_capacity)
+        self.step_counts = { 'steps': 0, 'overlaps': 0, 'skipped': 0, 'overruns': 0, 'degraded': 0 }
+        self._predicting: Optional[asyncio.Future] = None
+        self._fetching: Optional[asyncio.Future] = None
+        self.live_bars = SPSCQueue(f'{strategy.name}:live_bars', maxsize=max(1, len(strategy.contracts)) * 4)
+        self._bars_arrived: Optional[asyncio.Event] = None # created on the runtime loop by the first step
 
 
 
@@ -77,7 +110,7 @@ class Trader:
         loop.run_until_complete(self.strategy.prepare(self.train_dfs, self.analysis_dfs))
 
         if start_once_complete:
-            th = Thread(target=lambda:loop.run_until_complete(self.start(loop)))
+            th = Thread(target=self.start, args=[loop])
             th.start()
 
         return True
@@ -88,7 +121,6 @@ class Trader:
         asyncio.set_event_loop(loop)
         bar_size = to_bar_size(self.strategy.trade_config.trade_frequency, self.strategy.crypto)
 
-        pool = ThreadPool(processes=1)
         if self.strategy.analyzer is not None: # Obtain data for analysis if required
             
             # Determine which symbols have not yet been analyzed
@@ -97,8 +129,7 @@ class Trader:
             fetch_contracts = [c for c in contracts]
 
             if len(fetch_contracts) > 0:                
-                async_result = pool.apply_async(self.md.get_historical_data, (fetch_contracts, bar_size, self.strategy.analysis_config.duration, end_date, True, ApplyConfig(len(unanalyzed_contracts) > 0, True, self.strategy.cnn_manager.lookbacks([c.symbol for c in fetch_contracts]))))
-                analysis_data = async_result.get()
+                analysis_data = RUNTIME.blocking(self.md.get_historical_data, fetch_contracts, bar_size, self.strategy.analysis_config.duration, end_date, True, ApplyConfig(len(unanalyzed_contracts) > 0, True, self.strategy.cnn_manager.lookbacks([c.symbol for c in fetch_contracts])))
             else: analysis_data = {}
     
             for sym, df in analysis_data: self.analysis_dfs[sym] = df
@@ -114,8 +145,7 @@ class Trader:
                 self.train_dfs = self.analysis_dfs
                 print(f'{self.strategy.name}:Setup:Train Data Fetched - Used cached analysis data')
             else:
-                async_result = pool.apply_async(self.md.get_historical_data, (untrained_contracts, bar_size, self.strategy.trade_config.train_duration, end_date, True, ApplyConfig(True, True, self.strategy.cnn_manager.lookbacks([c.symbol for c in untrained_contracts]))))
-                train_data = async_result.get()
+                train_data = RUNTIME.blocking(self.md.get_historical_data, untrained_contracts, bar_size, self.strategy.trade_config.train_duration, end_date, True, ApplyConfig(True, True, self.strategy.cnn_manager.lookbacks([c.symbol for c in untrained_contracts])))
                 print(f'{self.strategy.name}:Setup:Train Data Fetched')
                 for sym, df in train_data: self.train_dfs[sym] = df
 
@@ -131,12 +161,11 @@ class Trader:
         Begins trading flow
             * Fetches recent data if required (e.g. arima requires recent data)
             * Sets up portfolios if needed
-            * Kicks off step timer
+            * Registers the step with the bar scheduler
         """
         self.active = True
         self.strategy.active = True
         asyncio.set_event_loop(main_loop)
-        fut = asyncio.Future()
 
         # Prepare strategy if needed
         if not self.strategy.prepared:
@@ -156,154 +185,320 @@ class Trader:
 
             print(f'{self.strategy.name}:Start:Fetching initial data')
 
-            pool = ThreadPool(processes=1)
-            async_result = pool.apply_async(self.md.get_historical_data, (contracts, bar_size, self.strategy.trade_config.recent_data_duration, '', False, ApplyConfig(True, False, self.strategy.cnn_manager.lookbacks([c.symbol for c in contracts]), self.strategy.cnn_manager.cols(contracts))))
-            initial_data = async_result.get()
+            initial_data = RUNTIME.blocking(self.md.get_historical_data, contracts, bar_size, self.strategy.trade_config.recent_data_duration, '', False, ApplyConfig(True, False, self.strategy.cnn_manager.lookbacks([c.symbol for c in contracts]), self.strategy.cnn_manager.cols(contracts)))
             
             print(f'{self.strategy.name}:Start:Initial Data Fetched:')
-            self.dfs = { sym: df for sym, df in initial_data }
+            for sym, df in initial_data: self.dfs[sym] = df
+
+        # Carry trade history across restarts
+        self.strategy.performance.restore(self.strategy.name)
 
         # Create portfolio for each df if is not already created
         for sym in self.dfs.keys():
             hold_start = self.dfs[sym].iloc[-1]['close']
             self.strategy.portfolios[sym] = Portfolio(hold_start, stop_loss_pct=self.strategy.trade_config.stop_loss_pct, symbol=sym)
 
-        # Start refresh cycle + wait for good time to start (i.e. cur_minute % frequency = 0 to avoid lag)
-        freq = self.strategy.trade_config.trade_frequency
-        cur_minute = datetime.now().minute
-        if freq > 60:
-            freq_mins = freq / 60
-            if freq_mins < 60 and cur_minute % freq_mins != 0:  # wait for start of frequency period
-                print(f'Waiting {freq_mins - (cur_minute % freq_mins)} minutes for start of frequency period')
-                eel.sleep((freq_mins - (cur_minute % freq_mins)) * 60)
-            elif freq_mins >= 60 and freq_mins < 1440 and cur_minute != 0:      # wait till top of the hour
-                print(f'Waiting {60 - cur_minute} minutes till start of top of the next hour')
-                eel.sleep((60 - cur_minute) * 60)
-        
-        Thread(target=self.start_refresh_cycle, args=(main_loop, fut)).start()
+        # Models & analyses are ready on disk now, so the worker can load the prepared strategy
+        if PROCESS_MODE:
+            try: self.worker = WORKERS.add(self.strategy.name, self.analysis_dfs)
+            except Exception as e:
+                print(f'{self.strategy.name}:Start:worker failed to start, predicting in-process:', e)
+                WORKERS.remove(self.strategy.name)
+                self.worker = None
 
+        # Steps fire at each bar close (+ settle delay) from the shared scheduler
+        self.subscribe_live_bars()
+        SCHEDULER.add(self.strategy.name, self.strategy.trade_config.trade_frequency, self.step_async)
 
-    def start_refresh_cycle(self, loop: AbstractEventLoop, future: asyncio.Future):
-        """
-        Continously executes move analysis according to
-        trader's move frequency until program exit
-        """
-        while self.active:
-            Thread(target=self.step, args=[loop]).start()
-            eel.sleep(self.strategy.trade_config.trade_frequency)
 
-        print('\n\n\n\nCOMPLETE\n\n\n')
-        future.set_result(True) # tell main thread to close this thread
-        return True
+    def stop(self):
+        """Stops stepping, any step in flight is left to finish"""
+        self.active = False
+        self.strategy.active = False
+        SCHEDULER.remove(self.strategy.name)
+        self.unsubscribe_live_bars()
+        if self.worker is not None: WORKERS.remove(self.strategy.name)
+        self.worker = None
+        print(f'{self.strategy.name}:Trader:stopped')
 
 
 
-    def update_dfs(self, sym: str, df: pd.DataFrame):
-        if sym not in self.dfs.keys():
+    def subscribe_live_bars(self):
+        """Streams completed bars for IB stock strategies so steps don't need a historical request per symbol"""
+        bar_size = to_bar_size(self.strategy.trade_config.trade_frequency, self.strategy.crypto)
+        if not isinstance(self.md, IB_Client) or self.strategy.crypto: return
+        if bar_size not in MAX_CHUNK_SECONDS or bar_size == '1 secs': return # keepUpToDate requires a standard bar size of 5 secs or more
+
+        self.live_bar_size = bar_size
+        self.md.subscribe_bars(self.strategy.contracts, bar_size, self._on_live_bar)
+
+    def unsubscribe_live_bars(self):
+        if self.live_bar_size is None: return
+        self.md.unsubscribe_bars([c.symbol for c in self.strategy.contracts], self.live_bar_size, self._on_live_bar)
+        self.live_bar_size = None
+
+    def _on_live_bar(self, sym: str, df: pd.DataFrame):
+        self.live_bars.put((sym, df))
+        if self._bars_arrived is not None: RUNTIME.loop.call_soon_threadsafe(self._bars_arrived.set)
+
+    def pumped_symbols(self) -> set:
+        """Symbols whose live bar subscription is open on a running IB loop, i.e. whose bars can still arrive"""
+        if self.live_bar_size is None or not self.md.loop_running or not self.md.ib.isConnected(): return set()
+        return set(c.symbol for c in self.strategy.contracts if (c.symbol, self.live_bar_size) in self.md.bar_subscriptions)
+
+    async def take_live_bars(self, grace: float) -> Dict[str, pd.DataFrame]:
+        """Collects bars pushed since the last step, waiting up to `grace` seconds for bars that close just after the step fires"""
+        if self.live_bar_size is None: return {}
+        if self._bars_arrived is None: self._bars_arrived = asyncio.Event()
+
+        deadline = time.monotonic() + grace
+        symbols = self.pumped_symbols()
+        bars = {}
+        while True:
+            self._bars_arrived.clear() # cleared before draining so a bar pushed meanwhile sets it again
+            for sym, df in self.live_bars.drain(): bars[sym] = df # pushed frames hold the latest completed bars, newest wins
+
+            remaining = deadline - time.monotonic()
+            if symbols.issubset(bars.keys()) or remaining <= 0: break
+            try: await asyncio.wait_for(self._bars_arrived.wait(), remaining)
+            except asyncio.TimeoutError: break
+        return bars
+
+
+    def merge_bars(self, sym: str, df: pd.DataFrame) -> int:
+        """Appends the newest bar(s) (max = 2 for now) to the symbol's ring buffer, returning how many were new"""
+        if sym not in self.dfs:
             print(f'WARNING: {sym} not in self.dfs')
-            return
+            return 0
 
-        if 'unix' not in self.dfs[sym].columns.tolist():
-            self.dfs[sym]['unix'] = self.dfs[sym]['date'].apply(lambda d: d.timestamp())
-
-        latest_row = df.iloc[[-1]]
-        existing_timestamps = self.dfs[sym]['unix'].tolist()
-        if latest_row.iloc[-1]['unix'] in existing_timestamps:
+        ring = self.dfs.ring(sym)
+        with self.strategy.timed('merge', sym): added = ring.extend(df.iloc[-2:])
+        if added == 0:
             print('latest data already in dataframe - skipping update')
             print(df.tail(2))
-            return
-
-        # check if we need to merge more than one row (max = 2 for now)
-        if df.shape[0] > 1 and df.iloc[-2]['unix'] not in existing_timestamps:
-            print('merging multiple')
-            df = pd.concat([self.dfs[sym], df.iloc[-2:]], ignore_index=True)
-        else:
-            df = pd.concat([self.dfs[sym], latest_row], ignore_index=True)
-
-        if len(df) > 200:
-            df.drop(df.index[:(len(df) - 200)], inplace=True)
-
-        date = df.iloc[-1]['date']
-        print(f'\nUpdated {sym} data for step ending @ {date} | {df.shape[0]} rows')
-        if self.strategy.analyzer is not None:
-            self.dfs[sym] = apply_strategies(sym, df, self.strategy.trade_config.trade_frequency, list(self.strategy.analyzer.analysis.data[sym].indicators.keys()), lookback=3)
-        elif self.strategy.cnn_manager is not None:
-            self.dfs[sym] = apply_strategies(sym, df, self.strategy.trade_config.trade_frequency, self.strategy.cnn_manager.cols_for(sym), lookback=self.strategy.cnn_manager.lookbacks([sym])[sym])
-        else:
-            self.dfs[sym] = apply_strategies(sym, df, self.strategy.trade_config.trade_frequency)
-        self.dfs[sym].to_csv(f'config/visited/{self.strategy.name}_{sym}.csv')
-
-        return
-
-    def step(self, loop: AbstractEventLoop):
-        """Combine the latest bar with existing data + makes/executes moves + state updates"""
-        print(f'\n\n{self.strategy.name}:Step')
-        asyncio.set_event_loop(loop)
-        start = timer()
-        pool = ThreadPool(processes=1)
-        async_result = pool.apply_async(self.md.get_historical_data, (self.strategy.contracts, to_bar_size(self.strategy.trade_config.trade_frequency, self.strategy.crypto), f'{self.strategy.trade_config.trade_frequency} S', '', False))
-        latest_bars = async_result.get()
+            return 0
+
+        if added > 1: print('merging multiple')
+        print(f'\nUpdated {sym} data for step ending @ {df.iloc[-1]["date"]} | {len(ring)} rows')
+        return added
+
+    def apply_indicators(self, sym: str, added: int):
+        """Computes the strategy's indicators over the buffered bars, storing them for the `added` newest bars only"""
+        with self.strategy.timed('indicators', sym):
+            df = self.dfs[sym]
+            if self.strategy.analyzer is not None:
+                df = apply_strategies(sym, df, self.strategy.trade_config.trade_frequency, list(self.strategy.analyzer.analysis.data[sym].indicators.keys()), lookback=3)
+            elif self.strategy.cnn_manager is not None:
+                df = apply_strategies(sym, df, self.strategy.trade_config.trade_frequency, self.strategy.cnn_manager.cols_for(sym), lookback=self.strategy.cnn_manager.lookbacks([sym])[sym])
+            else:
+                df = apply_strategies(sym, df, self.strategy.trade_config.trade_frequency)
+            self.dfs.ring(sym).assign_tail(df, added)
+        with self.strategy.timed('persist', sym): PERSISTENCE.put(f'config/visited/{self.strategy.name}_{sym}.csv', self.dfs[sym].copy().to_csv)
+
+    def update_dfs(self, sym: str, df: pd.DataFrame):
+        added = self.merge_bars(sym, df)
+        if added > 0: self.apply_indicators(sym, added)
+
+
+    # Step pipeline stages, blocking work is handed to the runtime's shared executor
+    async def fetch_stage(self, budget: float) -> List[Tuple[str, pd.DataFrame]]:
+        """
+        Uses bars pushed by live subscriptions, only requesting the ones that haven't arrived.
+        An abandoned request keeps running on its worker, so later steps hold the missing symbols until it has finished.
+        """
+        latest_bars = list((await self.take_live_bars(min(self.live_bar_grace, max(budget, 0)))).items())
+        received = [sym for sym, _ in latest_bars]
+        missing = [c for c in self.strategy.contracts if c.symbol not in received]
+        if len(missing) == 0: return latest_bars
 
-        # Update the dfs with latest data in parallel
-        ths = [Thread(target=self.update_dfs, args=[sym, df]) for sym, df in latest_bars]
-        for th in ths: th.start()
-        for th in ths: th.join()
+        if self._fetching is not None and not self._fetching.done():
+            self.step_counts['degraded'] += 1
+            print(f'{self.strategy.name}:Step:previous bar request still running - holding {[c.symbol for c in missing]}')
+            return latest_bars
 
-        # Fit the new data and make buy/sell/hold decision
-        next_moves, _ = self.strategy.determine_next_move(self.dfs)
+        bar_size = to_bar_size(self.strategy.trade_config.trade_frequency, self.strategy.crypto)
+        self._fetching = asyncio.ensure_future(RUNTIME.call(self.md.get_historical_data, missing, bar_size, f'{self.strategy.trade_config.trade_frequency} S', '', False, priority=PRIORITY_LIVE))
+        latest_bars += await asyncio.shield(self._fetching)
+        return latest_bars
+
+    async def merge_stage(self, latest_bars: List[Tuple[str, pd.DataFrame]]) -> Dict[str, int]:
+        added = await asyncio.gather(*[RUNTIME.call(self.merge_bars, sym, df) for sym, df in latest_bars])
+        return { sym: n for (sym, _), n in zip(latest_bars, added) if n > 0 }
+
+    async def indicators_stage(self, merged: Dict[str, int]):
+        await asyncio.gather(*[RUNTIME.call(self.apply_indicators, sym, added) for sym, added in merged.items()])
+
+    async def predict_stage(self, budget: float) -> List[Decision]:
+        """
+        Predictions are optional: when they can't finish within `budget` seconds the step degrades to holding.
+        An abandoned prediction keeps running on its worker, so later steps hold until it has finished.
+        """
+        if self._predicting is not None and not self._predicting.done():
+            self.step_counts['degraded'] += 1
+            print(f'{self.strategy.name}:Step:previous prediction still running - holding')
+            return []
+
+        self._predicting = asyncio.ensure_future(RUNTIME.call(self.determine_next_move))
+        try: next_moves, _ = await asyncio.wait_for(asyncio.shield(self._predicting), max(budget, 0))
+        except asyncio.TimeoutError:
+            self.step_counts['degraded'] += 1
+            print(f'{self.strategy.name}:Step:predictions exceeded {budget:.1f}s budget - holding')
+            return []
 
         if len(next_moves) > 0: print('Moves:', [f'{m.move} | {m.symbol}, {m.quantity}' for m in next_moves])
         else: print('No Moves.')
-        transactions = self.execute_moves(next_moves, self.dfs)
-        for transaction in transactions: self.ns.notify_transaction(transaction)
+        return next_moves
+
+    def determine_next_move(self) -> Tuple[List[Decision], dict]:
+        """Predicts in the strategy's worker process when it has one, in-process otherwise"""
+        if self.worker is not None: return self.worker.determine_next_move(self.strategy, self.dfs)
+        return self.strategy.determine_next_move(self.dfs)
+
+    async def orders_stage(self, next_moves: List[Decision], latest_bars: List[Tuple[str, pd.DataFrame]]) -> List[TransactionReport]:
+        with self.strategy.timed('order'): transactions = await RUNTIME.call(self.execute_moves, next_moves, self.dfs)
+        for transaction in transactions:
+            with self.strategy.timed('notify', transaction.symbol): self.ns.notify_transaction(transaction)
 
         last_states = { sym: df.iloc[-1] for (sym, df) in latest_bars }
         # self.strategy.evaluate_funds(transactions, last_states)
         self.strategy.performance.update(self.strategy.portfolios, transactions, last_states)
-        
-        print(f'{self.strategy.name}:Step:complete ({timer() - start}s)')
-        return True # indicate end of step thread
+        return transactions
+
+    async def step_async(self, bar_close: float = None) -> bool:
+        """
+        Runs a step unless one is already in flight. Bars firing meanwhile are coalesced into the latest one,
+        which runs once the current step finishes if its own period hasn't already passed.
+        """
+        if bar_close is None: bar_close = time.time()
+        if self.stepping:
+            self.step_counts['overlaps'] += 1
+            if self.pending_bar is not None: self.step_counts['skipped'] += 1
+            self.pending_bar = bar_close
+            print(f'{self.strategy.name}:Step:still in {self.stage}, coalescing bar closing @ {datetime.fromtimestamp(bar_close)}')
+            return False
+
+        self.stepping = True
+        try:
+            completed = await self.run_step(bar_close)
+            while self.pending_bar is not None:
+                bar_close, self.pending_bar = self.pending_bar, None
+                if time.time() >= bar_close + self.strategy.trade_config.trade_frequency:
+                    self.step_counts['skipped'] += 1
+                    print(f'{self.strategy.name}:Step:skipping stale bar closing @ {datetime.fromtimestamp(bar_close)}')
+                    continue
+                completed = await self.run_step(bar_close)
+            return completed
+        finally: self.stepping = False
+
+    async def run_step(self, bar_close: float) -> bool:
+        """Combine the latest bar with existing data + makes/executes moves + state updates"""
+        print(f'\n\n{self.strategy.name}:Step for bar closing @ {datetime.fromtimestamp(bar_close)}')
+        self.step_counts['steps'] += 1
+        start = timer()
+        deadline = bar_close + self.strategy.trade_config.trade_frequency * self.step_budget
+        try:
+            # Without data there is nothing to step on, so fetching is bounded by the whole budget
+            self.stage = 'fetch'
+            with self.strategy.timed('fetch'): latest_bars = await asyncio.wait_for(self.fetch_stage(deadline - time.time()), max(deadline - time.time(), 0))
+
+            # Merging & indicators always complete so dfs never miss a bar
+            self.stage = 'merge'
+            with self.strategy.timed('merge'): merged = await self.merge_stage(latest_bars)
+            self.stage = 'indicators'
+            with self.strategy.timed('indicators'): await self.indicators_stage(merged)
+
+            self.stage = 'predict'
+            with self.strategy.timed('predict'): next_moves = await self.predict_stage(deadline - time.time()) # fit, model & decide (+ the worker round trip in process mode)
+
+            # Orders are never placed on a bar whose budget has run out
+            if time.time() > deadline:
+                self.step_counts['overruns'] += 1
+                print(f'{self.strategy.name}:Step:overran budget before placing orders, skipping {len(next_moves)} move(s)')
+                return False
+            self.stage = 'orders'
+            await self.orders_stage(next_moves, latest_bars)
+        except asyncio.TimeoutError:
+            self.step_counts['overruns'] += 1
+            print(f'{self.strategy.name}:Step:{self.stage} overran budget, step abandoned')
+            return False
+        except asyncio.CancelledError:
+            print(f'{self.strategy.name}:Step:cancelled during {self.stage}')
+            raise
+        except Exception as e:
+            print(f'{self.strategy.name}:Step:{self.stage} error:', e)
+            return False
+        finally:
+            self.stage = ''
+            self.last_step_duration = timer() - start
+            STEP_METRICS.record(self.strategy.name, 'step', self.last_step_duration)
+
+        print(f'{self.strategy.name}:Step:complete ({self.last_step_duration}s)')
+        return True
+
+    def step_stats(self) -> dict:
+        return dict(self.step_counts, stepping=self.stepping, stage=self.stage, last_duration=self.last_step_duration, budget=self.step_budget)
+
+    def step(self, loop: AbstractEventLoop = None) -> bool:
+        """Runs a single step on the runtime loop and waits for it"""
+        return RUNTIME.run(self.step_async())
 
 
     def execute_moves(self, moves: List[Decision], dfs: Dict[str, pd.DataFrame], is_backtest: bool = False) -> List[TransactionReport]:
         """
         Given a list of moves, communicates with broker to execute buys/sells and
-        updates symbol portfolios appropriately.
+        updates symbol portfolios appropriately. Orders on each side are submitted together and recorded as they fill.
         """
         reports = []
 
         # First perform all sell decisions to free up capital
-        for decision in [m for m in moves if m.move == Move.Sell]:
-            state_at_move = dfs[decision.symbol].iloc[-1]
-            transaction = self.broker.attempt_market_sell(decision, state_at_move, is_backtest, self.strategy.crypto)
-            if transaction.succeeded:
-                pl = transaction.strike - self.strategy.portfolios[decision.symbol].purchase_price
+        sells = [self.broker.prepare_sell(d, dfs[d.symbol].iloc[-1], is_backtest, self.strategy.crypto) for d in moves if d.move == Move.Sell]
+        reports += self.record_fills(sells, is_backtest)
+
+        # Backtests size each buy after the previous fill has been charged (fees & fee tier included), as they always have
+        decisions = [m for m in moves if m.move == Move.Buy]
+        if is_backtest:
+            for decision in decisions: reports += self.record_fills([self.broker.prepare_buy(decision, self.strategy.available_capital, dfs[decision.symbol].iloc[-1], is_backtest, self.strategy.crypto)], is_backtest)
+            return reports
+
+        # Live, size buys one at a time against the capital (incl. expected fees) earlier buys haven't reserved, then submit them together
+        buys, reserved = [], 0
+        for decision in decisions:
+            ticket = self.broker.prepare_buy(decision, self.strategy.available_capital - reserved, dfs[decision.symbol].iloc[-1], is_backtest, self.strategy.crypto)
+            reserved += self.broker.expected_cost(ticket)
+            buys.append(ticket)
+        reports += self.record_fills(buys, is_backtest)
+
+        return reports
+
+    def record_fills(self, tickets: List[OrderTicket], is_backtest: bool = False) -> List[TransactionReport]:
+        """Submits orders together, updating portfolios, the journal & available capital as each fill arrives"""
+        reports = []
+        if len(tickets) == 0: return reports
+
+        submitted = timer()
+        for transaction in self.broker.fill_all(tickets):
+            if not self.strategy.is_backtest: STEP_METRICS.record(self.strategy.name, 'order', timer() - submitted, transaction.symbol)
+            if not transaction.succeeded: continue
+            state_at_move = [t.state for t in tickets if t.symbol == transaction.symbol][0]
+
+            if transaction.transaction_type == TransactionType.MarketSell:
+                pl = transaction.strike - self.strategy.portfolios[transaction.symbol].purchase_price
                 print(f'SOLD {transaction.symbol:<20} @ ', transaction.strike, f', p/l: {pl:.2f}')
                 # Update the portfolio with the sell info
-                self.strategy.portfolios[decision.symbol].sold(transaction.strike, transaction.quantity)
-
-                # Keep a record of the transaction
-                report = save_transaction(self.strategy, transaction, state_at_move, is_backtest)
-                reports.append(report)
-                self.strategy.evaluate_funds([report], {report.symbol: state_at_move})
-
-        # Now, perform buy decisions
-        for decision in [m for m in moves if m.move == Move.Buy]:
-            state_at_move = dfs[decision.symbol].iloc[-1]
-            transaction = self.broker.attempt_market_buy(decision, self.strategy.available_capital, state_at_move, is_backtest, self.strategy.crypto)
-            if transaction.succeeded:
+                self.strategy.portfolios[transaction.symbol].sold(transaction.strike, transaction.quantity)
+            else:
                 print(f'BOUGHT {transaction.symbol:<20} @ ', transaction.strike)
                 # Create portfolio for given symbol if it doesn't yet exist
-                if decision.symbol not in self.strategy.portfolios.keys():
-                    self.strategy.portfolios[decision.symbol] = Portfolio()
+                if transaction.symbol not in self.strategy.portfolios.keys():
+                    self.strategy.portfolios[transaction.symbol] = Portfolio()
 
                 # Update the portfolio with the purchase info
-                self.strategy.portfolios[decision.symbol].purchased(transaction.strike, transaction.quantity, transaction.date, transaction.confidence)
+                self.strategy.portfolios[transaction.symbol].purchased(transaction.strike, transaction.quantity, transaction.date, transaction.confidence)
 
-                # Keep a record of the transaction
-                report = save_transaction(self.strategy, transaction, state_at_move, is_backtest)
-                reports.append(report)
-                self.strategy.evaluate_funds([report], {report.symbol: state_at_move})
+            # Keep a record of the transaction
+            with self.strategy.timed('persist', transaction.symbol): report = save_transaction(self.strategy, transaction, state_at_move, is_backtest)
+            reports.append(report)
+            self.strategy.evaluate_funds([report], {report.symbol: state_at_move})
 
         return reports
 
@@ -321,6 +516,7 @@ class Trader:
         keep = [c for c in self.strategy.contracts if self.strategy.portfolios[c.symbol].has_stock]
         new_contracts: List[Contract] = [Stock(sym, 'SMART') for sym in trending if sym not in list(map(lambda c: c.symbol, keep))] + keep
         self.strategy.contracts = new_contracts
+        if isinstance(self.md, IB_Client): self.md.qualify_contracts(new_contracts)
         self.setup(asyncio.get_event_loop(), True)
         
 
@@ -9,6 +9,8 @@ from dotenv import dotenv_values
 
 from koi.models import ContractData, CryptoContract, KoiState, StrategyInfo, Transaction, TransactionReport, TransactionType
 from koi.strategies import StrategyInterface
+from koi.journal import JOURNAL
+from koi.state_store import STATE
 
 class AppConfig():
     test_mode: bool
@@ -73,16 +75,6 @@ def set_config():
 # Strategy data saving
 
 def save_transaction(strategy: StrategyInterface, transaction: Transaction, transaction_state: Series, is_backtest: bool = False) -> TransactionReport:
-    df: pd.DataFrame
-    file_path = 'config/transactions/{}_transactions{}.csv'.format(strategy.name, '_bt' if is_backtest else '')
-    columns = ['date', 'symbol', 'type', 'price', 'quantity', 'confidence', 'hold_length', 'trade_pl', 'portfolio_pl', 'total_pl']
-
-    # Get existing transactions if they exist, else create a new data frame
-    if os.path.isfile(file_path):
-        try: df = pd.read_csv(file_path)
-        except: df = pd.DataFrame([], columns=columns)
-    else: df = pd.DataFrame([], columns=columns)
-
     relevant_portfolio = strategy.portfolios[transaction.symbol]
     cross_portfolio_pl = sum(list(map(lambda p: p.gross_profit, strategy.portfolios.values())))
     report: TransactionReport
@@ -101,20 +93,8 @@ def save_transaction(strategy: StrategyInterface, transaction: Transaction, tran
         report = TransactionReport(transaction.date, transaction, transaction.quantity * (transaction.strike - relevant_portfolio.purchase_price), relevant_portfolio.gross_profit, cross_portfolio_pl, hold_duration)
 
 
-    # Append new data and save the updated csv
-    df = df.append(pd.DataFrame([[
-        report.date,
-        report.symbol,
-        report.transaction_type,
-        report.strike,
-        report.quantity,
-        report.confidence,
-        report.hold_length,
-        report.tradePL,
-        report.portfolioPL,
-        report.totalPL
-    ]], columns=df.columns))
-    df.to_csv(file_path, index=False)
+    # Record the trade in the append-only journal
+    JOURNAL.record(strategy.name, report, is_backtest)
 
     return report
 
@@ -135,42 +115,36 @@ def save_strategy_data(dfs: Dict[str, pd.DataFrame], strategy_name: str):
 # State saving / loading
 def load_state() -> KoiState:
     '''
-    Loads the contents of the `state.json` file into a state object
+    Loads strategy state from the state store (importing `state.json` if it was edited)
     '''
-    try:
-        with open('config/state.json', 'r') as f:
-            data = json.loads(f.read())
-            return KoiState.from_json(data)
+    try: return STATE.load()
     except Exception as e:
-        print('Error Loading State: could not read json file')
+        print('Error Loading State: could not read state store')
         print(traceback.print_exc())
         return None
 
 def save_state(state: KoiState):
     '''
-    Write the contents of the state object to the `state.json` file.
+    Writes every strategy of the state object to the state store (and `state.json`)
     '''
-    pathlib.Path("config/").mkdir(parents=True, exist_ok=True)
-    with open('config/state.json', 'w+', encoding='utf-8') as f:
-        json.dump(state.__dict__, f, ensure_ascii=False, indent=4)
+    for info in state.strategies: STATE.save_strategy(info)
 
-def save_strategy_config(strategy: StrategyInterface):
+def save_strategy_config(strategy: StrategyInterface, fields: List[str] = None):
     '''
-    Updates the state file with an updated strategy config.
+    Updates a strategy's record in the state store, only the given fields if specified.
     '''
-    cur_state = load_state()
-    if cur_state and cur_state.strategies:
-        existing_config = [s for s in cur_state.strategies if s.name == strategy.name]
-
-        # Convert interface to info
-        contracts = [c if isinstance(c, CryptoContract) else ContractData.from_contract(c) for c in strategy.contracts]
-        updated_info = StrategyInfo(strategy.name, strategy.equity, strategy.available_capital, strategy.initial_capital, contracts, strategy.portfolios, strategy.start_date, strategy.trade_config, strategy.analysis_config)
-
-        if existing_config:
-            cur_state.strategies = [s for s in cur_state.strategies if s.name != strategy.name] + [updated_info]
-        else:
-            cur_state.strategies.append(updated_info)
-        save_state(cur_state)
+    contracts = [c if isinstance(c, CryptoContract) else ContractData.from_contract(c) for c in strategy.contracts]
+    values = {
+        'equity': strategy.equity,
+        'available_capital': strategy.available_capital,
+        'initial_capital': strategy.initial_capital,
+        'contracts': contracts,
+        'portfolios': strategy.portfolios,
+        'start_date': strategy.start_date,
+        'trade_config': strategy.trade_config,
+        'analysis_config': strategy.analysis_config,
+    }
+    STATE.update(strategy.name, **{ f: v for f, v in values.items() if fields is None or f in fields })
     
 
 
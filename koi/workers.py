@@ -0,0 +1,343 @@
+import multiprocessing, signal, threading, time, traceback
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np, pandas as pd
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from dotenv import dotenv_values
+
+from koi.models import Decision
+from koi.step_metrics import STEP_METRICS
+
+env = dotenv_values('.env')
+
+# Run each live strategy's predictions in its own process (fits & model predicts stop sharing the parent's GIL)
+PROCESS_MODE = (env.get('TRADER_PROCESSES') or '').lower() in ['1', 'true', 'yes']
+
+# Workers are spawned rather than forked, the parent runs feed & runtime threads a fork would copy mid-flight
+CONTEXT = multiprocessing.get_context('spawn')
+
+
+class SharedFrames(object):
+    """
+    Publishes DataFrames to shared memory: each key's numeric, bool & datetime columns are one float64 block that is
+    rewritten in place while large enough (replaced when not), so only a small descriptor crosses the pipe.
+    Object columns holding dates (bar rings & IB frames keep `date` as datetime objects) are packed as datetimes and
+    handed back as objects, other object columns, rare in bar frames, travel in the descriptor itself.
+    """
+    prefix: str
+    blocks: Dict[str, SharedMemory]
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.blocks = {}
+
+    def _block(self, key: str, size: int) -> SharedMemory:
+        block = self.blocks.get(key)
+        if block is not None and block.size >= size: return block
+        if block is not None: _release(block, unlink=True) # readers keep their mapping of the old block until they re-attach
+
+        self.blocks[key] = SharedMemory(create=True, size=max(size * 2, 8)) # headroom for the frame to grow
+        return self.blocks[key]
+
+    def publish(self, key: str, df: pd.DataFrame) -> dict:
+        columns, kinds, tz, objects, dates = [str(c) for c in df.columns], {}, {}, {}, {}
+        packed: List[np.ndarray] = []
+        for name, column in zip(columns, df.columns):
+            series = df[column]
+            kinds[name] = series.dtype.kind
+            if kinds[name] == 'O':
+                converted = _object_dates(series)
+                if converted is not None: series, kinds[name], dates[name] = converted, 'M', pd.api.types.infer_dtype(df[column], skipna=True)
+            if kinds[name] == 'M':
+                if getattr(series.dt, 'tz', None) is not None: tz[name] = str(series.dt.tz)
+                packed.append(series.values.astype('datetime64[ns]').astype(np.int64) / 1e9) # epoch seconds (UTC for tz-aware)
+            elif kinds[name] in 'biuf': packed.append(series.values.astype(np.float64))
+            else: objects[name] = series.tolist()
+
+        rows = df.shape[0]
+        block = self._block(key, rows * len(packed) * 8)
+        if len(packed) > 0:
+            view = np.ndarray((rows, len(packed)), dtype=np.float64, buffer=block.buf)
+            view[:] = np.column_stack(packed)
+            del view # exported buffers would keep the block from closing
+        return { 'key': key, 'block': block.name, 'rows': rows, 'columns': columns, 'kinds': kinds, 'tz': tz, 'objects': objects, 'dates': dates }
+
+    def publish_all(self, dfs: Mapping[str, pd.DataFrame], prefix: str = '') -> Dict[str, dict]:
+        return { sym: self.publish(f'{prefix}{sym}', dfs[sym]) for sym in list(dfs.keys()) }
+
+    def close(self):
+        for block in self.blocks.values(): _release(block, unlink=True)
+        self.blocks = {}
+
+
+class FrameReader(object):
+    """Worker-side counterpart of SharedFrames, rebuilding (copies of) the published frames"""
+    blocks: Dict[str, SharedMemory]
+
+    def __init__(self):
+        self.blocks = {}
+
+    def read(self, descriptor: dict) -> pd.DataFrame:
+        key, name = descriptor['key'], descriptor['block']
+        if key not in self.blocks or self.blocks[key].name != name:
+            if key in self.blocks: _release(self.blocks[key])
+            self.blocks[key] = SharedMemory(name=name)
+
+        columns, kinds, tz = descriptor['columns'], descriptor['kinds'], descriptor['tz']
+        packed = [c for c in columns if c not in descriptor['objects']]
+        view = np.ndarray((descriptor['rows'], len(packed)), dtype=np.float64, buffer=self.blocks[key].buf)
+        values = view.copy()
+        del view
+
+        data = {}
+        for i, name in enumerate(packed):
+            column, kind = values[:, i], kinds[name]
+            if kind == 'M':
+                dates = pd.to_datetime(column, unit='s', utc=name in tz)
+                data[name] = dates.tz_convert(tz[name]) if name in tz else dates
+                if name in descriptor['dates']: # published from an object column, handed back as one
+                    data[name] = pd.Series(data[name]).dt.date.values if descriptor['dates'][name] == 'date' else pd.Series(data[name]).astype(object).values
+            elif kind == 'b': data[name] = column.astype(bool)
+            elif kind in 'iu': data[name] = column.astype(np.int64)
+            else: data[name] = column
+        for name, column in descriptor['objects'].items(): data[name] = column
+        return pd.DataFrame({ name: data[name] for name in columns })
+
+    def read_all(self, descriptors: Dict[str, dict]) -> Dict[str, pd.DataFrame]:
+        return { sym: self.read(d) for sym, d in descriptors.items() }
+
+    def close(self):
+        for block in self.blocks.values(): _release(block)
+        self.blocks = {}
+
+
+def _object_dates(series: pd.Series) -> Optional[pd.Series]:
+    """An object column of datetimes/dates as datetime64 (None if it holds anything else, or mixed timezones)"""
+    if series.shape[0] == 0 or series.isna().any(): return None
+    if pd.api.types.infer_dtype(series, skipna=True) not in ['datetime', 'datetime64', 'date']: return None
+    try: converted = pd.to_datetime(series)
+    except (ValueError, TypeError): return None
+    return converted if converted.dtype.kind == 'M' else None
+
+def _release(block: SharedMemory, unlink: bool = False):
+    try:
+        block.close()
+        if unlink: block.unlink()
+    except Exception as e: print('SharedMemory release error:', e)
+
+
+
+# Worker process
+
+def worker_main(name: str, conn: Connection):
+    """Worker process entry point: rebuilds the strategy from its saved state, then answers requests until stopped"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # the parent handles ctrl-c & stops its workers
+    frames = FrameReader()
+    strategy = None
+    while True:
+        try: kind, payload = conn.recv()
+        except (EOFError, OSError): break # parent went away
+        if kind == 'stop': break
+
+        try:
+            if kind == 'init':
+                strategy = load_strategy(name, frames.read_all(payload['analysis']))
+                result = True
+            elif kind == 'predict':
+                if strategy is None: raise Exception('Strategy not initialised')
+                for attr, value in payload['account'].items(): setattr(strategy, attr, value)
+                moves, _ = strategy.determine_next_move(frames.read_all(payload['bars']))
+                result = (moves, STEP_METRICS.export(name))
+            else: raise Exception(f'Unknown request {kind}')
+            conn.send(('ok', result))
+        except Exception as e:
+            traceback.print_exc()
+            conn.send(('error', repr(e)))
+            if strategy is None: break # without a strategy every request would fail, exiting lets the supervisor restart it
+
+    frames.close()
+
+def load_strategy(name: str, analysis_dfs: Dict[str, pd.DataFrame]):
+    """The live strategy as the parent prepared it: models & analyses were saved by its setup, analysis data is shared"""
+    from koi.strategies import get_defined_strategies
+    from koi.utils import load_state
+
+    strategies = { s.name: s for s in get_defined_strategies() }
+    info = { s.name: s for s in load_state().strategies }[name]
+    strategy = strategies[name](info)
+    if strategy.cnn_manager is not None: strategy.cnn_manager.load_existing_models([c.symbol for c in strategy.contracts])
+    if strategy.analyzer is not None:
+        for sym, df in analysis_dfs.items(): strategy.analyzer.dfs[sym] = df
+    strategy.prepared = True
+    strategy.active = True
+    print(f'{name}:Worker:ready')
+    return strategy
+
+
+
+class StrategyWorker(object):
+    """
+    Parent-side handle of a strategy's worker process. Bars are published to shared memory with each request and the
+    worker answers with the strategy's decisions; orders stay with the parent, which owns the broker connections.
+    """
+    name: str
+    process: Optional[multiprocessing.Process] = None
+    started: float = 0
+    restarts: int = 0
+    requests: int = 0
+    errors: int = 0
+    last_error: str = ''
+    restart_delay: float = 1
+    retry_at: float = 0
+
+    def __init__(self, name: str, analysis_dfs: Dict[str, pd.DataFrame] = None):
+        self.name = name
+        self.frames = SharedFrames(name)
+        self._analysis = analysis_dfs or {}
+        self._conn: Optional[Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        with self._lock:
+            conn, child = CONTEXT.Pipe()
+            self.process = CONTEXT.Process(target=worker_main, args=(self.name, child), name=f'koi-{self.name}', daemon=True)
+            self.process.start()
+            child.close()
+            self._conn = conn
+            self.started = time.time()
+            try: self._request('init', analysis=self.frames.publish_all(self._analysis, 'analysis:'))
+            except Exception as e: error = e
+            else: error = None
+
+        if error is not None:
+            self.stop() # a worker that couldn't load its strategy is treated as crashed
+            raise error
+        print(f'{self.name}:Worker:started (pid {self.process.pid})')
+
+    def stop(self, timeout: float = 5):
+        with self._lock:
+            if self.alive:
+                try: self._conn.send(('stop', {}))
+                except Exception: pass
+                self.process.join(timeout)
+                if self.process.is_alive(): self.process.terminate()
+            if self._conn is not None: self._conn.close()
+            self._conn = None
+            self.frames.close()
+
+    def _request(self, kind: str, **payload) -> Any:
+        """Sends a request & waits for its answer, failing fast if the worker dies meanwhile. Callers hold the lock"""
+        self._conn.send((kind, payload))
+        while not self._conn.poll(1):
+            if not self.process.is_alive(): raise Exception(f'{self.name} worker exited ({self.process.exitcode})')
+
+        status, result = self._conn.recv()
+        if status == 'error':
+            self.errors += 1
+            self.last_error = result
+            raise Exception(f'{self.name} worker: {result}')
+        return result
+
+    def determine_next_move(self, strategy, dfs: Mapping[str, pd.DataFrame]) -> Tuple[List[Decision], dict]:
+        """The strategy's decisions for the latest bars, made in the worker against the parent's current account"""
+        with self._lock:
+            if not self.alive: raise Exception(f'{self.name} worker is not running')
+            account = { 'available_capital': strategy.available_capital, 'equity': strategy.equity, 'portfolios': strategy.portfolios }
+            moves, timings = self._request('predict', bars=self.frames.publish_all(dfs), account=account)
+            self.requests += 1
+
+        STEP_METRICS.absorb(timings)
+        # Orders go out on the parent's (qualified) contracts
+        contracts = { c.symbol: c for c in strategy.contracts }
+        for move in moves: move.contract = contracts.get(move.symbol, move.contract)
+        return moves, {}
+
+    def to_dict(self) -> dict:
+        return {
+            'pid': self.process.pid if self.process is not None else None, 'alive': self.alive,
+            'uptime': time.time() - self.started if self.alive else 0, 'restarts': self.restarts,
+            'requests': self.requests, 'errors': self.errors, 'last_error': self.last_error,
+        }
+
+
+
+class WorkerSupervisor(object):
+    """
+    Owns every strategy worker, restarting any that crash. Restarts back off exponentially (up to `max_delay`)
+    while a worker keeps crashing within a minute of starting.
+    """
+    interval: float
+    max_delay: float
+    workers: Dict[str, StrategyWorker]
+
+    def __init__(self, interval: float = 2, max_delay: float = 60):
+        self.interval = interval
+        self.max_delay = max_delay
+        self.workers = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, name: str, analysis_dfs: Dict[str, pd.DataFrame] = None) -> StrategyWorker:
+        self.remove(name)
+        worker = StrategyWorker(name, analysis_dfs)
+        with self._lock: self.workers[name] = worker
+        worker.start()
+        self._start()
+        return worker
+
+    def remove(self, name: str):
+        with self._lock: worker = self.workers.pop(name, None)
+        if worker is not None: worker.stop()
+
+    def to_dict(self) -> Dict[str, dict]:
+        with self._lock: workers = list(self.workers.items())
+        return { name: w.to_dict() for name, w in workers }
+
+    def shutdown(self):
+        self._stopped.set()
+        for name in list(self.workers.keys()): self.remove(name)
+
+
+    # Supervision
+    def _start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive(): return
+            self._thread = threading.Thread(target=self._run, name='koi-supervisor', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock: workers = list(self.workers.values())
+            for worker in workers:
+                if not worker.alive: self.restart(worker)
+
+    def restart(self, worker: StrategyWorker):
+        """
+        Restarts an exited worker. A crash within a minute of starting doubles `restart_delay` (up to `max_delay`)
+        and the restart waits it out, a worker that ran longer is restarted straight away.
+        """
+        now = time.time()
+        if worker.retry_at <= worker.started: # exit not handled yet
+            crashed_early = now - worker.started < 60
+            worker.restart_delay = min(worker.restart_delay * 2, self.max_delay) if crashed_early else 1
+            worker.retry_at = now + (worker.restart_delay if crashed_early else 0)
+            print(f'{worker.name}:Worker:exited ({worker.process.exitcode if worker.process is not None else None}), restarting in {worker.retry_at - now:.0f}s')
+        if now < worker.retry_at: return
+
+        try:
+            worker.stop()
+            worker.restarts += 1
+            worker.start()
+        except Exception as e:
+            worker.last_error = repr(e)
+            print(f'{worker.name}:Worker:restart failed:', e) # the failed start counts as an early crash on the next check
+
+
+
+# Strategy worker processes (used when TRADER_PROCESSES is set)
+WORKERS = WorkerSupervisor()